@@ -1,85 +1,40 @@
 # baseline_flow.py
-from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+from typing import List, Optional, Sequence
 import datetime as dt
 import re
+import sys
+import time
 
 # tracker integration (saves goal once cadence is chosen)
-from tracker import set_goal as tracker_set_goal
+from tracker import set_goal as tracker_set_goal, today as tracker_today
+from storage import UserMap
+from content_store import CONTENT
+import pillars
 
 # ---------- Domain ----------
-PILLARS = [
-    {"key": "environment", "label": "Environment & Structure"},
-    {"key": "nutrition",   "label": "Nutrition & Gut Health"},
-    {"key": "sleep",       "label": "Sleep"},
-    {"key": "movement",    "label": "Exercise & Movement"},
-    {"key": "stress",      "label": "Stress Management"},
-    {"key": "thoughts",    "label": "Thought Patterns"},
-    {"key": "emotions",    "label": "Emotional Regulation"},
-    {"key": "social",      "label": "Social Connection"},
-]
-LABEL_BY_KEY = {p["key"]: p["label"] for p in PILLARS}
-KEY_BY_LABEL = {p["label"].lower(): p["key"] for p in PILLARS}
-ALL_LABELS_LOWER = [p["label"].lower() for p in PILLARS]
-
-# One-line descriptions used during scoring
-PILLAR_DESC: Dict[str, str] = {
-    "environment": "Your routines, cues, and setup that make healthy choices easier.",
-    "nutrition":   "Regular meals/snacks and choices that support energy, mood, and gut health.",
-    "sleep":       "Quantity, quality, and regularity of sleep + wind-down routine.",
-    "movement":    "Everyday movement/exercise that fits your life and supports fitness.",
-    "stress":      "How you recognise stress and use strategies to reduce/cope.",
-    "thoughts":    "Mindset and self-talk patterns that shape motivation and resilience.",
-    "emotions":    "Ability to pause, notice, and regulate emotions (incl. around food).",
-    "social":      "Support, connection, and belonging with people/communities.",
-}
-
-# Concrete suggestions per pillar (user can pick one or write their own)
-PILLAR_SUGGESTIONS: Dict[str, List[str]] = {
-    "environment": [
-        "create a 2-minute start ritual (clear desk, fill water, set a 25-min timer)",
-        "place visible cues (fruit bowl, shoes by door, vitamins on breakfast table)",
-        "do night-before prep (lay out gym clothes, pack lunch, schedule tomorrow’s walk)"
-    ],
-    "nutrition": [
-        "anchor 3 meal times (e.g., 8am, 1pm, 7pm) for the next 7 days",
-        "add 1 portion of vegetables to lunch daily this week",
-        "carry a planned snack (protein + fiber) for the afternoon dip"
-    ],
-    "sleep": [
-        "avoid screens and dim lights for 30 minutes before bed",
-        "keep wake time within ±30 minutes every day for 7 days",
-        "set a caffeine cutoff 8 hours before bedtime"
-    ],
-    "movement": [
-        "walk 10 minutes after lunch on Mon/Wed/Fri this week",
-        "do 1 ‘movement snack’ (stairs or 20 squats) every afternoon",
-        "stretch 5 minutes after dinner, 4x/week"
-    ],
-    "stress": [
-        "practice 2 minutes of 4-in / 6-out breathing mid-day",
-        "do an evening brain dump: list tomorrow’s top 3 before bed",
-        "schedule a 10-minute recovery block (walk, stretch, music) on busy days"
-    ],
-    "thoughts": [
-        "daily reframe: write one unhelpful thought → a balanced alternative",
-        "end-of-day note: one thing that went right",
-        "use ‘yet’ language: add ‘…yet’ to any “I can’t” thought"
-    ],
-    "emotions": [
-        "evening ‘pause before snacking’: water + 3 breaths + choose a planned snack",
-        "name it to tame it: label one emotion when it shows up",
-        "list two non-food soothers (short walk, shower, stretch) and try one nightly"
-    ],
-    "social": [
-        "send one short check-in message today",
-        "book a 10-minute call/walk with someone this week",
-        "join/re-join one group activity this month (class, club, faith/community)"
-    ],
-}
-
-def lowest_two(ratings: Dict[str, int]) -> List[str]:
-    return [k for k,_ in sorted(ratings.items(), key=lambda kv: kv[1])[:2]]
+# Pillars, in rating order, are pillars.KEYS; the session stores pillar IDs.
+ALL_LABELS_LOWER = [label.lower() for label in pillars.LABELS]
+
+# One-line descriptions used during scoring and concrete suggestions per pillar
+# (user can pick one or write their own): content/baseline.json, aligned by ID in
+# pillars.texts(). The old module-level names read the live content on access.
+def __getattr__(name: str):
+    if name in ("PILLAR_DESC", "PILLAR_SUGGESTIONS"):
+        return CONTENT.current.data["baseline"][name.lower()]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def lowest_two(ratings: Sequence[int]) -> List[int]:
+    """IDs of the two lowest ratings, earlier pillar first on a tie; 0 (unrated) is skipped."""
+    first = second = -1
+    for pid, r in enumerate(ratings):
+        if not r:
+            continue
+        if first < 0 or r < ratings[first]:
+            first, second = pid, first
+        elif second < 0 or r < ratings[second]:
+            second = pid
+    return [p for p in (first, second) if p >= 0]
 
 def clamp(n: int, lo=1, hi=10) -> int:
     return max(lo, min(hi, n))
@@ -91,22 +46,81 @@ def validate_goal(text: str) -> bool:
     return small and has_verb and has_when
 
 # ---------- State machine ----------
-WHY, INTRO, RATING, SUMMARY, PARETO, ADVICE, GOAL, CHECKINS, CONFIRM = range(9)
+IDLE, WHY, INTRO, RATING, SUMMARY, PARETO, ADVICE, GOAL, CHECKINS, CONFIRM = range(10)
 
-@dataclass
 class Session:
-    user_id: str
-    phase: Optional[int] = None
-    pillar_index: int = 0
-    ratings: Dict[str, int] = field(default_factory=dict)
-    lowest: List[str] = field(default_factory=list)
-    pareto_focus: Optional[str] = None
-    draft_goal: Optional[str] = None
-    checkin_cadence: Optional[str] = None
-    started_at: Optional[str] = None
-    concern: Optional[str] = None
-
-SESSIONS: Dict[str, Session] = {}
+    """
+    One user's baseline. Kept for everyone who ever typed "baseline", so it is small:
+    ratings are one byte per pillar (indexed by pillar ID, 0 = not rated yet), the phase
+    and pillar IDs are small ints, started_at is epoch seconds and the concern is
+    interned (most users give one of a handful). Pickles as a plain tuple.
+    """
+    __slots__ = ("user_id", "phase", "pillar_index", "ratings", "pareto_focus",
+                 "draft_goal", "checkin_cadence", "started_at", "concern")
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.phase = IDLE
+        self.pillar_index = 0
+        self.ratings = bytearray(pillars.COUNT)
+        self.pareto_focus: Optional[int] = None     # pillar ID
+        self.draft_goal: Optional[str] = None
+        self.checkin_cadence: Optional[str] = None
+        self.started_at = 0
+        self.concern: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.phase != IDLE
+
+    @property
+    def lowest(self) -> List[int]:
+        return lowest_two(self.ratings)
+
+    def restart(self, now: Optional[float] = None) -> None:
+        self.phase = WHY
+        self.pillar_index = 0
+        self.ratings = bytearray(pillars.COUNT)
+        self.concern = None
+        if now is not None:
+            self.started_at = int(now)
+
+    def set_concern(self, text: str) -> None:
+        self.concern = sys.intern(text)
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple) and len(state) == 2 and isinstance(state[1], dict):
+            state = state[1]                  # slots pickled by the default protocol
+        if isinstance(state, dict):
+            state = _from_dataclass(state)    # sessions saved before __slots__
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def __repr__(self) -> str:
+        return (f"Session({self.user_id!r}, phase={self.phase}, ratings={list(self.ratings)}, "
+                f"focus={self.pareto_focus}, concern={self.concern!r})")
+
+def _from_dataclass(d: dict) -> tuple:
+    """Slot values for a session pickled as the old dataclass (phase None = idle, keys or IDs)."""
+    ratings = bytearray(pillars.COUNT)
+    for k, v in (d.get("ratings") or {}).items():
+        ratings[pillars.pillar_id(k)] = v
+    phase = d.get("phase")
+    focus = d.get("pareto_focus")
+    started = d.get("started_at")
+    try:
+        started = int(dt.datetime.fromisoformat(started).timestamp()) if started else 0
+    except (TypeError, ValueError):
+        started = 0
+    concern = d.get("concern")
+    return (d.get("user_id"), IDLE if phase is None else phase + 1, d.get("pillar_index", 0), ratings,
+            None if focus is None else pillars.pillar_id(focus), d.get("draft_goal"),
+            d.get("checkin_cadence"), started, None if concern is None else sys.intern(concern))
+
+SESSIONS = UserMap("baseline_session")   # { user_id: Session }
 
 def get_session(user_id: str) -> Session:
     if user_id not in SESSIONS:
@@ -119,20 +133,19 @@ def reset_session(user_id: str):
 # ---------- Helpers ----------
 def lines(*xs): return "\n".join(x for x in xs if x)
 
-def normalise_pillar_name(user_text: str) -> Optional[str]:
-    """Map user text to a pillar key using label or key (case-insensitive, partial ok)."""
+def normalise_pillar_name(user_text: str) -> Optional[int]:
+    """Map user text to a pillar ID using label or key (case-insensitive, partial ok)."""
     t = (user_text or "").strip().lower()
     # exact key
-    for p in PILLARS:
-        if t == p["key"]:
-            return p["key"]
+    if t in pillars.ID:
+        return pillars.ID[t]
     # exact label
-    if t in KEY_BY_LABEL:
-        return KEY_BY_LABEL[t]
+    if t in pillars.ID_BY_LABEL:
+        return pillars.ID_BY_LABEL[t]
     # partial label
     for lbl in ALL_LABELS_LOWER:
         if lbl in t:
-            return KEY_BY_LABEL[lbl]
+            return pillars.ID_BY_LABEL[lbl]
     return None
 
 # ---------- Prompts ----------
@@ -151,22 +164,21 @@ def why_followup_and_intro() -> str:
     )
 
 def rating_prompt(sess: Session) -> str:
-    p = PILLARS[sess.pillar_index]
-    desc = PILLAR_DESC[p["key"]]
+    pid = sess.pillar_index
+    desc = pillars.texts().descriptions[pid]
     return lines(
-        f"**{p['label']}** — {desc}",
+        f"**{pillars.LABELS[pid]}** — {desc}",
         "How would you rate this right now? (1–10)"
     )
 
 def summary_prompt(sess: Session) -> str:
     out = ["Here’s your snapshot:"]
-    for p in PILLARS:
-        out.append(f"• {p['label']}: {sess.ratings.get(p['key'], '—')}")
-    sess.lowest = lowest_two(sess.ratings)
+    for pid, label in enumerate(pillars.LABELS):
+        out.append(f"• {label}: {sess.ratings[pid] or '—'}")
     l1, l2 = sess.lowest
     out += [
         "",
-        f"Your two lowest: **{LABEL_BY_KEY[l1]}** and **{LABEL_BY_KEY[l2]}**.",
+        f"Your two lowest: **{pillars.LABELS[l1]}** and **{pillars.LABELS[l2]}**.",
         "Type the one to **focus** first, or type **both** to choose between them."
     ]
     return "\n".join(out)
@@ -175,13 +187,13 @@ def pareto_prompt(sess: Session) -> str:
     l1, l2 = sess.lowest
     return lines(
         "Which one would create the **biggest ripple effect** if we improved it first?",
-        f"Options: **{LABEL_BY_KEY[l1]}** or **{LABEL_BY_KEY[l2]}**.",
+        f"Options: **{pillars.LABELS[l1]}** or **{pillars.LABELS[l2]}**.",
         "Reply with the pillar name."
     )
 
-def advice_prompt(pillar_key: str) -> str:
-    label = LABEL_BY_KEY[pillar_key]
-    tips = PILLAR_SUGGESTIONS[pillar_key]
+def advice_prompt(pid: int) -> str:
+    label = pillars.LABELS[pid]
+    tips = pillars.texts().suggestions[pid]
     bullets = "\n".join([f"{i+1}. {t}" for i, t in enumerate(tips)])
     return lines(
         f"Great — we’ll start with **{label}**.",
@@ -192,7 +204,7 @@ def advice_prompt(pillar_key: str) -> str:
     )
 
 def goal_scaffold(sess: Session) -> str:
-    label = LABEL_BY_KEY[sess.pareto_focus]
+    label = pillars.LABELS[sess.pareto_focus]
     return lines(
         f"Let’s shape that into a SMARTS goal for **{label}**.",
         "Use: *I will [action] on [days/time] for [duration].*",
@@ -203,11 +215,15 @@ def goal_scaffold(sess: Session) -> str:
 def checkin_prompt() -> str:
     return "How often should I check in? **daily**, **3x/week**, or **weekly**."
 
+def goal_start() -> dt.date:
+    """A goal set in the baseline starts tomorrow, on the tracker's (UTC) calendar."""
+    return tracker_today() + dt.timedelta(days=1)
+
 def confirm_prompt(sess: Session) -> str:
-    start = (dt.date.today() + dt.timedelta(days=1)).isoformat()
+    start = goal_start().isoformat()
     return lines(
         "Perfect. Here’s our plan:",
-        f"• Focus pillar: **{LABEL_BY_KEY[sess.pareto_focus]}**",
+        f"• Focus pillar: **{pillars.LABELS[sess.pareto_focus]}**",
         f"• Goal: “{sess.draft_goal}”",
         f"• Check-ins: **{sess.checkin_cadence}**",
         f"• Start: **{start}**",
@@ -227,11 +243,7 @@ def handle_baseline(user_id: str, text: str):
     # Start/reset/cancel
     if t.lower() in {"baseline", "start baseline"}:
         sess = get_session(user_id)
-        sess.phase = WHY
-        sess.pillar_index = 0
-        sess.ratings = {}
-        sess.concern = None
-        sess.started_at = dt.datetime.now().isoformat()
+        sess.restart(time.time())
         return {"reply": why_prompt_first()}
 
     if t.lower() == "reset baseline":
@@ -239,7 +251,7 @@ def handle_baseline(user_id: str, text: str):
         return {"reply": "Baseline reset. Type **baseline** to start again."}
 
     sess = get_session(user_id)
-    if sess.phase is None:
+    if not sess.active:
         return None
 
     if t.lower() in {"cancel", "exit"}:
@@ -249,7 +261,7 @@ def handle_baseline(user_id: str, text: str):
     # WHY
     if sess.phase == WHY:
         if sess.concern is None:
-            sess.concern = t
+            sess.set_concern(t)
             sess.phase = INTRO
             return {"reply": why_followup_and_intro()}
         else:
@@ -268,10 +280,9 @@ def handle_baseline(user_id: str, text: str):
     if sess.phase == RATING:
         if t.isdigit():
             score = clamp(int(t))
-            p = PILLARS[sess.pillar_index]
-            sess.ratings[p["key"]] = score
+            sess.ratings[sess.pillar_index] = score
             sess.pillar_index += 1
-            if sess.pillar_index < len(PILLARS):
+            if sess.pillar_index < pillars.COUNT:
                 return {"reply": rating_prompt(sess)}
             sess.phase = SUMMARY
             return {"reply": summary_prompt(sess)}
@@ -283,7 +294,7 @@ def handle_baseline(user_id: str, text: str):
             sess.phase = PARETO
             return {"reply": pareto_prompt(sess)}
         chosen = normalise_pillar_name(t)
-        if chosen:
+        if chosen is not None:
             sess.pareto_focus = chosen
             sess.phase = ADVICE
             return {"reply": advice_prompt(sess.pareto_focus)}
@@ -292,7 +303,7 @@ def handle_baseline(user_id: str, text: str):
     # PARETO
     if sess.phase == PARETO:
         chosen = normalise_pillar_name(t)
-        if chosen and chosen in sess.lowest:
+        if chosen is not None and chosen in sess.lowest:
             sess.pareto_focus = chosen
             sess.phase = ADVICE
             return {"reply": advice_prompt(sess.pareto_focus)}
@@ -303,7 +314,7 @@ def handle_baseline(user_id: str, text: str):
         # Accept numeric choice or custom SMARTS goal
         if t.strip().isdigit():
             idx = int(t.strip()) - 1
-            tips = PILLAR_SUGGESTIONS[sess.pareto_focus]
+            tips = pillars.texts().suggestions[sess.pareto_focus]
             if 0 <= idx < len(tips):
                 suggestion = tips[idx]
                 # Nudge into SMARTS phrasing
@@ -343,7 +354,7 @@ def handle_baseline(user_id: str, text: str):
                 text=sess.draft_goal,
                 pillar_key=sess.pareto_focus,
                 cadence=sess.checkin_cadence,
-                start=dt.date.today() + dt.timedelta(days=1)
+                start=goal_start()
             )
             sess.phase = CONFIRM
             return {"reply": confirm_prompt(sess)}
@@ -352,10 +363,7 @@ def handle_baseline(user_id: str, text: str):
     # CONFIRM
     if sess.phase == CONFIRM:
         if t.lower() in {"baseline","start baseline"}:
-            sess.phase = WHY
-            sess.pillar_index = 0
-            sess.ratings = {}
-            sess.concern = None
+            sess.restart()
             return {"reply": why_prompt_first()}
         return None
 
@@ -0,0 +1,1161 @@
+# bench.py
+"""
+Benchmarks and stress checks for the request path.
+
+    python bench.py stress [--users 200] [--threads 32]
+    python bench.py webhook [--messages 2000] [--send-ms 50] [--retry-rate 0.1] [--mode inline]
+    python bench.py fallback [--turns 2000] [--upstream-ms 20] [--distinct 0] [--threads 1]
+    python bench.py resilience [--turns 60] [--budget 0.3]
+    python bench.py stream [--requests 20] [--upstream-ms 300] [--token-ms 15]
+    python bench.py context [--turns 40] [--users 2000]
+    python bench.py e2e [--requests 400] [--concurrency 32] [--latency-ms 300] [--backend stub]
+    python bench.py tracker
+    python bench.py cohort [--users 1000000] [--sample 20000]
+    python bench.py reminders [--users 20000] [--days 14]
+    python bench.py store [--procs 4] [--users 20] [--turns 300]
+    python bench.py playbook [--calls 20000]
+    python bench.py content [--reloads 50] [--readers 8]
+    python bench.py memory [--sessions 1000000]
+    python bench.py goals
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from llm_backends import DeterministicBackend
+
+# Nothing here may reach the real API: unless told otherwise the fallback uses the
+# in-process stand-in (subcommands swap in their own with set_llm).
+os.environ.setdefault("LLM_BACKEND", "deterministic")
+
+
+def stress(users: int = 200, threads: int = 32, seed: int = 7) -> bool:
+    """
+    Fire baseline conversations for many users at route_message concurrently. Every
+    rating message is sent twice at once (a WhatsApp double-send), so each user must
+    end with all 8 ratings applied (in whatever order the pool ran them) and a
+    pillar_index that agrees with them.
+    """
+    import baseline_flow
+    import pillars
+    import smartie_flask_backend_debug_verbose as backend
+
+    # Switch threads as often as possible so unsynchronised read-modify-write on a
+    # session would actually interleave.
+    sys.setswitchinterval(1e-6)
+    rng = random.Random(seed)
+    plans = {f"stress:{i}": [rng.randint(1, 10) for _ in range(4)] for i in range(users)}
+    for uid in plans:
+        for msg in ("hi", "baseline", "my energy", "start"):
+            backend.route_message(uid, msg)
+
+    errors = []
+
+    def send(uid: str, msg: str):
+        try:
+            backend.route_message(uid, msg)
+        except Exception as e:   # a crash is a consistency failure too
+            errors.append(f"{uid}: {type(e).__name__}: {e}")
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for step in range(4):
+            for uid, scores in plans.items():
+                pool.submit(send, uid, str(scores[step]))
+                pool.submit(send, uid, str(scores[step]))   # duplicate delivery
+        pool.shutdown(wait=True)
+    elapsed = time.perf_counter() - t0
+
+    bad = 0
+    for uid, scores in plans.items():
+        sess = baseline_flow.SESSIONS.get(uid)
+        expected = [s for s in scores for _ in (0, 1)]
+        got = list(sess.ratings) if sess else None
+        ok = (
+            sess is not None
+            and sess.pillar_index == pillars.COUNT
+            and sess.phase == baseline_flow.SUMMARY
+            and 0 not in got
+            and sorted(got) == sorted(baseline_flow.clamp(x) for x in expected)
+        )
+        if not ok:
+            bad += 1
+            if bad <= 5:
+                print(f"inconsistent {uid}: expected {expected}, got {got}, "
+                      f"index={getattr(sess, 'pillar_index', None)}")
+    turns = users * 8
+    print(f"stress: {users} users, {turns} concurrent turns on {threads} threads "
+          f"in {elapsed:.2f}s ({turns / elapsed:.0f} turns/s); "
+          f"inconsistent users: {bad}; errors: {len(errors)}")
+    for e in errors[:5]:
+        print("  ", e)
+    return bad == 0 and not errors
+
+
+def webhook(messages: int = 2000, users: int = 200, send_ms: float = 50.0, retry_rate: float = 0.1) -> bool:
+    """
+    Post WhatsApp messages at /wa/webhook through Flask's test client and report how
+    fast the webhook acknowledges, then how long the worker pool takes to drain.
+    Outbound sends are replaced by a sleep of `send_ms` to stand in for Twilio's API.
+    A `retry_rate` share of posts is delivered twice with the same MessageSid, as Twilio
+    does on a timeout; each of those must be routed only once.
+    """
+    import metrics
+    import smartie_flask_backend_debug_verbose as backend
+
+    def fake_send(to, body):
+        time.sleep(send_ms / 1000)
+    backend.send_wa = fake_send
+    metrics.reset()
+    http = backend.app.test_client()
+
+    msgs = ["hi", "baseline", "my energy", "start", "7", "5", "progress", "history"]
+    rng = random.Random(3)
+    statuses = {}
+    retries = 0
+    t0 = time.perf_counter()
+    for i in range(messages):
+        form = {"From": f"whatsapp:+4477{i % users:08d}", "Body": msgs[(i // users) % len(msgs)],
+                "MessageSid": f"SM{i:032d}"}
+        deliveries = 1
+        if rng.random() < retry_rate:
+            deliveries, retries = 2, retries + 1
+        for _ in range(deliveries):
+            status = http.post("/wa/webhook", data=form).status_code
+            statuses[status] = statuses.get(status, 0) + 1
+    acked = time.perf_counter() - t0
+    drained = backend.WA_POOL.drain(timeout=300)
+    total = time.perf_counter() - t0
+
+    snap = metrics.snapshot()
+    ack = snap["timings"].get("wa.ack", {})
+    wait = snap["timings"].get("wa.queue_wait", {})
+    print(f"webhook: {messages} posts from {users} users acked in {acked:.2f}s "
+          f"(ack p50 {ack.get('p50_ms')}ms, p99 {ack.get('p99_ms')}ms); statuses {statuses}")
+    print(f"workers: drained in {total:.2f}s; queue wait p50 {wait.get('p50_ms')}ms, "
+          f"p99 {wait.get('p99_ms')}ms; pool {snap['gauges']['wa.pool']}")
+    print(f"counters: {snap['counters']} ({retries} retried deliveries)")
+    counters = snap["counters"]
+    ok = drained and not counters.get("wa.failed")
+    if counters.get("wa.enqueued", 0) + counters.get("wa.rejected", 0) != messages:
+        print(f"FAIL: {retries} retried messages were not all absorbed as duplicates")
+        ok = False
+
+    # a SID is remembered for a fixed window from its first delivery: retries and the
+    # recorded response don't extend it
+    from expiring import ExpiringDict
+    clock = [0.0]
+    seen = ExpiringDict(ttl=10, sliding=backend.WA_SEEN.sliding, clock=lambda: clock[0])
+    seen.add("SM1", backend.WA_IN_FLIGHT)
+    for t in (4, 8):
+        clock[0] = t
+        seen.add("SM1", backend.WA_IN_FLIGHT)    # a retry
+        seen["SM1"] = backend.WA_ACCEPTED        # response recorded
+    clock[0] = 11
+    fixed = seen.add("SM1", backend.WA_IN_FLIGHT)   # past the window: a new delivery
+    print(f"dedupe window fixed from the first delivery: {fixed}")
+    ok = ok and fixed
+
+    # a post that fails before its turn is queued must not leave the SID claimed
+    submit = backend.WA_POOL.submit
+    def broken(*args):
+        raise RuntimeError("queue unavailable")
+    backend.WA_POOL.submit = broken
+    form = {"From": "whatsapp:+447700000001", "Body": "hi", "MessageSid": "SMfailed"}
+    first = http.post("/wa/webhook", data=form).status_code
+    backend.WA_POOL.submit = submit
+    retry = http.post("/wa/webhook", data=form).status_code
+    backend.WA_POOL.drain(timeout=30)
+    requeued = metrics.snapshot()["counters"].get("wa.enqueued", 0) - counters.get("wa.enqueued", 0)
+    print(f"failed post: {first}, Twilio's retry: {retry}, queued on retry: {requeued == 1}")
+    return ok and first == 500 and retry == 204 and requeued == 1
+
+
+FALLBACK_LINES = [
+    "I feel rubbish today", "i feel rubbish today!", "what should I do", "What should I do?",
+    "I'm so tired", "im so tired", "no idea where to start", "I keep failing", "feeling meh",
+    "can't be bothered", "I had a bad week", "everything is too much",
+]
+
+def fallback(turns: int = 2000, upstream_ms: float = 20.0, distinct: int = 0, threads: int = 1) -> bool:
+    """
+    Drive free-text turns into the OpenAI fallback with a simulated upstream and
+    report the cache hit rate, upstream calls and per-turn latency.
+    `distinct` adds that many one-off messages to the mix (cache misses by design);
+    `threads` > 1 sends them concurrently, like a campaign burst, so identical
+    misses are coalesced into one upstream call.
+    """
+    import metrics
+    import smartie_flask_backend_debug_verbose as backend
+
+    fake = DeterministicBackend(upstream_ms)
+    backend.set_llm(fake)
+    backend.FALLBACK_CACHE.clear()
+    rng = random.Random(11)
+    lines = FALLBACK_LINES + [f"blah blah {i}" for i in range(distinct)]
+    msgs = [rng.choice(lines) for _ in range(turns)]
+    lat = metrics.Timing()
+
+    def turn(i: int):
+        t0 = time.perf_counter()
+        backend.route_message(f"fb:{i}", msgs[i])
+        lat.add(time.perf_counter() - t0)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(turn, range(turns)))
+    s = lat.summary()
+    print(f"fallback: {turns} turns, upstream {upstream_ms}ms, {fake.calls} upstream calls; "
+          f"turn mean {s['mean_ms']}ms p50 {s['p50_ms']}ms p99 {s['p99_ms']}ms")
+    print(f"cache: {backend.FALLBACK_CACHE.stats()}")
+
+    # lookups from many threads at once are all counted
+    cache = backend.FALLBACK_CACHE
+    before = cache.stats()
+    keys = [cache.key(line, "") for line in FALLBACK_LINES]
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(lambda i: [cache.get(keys[(i + j) % len(keys)]) for j in range(500)], range(64)))
+    after = cache.stats()
+    counted = (after["hits"] + after["misses"]) - (before["hits"] + before["misses"])
+    print(f"concurrent lookups counted: {counted}/{64 * 500}")
+    return fake.calls < turns and counted == 64 * 500
+
+
+def resilience(turns: int = 60, upstream_ms: float = 20.0, budget_s: float = 0.3) -> bool:
+    """
+    Healthy -> outage -> recovery against a simulated upstream with a short LLM budget.
+    During the outage no turn may take much longer than the budget, every turn still
+    gets a reply, and once the breaker opens turns stop reaching the upstream. Then a
+    backlog of WhatsApp turns must drain within about one turn budget.
+    """
+    import metrics
+    import smartie_flask_backend_debug_verbose as backend
+
+    fake = DeterministicBackend(upstream_ms)
+    backend.set_llm(fake)
+    backend.LLM_BUDGET = budget_s
+    backend.LLM_BREAKER.reset_timeout = 1.0
+    backend.FALLBACK_CACHE.clear()
+    metrics.reset()
+    ok = True
+
+    def phase(name: str, down: bool):
+        nonlocal ok
+        fake.hang_rate = 1.0 if down else 0.0
+        calls0, lat = fake.calls, metrics.Timing()
+        for i in range(turns):
+            t0 = time.perf_counter()
+            # unique text per turn so the cache cannot hide the upstream
+            reply = backend.route_message(f"rs:{name}:{i}", f"blah blah {name} {i}")["reply"]
+            lat.add(time.perf_counter() - t0)
+            ok = ok and bool(reply)
+        s = lat.summary()
+        print(f"{name:>9}: {turns} turns, {fake.calls - calls0} upstream calls, "
+              f"turn p50 {s['p50_ms']}ms max {s['max_ms']}ms; breaker {backend.LLM_BREAKER.state}")
+        if s["max_ms"] > budget_s * 1000 * 1.5:
+            print(f"FAIL: a turn overran the {budget_s}s budget")
+            ok = False
+
+    phase("healthy", False)
+    phase("outage", True)
+    time.sleep(backend.LLM_BREAKER.reset_timeout)
+    phase("recovery", False)
+    print(f"counters: {metrics.snapshot()['counters']}")
+    ok = ok and backend.LLM_BREAKER.state == "closed"
+
+    # streamed fallbacks settle the breaker on every exit: a client that disconnects
+    # during the half-open trial must not leave it stuck, and a stream that runs past
+    # the budget counts as a failure
+    fake.latency, fake.token_delay = 0.0, budget_s / 4
+    for _ in range(backend.LLM_BREAKER.failure_threshold):
+        backend.LLM_BREAKER.record_failure()
+    time.sleep(backend.LLM_BREAKER.reset_timeout)
+    backend.FALLBACK_CACHE.clear()
+    chunks = backend.route_message("rs:stream:0", "blah blah disconnect", stream=True)["stream"]
+    next(chunks)
+    chunks.close()                                  # the SSE client went away mid-trial
+    freed = backend.LLM_BREAKER.allow()             # the next trial may go ahead
+    backend.LLM_BREAKER.record_success()
+    failures0 = backend.LLM_BREAKER._failures
+    "".join(backend.route_message("rs:stream:1", "blah blah " * 40, stream=True)["stream"])
+    slow_counted = backend.LLM_BREAKER._failures == failures0 + 1
+    backend.LLM_BREAKER.record_success()
+    fake.token_delay = 0.0
+    print(f"   stream: trial freed after a disconnect: {freed}, overrun counted: {slow_counted}")
+    ok = ok and freed and slow_counted
+
+    # an error the retry policy doesn't know (a 4xx, a malformed response) still
+    # ends in the canned reply rather than a 500
+    complete = fake.complete
+    def bad_request(*args, **kwargs):
+        raise ValueError("400 bad request")
+    fake.complete = bad_request
+    try:
+        reply = backend.route_message("rs:error", "blah blah bad request")["reply"]
+    except Exception as e:
+        reply = f"raised {type(e).__name__}"
+    fake.complete = complete
+    answered = backend.EITY20_REMINDER in reply
+    print(f"    error: a non-retryable upstream error got the canned reply: {answered}")
+    ok = ok and answered
+
+    # a backlog on one WhatsApp worker: turns that all arrived at once, each needing the
+    # LLM, must be answered within about one turn budget, not one LLM call per turn
+    fake.latency, fake.hang_rate = budget_s * 0.6, 0.0
+    backend.WA_TURN_BUDGET = budget_s
+    replies = []
+    send = backend.send_wa
+    backend.send_wa = lambda to, body: replies.append(body)
+    late0 = metrics.snapshot()["counters"].get("llm.late", 0)
+    t0 = time.monotonic()
+    for i in range(turns):
+        backend.process_wa(f"+4470{i:08d}", f"blah blah backlog {i}", t0)
+    spent = time.monotonic() - t0
+    backend.send_wa = send
+    late = metrics.snapshot()["counters"].get("llm.late", 0) - late0
+    print(f"  backlog: {turns} queued turns answered in {spent:.2f}s "
+          f"({late} past the turn budget got the canned reply)")
+    return ok and len(replies) == turns and all(replies) and spent < budget_s * 2 and late > 0
+
+
+def stream(requests: int = 20, upstream_ms: float = 300.0, token_ms: float = 15.0) -> bool:
+    """
+    Compare time-to-first-token on /smartie/stream with the full wait on /smartie for
+    fallback turns against a simulated streaming upstream (cache cleared each time).
+    """
+    import metrics
+    import smartie_flask_backend_debug_verbose as backend
+
+    backend.set_llm(DeterministicBackend(upstream_ms, token_ms=token_ms))
+    http = backend.app.test_client()
+    blocking, ttft, total = metrics.Timing(), metrics.Timing(), metrics.Timing()
+    ok = True
+    for i in range(requests):
+        backend.FALLBACK_CACHE.clear()
+        body = {"message": f"blah blah {i}", "user_id": f"st:{i}"}
+        t0 = time.perf_counter()
+        http.post("/smartie", json=body)
+        blocking.add(time.perf_counter() - t0)
+
+        backend.FALLBACK_CACHE.clear()
+        body["user_id"] = f"st2:{i}"
+        t0 = time.perf_counter()
+        resp = http.post("/smartie/stream", json=body, buffered=False)
+        first, events = None, []
+        for raw in resp.response:
+            if first is None:
+                first = time.perf_counter() - t0
+            events.append(raw if isinstance(raw, str) else raw.decode())
+        total.add(time.perf_counter() - t0)
+        ttft.add(first or 0.0)
+        ok = ok and events[-1].startswith("event: done") and backend.EITY20_REMINDER in events[-1]
+    b, f, t = blocking.summary(), ttft.summary(), total.summary()
+    print(f"/smartie        full reply p50 {b['p50_ms']}ms")
+    print(f"/smartie/stream first token p50 {f['p50_ms']}ms, last event p50 {t['p50_ms']}ms")
+    return ok
+
+
+def context(turns: int = 40, users: int = 2000) -> bool:
+    """
+    Run a long fallback conversation and print the prompt size per call: it must level
+    off at the history budget instead of growing with the conversation. Then fill
+    conversation memory for `users` users and report the bytes kept per user.
+    """
+    import tracemalloc
+    import metrics
+    import smartie_flask_backend_debug_verbose as backend
+
+    fake = DeterministicBackend()
+    backend.set_llm(fake)
+    seen = []
+    complete = fake.complete
+    def spy(messages, **kw):
+        seen.append(sum(backend.estimate_tokens(m["content"]) for m in messages))
+        return complete(messages, **kw)
+    fake.complete = spy
+    for i in range(turns):
+        backend.route_message("ctx:1", f"blah blah follow-up question {i} about what you said before?")
+    print("prompt tokens per call:", seen[:5], "...", seen[-5:])
+    cap = backend.estimate_tokens(backend.SMARTIE_SYSTEM_PROMPT) + backend.CONVO_BUDGET + 40
+    ok = max(seen) <= cap
+    print(f"max {max(seen)} (cap {cap}); llm.prompt_tokens {metrics.snapshot()['values'].get('llm.prompt_tokens')}")
+
+    memory = backend.ConversationMemory()
+    line = "I have been feeling tired and I keep skipping breakfast, what should I do? " * 3
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for u in range(users):
+        for i in range(30):
+            memory.add_exchange(f"u{u}", f"{line} {i}", f"Try one small step. {line}")
+    per_user = (tracemalloc.get_traced_memory()[0] - before) / users
+    tracemalloc.stop()
+    print(f"conversation memory: {per_user:.0f} bytes per user after 30 exchanges ({users} users)")
+    return ok
+
+
+def e2e(requests: int = 400, concurrency: int = 32, latency_ms: float = 300.0, jitter_ms: float = 150.0,
+        fallback_share: float = 0.5, backend_kind: str = "stub") -> bool:
+    """
+    Whole request path over real HTTP on this box: a threaded server for the Flask app,
+    POST /smartie from `concurrency` clients, and the fallback answered either by the
+    HTTP stand-in through the OpenAI SDK (`stub`) or in-process (`deterministic`).
+    A `fallback_share` of messages are unique free text, so they reach the LLM.
+    """
+    import json
+    import logging
+    import urllib.request
+    from werkzeug.serving import make_server
+    import metrics
+    import smartie_flask_backend_debug_verbose as backend
+    from llm_backends import OpenAIBackend, serve_stub
+
+    fake = DeterministicBackend(latency_ms, jitter_ms, seed=5)
+    if backend_kind == "stub":
+        stub = serve_stub("127.0.0.1", 0, fake, background=True)
+        backend.set_llm(OpenAIBackend(api_key="stub", base_url=f"http://127.0.0.1:{stub.server_address[1]}/v1"))
+    else:
+        backend.set_llm(fake)
+    backend.LLM_BUDGET = max(backend.LLM_BUDGET, (latency_ms + jitter_ms) / 1000 * 2)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)   # no per-request access log
+    server = make_server("127.0.0.1", 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/smartie"
+
+    rng = random.Random(9)
+    plan = []
+    for i in range(requests):
+        free = rng.random() < fallback_share
+        plan.append(("llm" if free else "det", f"blah blah {i}" if free else rng.choice(["hi", "progress", "advice", "history"])))
+    lat = {"llm": metrics.Timing(), "det": metrics.Timing()}
+    errors = []
+
+    def post(i: int):
+        kind, msg = plan[i]
+        body = json.dumps({"message": msg, "user_id": f"e2e:{i}"}).encode()
+        req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=30) as r:
+                json.loads(r.read())
+        except Exception as e:
+            errors.append(repr(e))
+            return
+        lat[kind].add(time.perf_counter() - t0)
+
+    metrics.reset()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(post, range(requests)))
+    elapsed = time.perf_counter() - t0
+    server.shutdown()
+
+    print(f"e2e ({backend_kind}): {requests} requests, {concurrency} clients, upstream {latency_ms}±{jitter_ms}ms: "
+          f"{requests / elapsed:.1f} req/s, errors {len(errors)}")
+    for kind, t in lat.items():
+        s = t.summary()
+        print(f"  {kind}: n={s['count']} p50 {s['p50_ms']}ms p95 {s['p95_ms']}ms p99 {s['p99_ms']}ms max {s['max_ms']}ms")
+    print(f"  upstream calls {fake.calls}; canned {metrics.snapshot()['counters'].get('llm.canned', 0)}")
+    return not errors
+
+
+def _time_per_call(fn, min_time: float = 0.2) -> float:
+    """Seconds per call of fn(), averaged over enough calls to run `min_time`."""
+    n, elapsed = 1, 0.0
+    while elapsed < min_time:
+        n *= 2
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        elapsed = time.perf_counter() - t0
+    return elapsed / n
+
+
+def tracker_scaling(sizes=(10, 1_000, 100_000)) -> bool:
+    """
+    progress / history / 14-day window cost per call at 10, 1k and 100k check-ins for
+    one user: the indexed CheckIns store against the old list-of-LogEntry scans.
+    """
+    import datetime as dt
+    import tracker
+    from storage import user_turn
+
+    today = tracker.today()
+    ok = True
+    print(f"{'entries':>8} | {'summary old':>12} {'new':>9} | {'last 5 old':>11} {'new':>9} | {'14d old':>9} {'new':>9}")
+    for n in sizes:
+        uid = f"trk:{n}"
+        # every other day going back, so there are gaps and a real streak walk
+        days = [today - dt.timedelta(days=2 * i) for i in range(n)][::-1]
+        with user_turn(uid):
+            tracker.set_goal(uid, "walk 10 minutes", "movement", "daily")
+            for d in days:
+                tracker.log_done(uid, date=d)
+        old = [tracker.LogEntry(uid, d) for d in days]
+
+        def old_summary():
+            cutoff = today - dt.timedelta(days=13)
+            done = len([e for e in old if e.date >= cutoff])
+            have = {e.date for e in old}
+            streak, day = 0, today
+            while day in have:
+                streak, day = streak + 1, day - dt.timedelta(days=1)
+            return done, streak
+
+        def old_last5():
+            return sorted(old, key=lambda e: e.date, reverse=True)[:5]
+
+        def old_window():
+            cutoff = today - dt.timedelta(days=13)
+            return [e for e in old if e.date >= cutoff]
+
+        row = [
+            _time_per_call(old_summary), _time_per_call(lambda: tracker.summary(uid)),
+            _time_per_call(old_last5), _time_per_call(lambda: tracker.last_n_logs(uid, 5)),
+            _time_per_call(old_window), _time_per_call(lambda: tracker.get_logs(uid, 14)),
+        ]
+        us = [f"{x * 1e6:.1f}us" for x in row]
+        print(f"{n:>8} | {us[0]:>12} {us[1]:>9} | {us[2]:>11} {us[3]:>9} | {us[4]:>9} {us[5]:>9}")
+        ok = ok and [e.date for e in tracker.last_n_logs(uid, 5)] == [e.date for e in old_last5()]
+        ok = ok and len(tracker.get_logs(uid, 14)) == len(old_window())
+    return ok
+
+
+def cohort_report(users: int = 1_000_000, sample: int = 20_000, seed: int = 11) -> bool:
+    """
+    Cohort analytics: `sample` users written through the tracker, loaded with
+    cohort.load() and checked against each user's own tracker numbers (and timed
+    against a per-user summary() loop); then `users` synthetic users straight into
+    arrays to time the bulk report at scale.
+    """
+    import datetime as dt
+    import numpy as np
+    import cohort
+    import pillars as registry
+    import tempfile
+    import tracker
+    from storage import MemoryStore, SQLiteStore, get_store, user_turn
+
+    rng = random.Random(seed)
+    today = tracker.today()
+    pillars = ["movement", "nutrition", "sleep", "stress", "social", "environment"]
+    cadences = ["daily", "3x/week", "weekly", "most days", "when I can"]   # the last has no count
+    uids = [f"coh:{i}" for i in range(sample)]
+    for uid in uids:
+        with user_turn(uid):
+            tracker.set_goal(uid, "goal", rng.choice(pillars), rng.choice(cadences))
+            p = rng.random()
+            for back in range(60):
+                if rng.random() < p:
+                    tracker.log_done(uid, date=today - dt.timedelta(days=back))
+
+    t0 = time.perf_counter()
+    for uid in uids:
+        tracker.summary(uid)
+    per_user = time.perf_counter() - t0
+    store = get_store()
+    order = list(store._records._data) if isinstance(store, MemoryStore) else None
+    t0 = time.perf_counter()
+    c = cohort.load()
+    loaded = time.perf_counter() - t0
+    untouched = order is None or list(store._records._data) == order   # LRU order as it was
+
+    # the same users through a fresh SQLite store: one scan, nothing pulled into its cache
+    path = os.path.join(tempfile.mkdtemp(prefix="smartie-bench-"), "cohort.db")
+    writer = SQLiteStore(path)
+    for uid, rec in store.scan():
+        writer.load(uid).update(rec)
+        writer.mark_dirty(uid)
+    writer.close()
+    reader = SQLiteStore(path)
+    t0 = time.perf_counter()
+    from_db = cohort.load(reader)
+    scanned = time.perf_counter() - t0
+    untouched = untouched and reader.stats()["cached_users"] == 0
+    same = sorted(from_db.user_ids) == sorted(c.user_ids) and len(from_db.days) == len(c.days)
+    reader.close()
+    t0 = time.perf_counter()
+    r = c.report(14, today)
+    bulk = time.perf_counter() - t0
+
+    ok = True
+    for i, uid in enumerate(c.user_ids):
+        if not uid.startswith("coh:"):
+            continue
+        logs, goal = tracker._checkins(uid), tracker.get_goal(uid)
+        done, exp = logs.count_recent(today, 14), tracker._expected_count(goal, 14)
+        ok = ok and (r.done[i], r.expected[i], r.streak[i]) == (done, exp, logs.streak(today))
+        ok = ok and r.adherence[i] == (0 if exp == 0 else round(100 * min(done, exp) / exp))
+    for key, g in r.by_pillar.items():     # bincount aggregation vs a plain mask per pillar
+        mask = c.pillar_idx == registry.ID[key]
+        a = r.adherence[mask & (r.expected > 0)]
+        ok = ok and (g.users, g.scored, g.mean_adherence, g.median_adherence) == (
+            int(mask.sum()), len(a), round(float(a.mean()), 1), float(np.median(a)))
+    ok = ok and r.by_cadence["when I can"].scored == 0 and r.overall.mean_adherence <= 100
+    print(f"{sample} users via the store: summary() loop {per_user * 1e3:.0f}ms, "
+          f"load {loaded * 1e3:.0f}ms + report {bulk * 1e3:.1f}ms, matches tracker: {ok}")
+    print(f"  SQLite load {scanned * 1e3:.0f}ms, same users: {same}, no store visits: {untouched}")
+    ok = ok and same and untouched
+
+    # synthetic cohort: each user checks in on a day with their own probability
+    np_rng = np.random.default_rng(seed)
+    t0 = time.perf_counter()
+    span = 60
+    first = today.toordinal() - span + 1
+    hit = np_rng.random((users, span), dtype=np.float32) < np_rng.random((users, 1), dtype=np.float32)
+    owner, back = np.nonzero(hit)
+    offsets = np.zeros(users + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owner, minlength=users), out=offsets[1:])
+    big = cohort.Cohort(
+        [f"u{i}" for i in range(users)], cadences,
+        np_rng.integers(0, registry.COUNT, users).astype(np.int16),
+        np_rng.integers(0, len(cadences), users).astype(np.int16),
+        (first + back).astype(np.int32), offsets,
+    )
+    built = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    r = big.report(14, today)
+    bulk = time.perf_counter() - t0
+    print(f"{users} synthetic users, {len(big.days)} check-ins: arrays {built:.2f}s, report {bulk:.2f}s")
+    print(f"  overall: {r.overall}")
+    for name, g in list(r.by_pillar.items())[:2] + list(r.by_cadence.items()):
+        scored = f"adherence {g.mean_adherence:5.1f}% on track {g.on_track:.1%}" if g.scored else "not scored"
+        print(f"  {name:>10}: {scored} dropped {g.dropped:.1%}")
+    print(f"  streaks: {r.streak_histogram}")
+    ok = ok and r.overall.users == users and sum(r.streak_histogram.values()) == users
+    ok = ok and r.overall.scored == users - r.by_cadence["when I can"].users
+    ok = ok and all(g.mean_adherence <= 100 for g in r.by_cadence.values())
+    return ok
+
+
+def reminders_sim(users: int = 20_000, days: int = 14, checkin_rate: float = 0.5, seed: int = 5) -> bool:
+    """
+    Reminder scheduler on a simulated clock over a SQLite store: `days` days in hourly
+    steps, users checking in at random, and a restart (new store + scheduler) halfway.
+    Checks that no reminder goes out twice, none comes earlier than the last check-in
+    allows, and compares a due pass with a cron-style scan over every goal. Then checks
+    that users who stop answering, or went idle, stop getting nudged.
+    """
+    import datetime as dt
+    import tempfile
+    import reminders
+    import tracker
+    from storage import MemoryStore, SQLiteStore, get_store, set_store, user_turn
+
+    rng = random.Random(seed)
+    path = os.path.join(tempfile.mkdtemp(prefix="smartie-bench-"), "reminders.db")
+    set_store(SQLiteStore(path))
+    clock = [dt.datetime.combine(tracker.today(), dt.time(0), dt.timezone.utc).timestamp()]
+    start = tracker.today()
+    sent = []   # (user_id, due, sent_at)
+
+    def make():
+        sched = reminders.Scheduler(
+            send=lambda to, body: None, address=lambda uid: uid[3:] if uid.startswith("wa:") else None,
+            batch=500, rate=0, clock=lambda: clock[0])
+        send = sched.send
+        def record(to, body):
+            uid = f"wa:{to}"
+            sent.append((uid, reminders.REMINDERS[uid]["sent"], clock[0]))
+            return send(to, body)
+        sched.send = record
+        return sched
+
+    uids = [f"wa:+1555{i:07d}" for i in range(users)]
+    for uid in uids:
+        with user_turn(uid):
+            tracker.set_goal(uid, "walk", "movement", rng.choice(["daily", "3x/week", "weekly"]),
+                             start=start - dt.timedelta(days=rng.randint(0, 10)))
+            for back in range(1, 8):
+                if rng.random() < checkin_rate:
+                    tracker.log_done(uid, date=start - dt.timedelta(days=back))
+
+    sched = make()
+    t0 = time.perf_counter()
+    loaded = sched.load()
+    load_s = time.perf_counter() - t0
+    tracker.on_change(lambda uid: sched.schedule(uid))
+
+    ok = True
+    due_pass, peak = [], 0
+    for hour in range(days * 24):
+        clock[0] += 3600
+        now = dt.datetime.fromtimestamp(clock[0], dt.timezone.utc)
+        if hour == days * 12:                       # restart: fresh store object and heap
+            set_store(SQLiteStore(path))
+            sched = make()
+            sched.load()
+        for uid in rng.sample(uids, int(users * checkin_rate / 24)):
+            with user_turn(uid):
+                tracker.log_done(uid, now=now)
+        t0 = time.perf_counter()
+        n = 0
+        while True:
+            k = sched.run_due()
+            n += k
+            if not k and not (sched._heap and sched._heap[0][0] <= clock[0]):
+                break
+        due_pass.append(time.perf_counter() - t0)
+        peak = max(peak, n)
+        for uid, due, at in sent[len(sent) - n:]:
+            g, last = tracker.get_goal(uid), tracker._checkins(uid).last
+            ok = ok and due >= sched.due_after(g, last, 0.0) - 1e-6 and at >= due
+
+    pairs = [(u, d) for u, d, _ in sent]
+    dupes = len(pairs) - len(set(pairs))
+    t0 = time.perf_counter()
+    for uid in tracker.GOALS:                      # what an hourly cron would do instead
+        g = tracker.get_goal(uid)
+        sched.due_after(g, tracker._checkins(uid).last, 0.0)
+    scan = time.perf_counter() - t0
+    print(f"{users} users, {days} simulated days, restart at day {days // 2}: loaded {loaded} in {load_s:.2f}s")
+    print(f"reminders sent {len(sent)} (peak hour {peak}), duplicates {dupes}, "
+          f"stale heap entries skipped {sched.stale}")
+    print(f"due pass per hour: mean {sum(due_pass) / len(due_pass) * 1e3:.1f}ms, "
+          f"max {max(due_pass) * 1e3:.0f}ms; cron scan over every goal: {scan * 1e3:.0f}ms")
+
+    # quiet users on an in-memory store: one who never checks in gets max_unanswered nudges
+    # and then nothing (and is no longer touched), until a check-in; one idle past the TTL
+    # gets none
+    set_store(MemoryStore())
+    got = []
+    quiet = reminders.Scheduler(send=lambda to, body: got.append(to), address=lambda uid: uid,
+                                rate=0, max_unanswered=3, idle_ttl=30 * 86400.0, clock=lambda: clock[0])
+    with user_turn("silent"):
+        tracker.set_goal("silent", "walk", "movement", "daily", start=tracker.today(now))
+    with user_turn("idle"):
+        tracker.set_goal("idle", "walk", "movement", "daily", start=tracker.today(now) - dt.timedelta(days=60))
+        tracker.log_done("idle", date=tracker.today(now) - dt.timedelta(days=40))
+    quiet.load()
+    records, stamps = get_store()._records._data, []
+    for hour in range(10 * 24):
+        clock[0] += 3600
+        if hour == 8 * 24:
+            stamps.append(records["silent"][1])
+            with user_turn("silent"):
+                tracker.log_done("silent", now=dt.datetime.fromtimestamp(clock[0], dt.timezone.utc))
+            quiet.schedule("silent")
+        while quiet.run_due():
+            pass
+        if len(got) == 3 and not stamps:
+            stamps.append(records["silent"][1])
+    quiet_ok = got[:3] == ["silent"] * 3 and len(got) > 3 and "idle" not in got and stamps[0] == stamps[1]
+    print(f"quiet users: {got.count('silent')} nudges to the silent user (3 before the check-in), "
+          f"{got.count('idle')} to the idle one, untouched while stopped: {stamps[0] == stamps[1]}")
+    ok = ok and quiet_ok
+
+    paced = reminders.Scheduler(send=lambda to, body: None, address=lambda uid: uid, rate=200)
+    t0 = time.perf_counter()
+    for _ in range(100):
+        paced._pace()
+    pace_s = time.perf_counter() - t0
+    print(f"rate limit 200/s: 100 sends took {pace_s:.2f}s")
+    return ok and dupes == 0 and len(sent) > 0 and pace_s >= 0.45
+
+
+def _store_worker(path: str, k: int, users: int, turns: int, seed: int):
+    from storage import SQLiteStore, UserMap, set_store, user_turn
+    store = SQLiteStore(path, flush_interval=0.005)
+    set_store(store)
+    mine = UserMap(f"worker{k}")
+    rng = random.Random(seed + k)
+    counts: Dict[str, int] = {}
+    for _ in range(turns):
+        uid = f"u{rng.randrange(users)}"
+        with user_turn(uid):
+            mine[uid] = mine.get(uid, 0) + 1
+            time.sleep(rng.random() * 0.002)
+        counts[uid] = counts.get(uid, 0) + 1
+    store.close()
+    return counts, store.conflicts
+
+
+def shared_store(procs: int = 4, users: int = 20, turns: int = 300, seed: int = 13) -> bool:
+    """
+    Worker processes taking turns for the same few users on one SQLite file, each
+    changing its own namespace. Every change from every process must survive: a write
+    that raced another worker's is merged, not lost.
+    """
+    import multiprocessing
+    import tempfile
+    from storage import SQLiteStore
+
+    path = os.path.join(tempfile.mkdtemp(prefix="smartie-bench-"), "shared.db")
+    SQLiteStore(path).close()   # create the table before the workers race to
+    t0 = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(procs) as pool:
+        results = pool.starmap(_store_worker, [(path, k, users, turns, seed) for k in range(procs)])
+    elapsed = time.perf_counter() - t0
+    reader = SQLiteStore(path)
+    lost = 0
+    for k, (counts, _) in enumerate(results):
+        for uid, n in counts.items():
+            rec = reader.peek(uid) or {}
+            lost += n - rec.get(f"worker{k}", 0)
+    reader.close()
+    conflicts = sum(c for _, c in results)
+    print(f"{procs} processes x {turns} turns over {users} users in {elapsed:.2f}s: "
+          f"{conflicts} write conflicts merged, {lost} updates lost")
+    return lost == 0
+
+
+def playbook(calls: int = 20_000) -> bool:
+    """
+    compose_reply per call: the compiled playbook against the old per-call work
+    (rebuild the marker list and the keyword map, scan them, format the reply).
+    """
+    import smartie_playbook as pb
+    raw = pb.CONTENT.current.data["playbook"]   # what used to be module-level dicts
+    known = pb.pillars()
+
+    def old_compose(pk, user_line):
+        p = known.get(pk)
+        if not p:
+            return "Thank you for asking — what exactly would you like to know?"
+        text = pb._norm(user_line)
+        advice_markers = list(pb.ADVICE_MARKERS)                                  # rebuilt per call
+        specific_map = {k: dict(v) for k, v in raw["specific_map"].items()}           # rebuilt per call
+        if not (any(m in text for m in advice_markers) or text.endswith("?")):
+            return "\n".join([raw["tone"]["warm_ack"][0], "Pick one tiny action you can repeat this week.",
+                              raw["tone"]["reinforce_8020"][0], f"(Pillar: {p['label']})"])
+        chosen = None
+        for kw, idx in specific_map.get(pk, {}).items():
+            if kw in text:
+                chosen = idx
+                break
+        sug = p.get("suggestions") or pb.GENERIC_SUGGESTIONS
+        offer = pb.propose_smarts_goal(pk, user_line=user_line)
+        return "\n".join(["Yes — of course. Here are two tiny actions you can try:",
+                          f"• {sug[chosen or 0]}", f"• {sug[((chosen or 0) + 1) % len(sug)]}",
+                          pb.EITY20_TAGLINE, f"(Pillar: {p['label']})"]) + f"\n{offer['offer']}"
+
+    lines = ["any tips for getting to bed earlier?", "I keep waking at night, what should I do",
+             "how do i stop the afternoon craving", "ok", "need ideas to connect with a friend",
+             "general tips for stress", "start programme: morning cues"]
+    cases = [(pk, line) for pk in known if pk != "nutrition" for line in lines]
+    ok = all(old_compose(pk, line) == pb.compose_reply(pk, line) for pk, line in cases)
+    k = max(1, calls // len(cases))
+
+    def run(fn):
+        t0 = time.perf_counter()
+        for _ in range(k):
+            for pk, line in cases:
+                fn(pk, line)
+        return (time.perf_counter() - t0) / (k * len(cases))
+
+    old_s, new_s = run(old_compose), run(pb.compose_reply)
+    t0 = time.perf_counter()
+    pb.compile_playbook(pb.CONTENT.current.data["playbook"])
+    build = time.perf_counter() - t0
+    print(f"compose_reply: {old_s * 1e6:.2f}us -> {new_s * 1e6:.2f}us per call "
+          f"({old_s / new_s:.1f}x); compile per content load: {build * 1e3:.2f}ms; same replies: {ok}")
+
+    questions = ["is halloumi 80 or 20?", "protein ideas", "are berries ok", "what about pâté and crisps"]
+    food_s = _time_per_call(lambda: [pb.nutrition_foods_answer(q) for q in questions]) / len(questions)
+    print(f"nutrition_foods_answer: {food_s * 1e6:.2f}us per question "
+          f"({len(pb.book().food_index)} indexed food names)")
+    ok = ok and "20% flexibility" in pb.nutrition_foods_answer("is halloumi 80 or 20?")
+
+    # only an explicit "80 or 20?" question about a named food gets a placement answer;
+    # everyday words that are also foods ("ready", "heart", "date") must not divert
+    placed = {"is halloumi 80 or 20?": "20% flexibility", "are kidney beans 80 or 20?": "80% foundation",
+              "are ready meals 20%?": "20% flexibility", "where does kefir fit?": "80% foundation",
+              "is fish and chips 80 or 20": "20% flexibility", "is white chocolate 80 or 20?": "20% flexibility"}
+    ordinary = ["I am not ready to change my diet", "what is the best diet for a healthy heart?",
+                "diet tips for a split shift worker", "I always skip breakfast, any advice?",
+                "what date should I start my diet?", "is a whole food diet good for me?",
+                "how do I eat healthier with a chinese takeaway habit?", "any tips for sweet cravings?"]
+    bad = [q for q, want in placed.items()
+           if not pb.compose_reply("nutrition", q).startswith("Here’s where that sits") or want not in pb.compose_reply("nutrition", q)]
+    bad += [q for q in ordinary if "Here’s where that sits" in pb.compose_reply("nutrition", q)]
+    print(f"food placement: {len(placed)} placement questions, {len(ordinary)} ordinary questions, wrong: {bad or 0}")
+    return ok and not bad
+
+
+def content(reloads: int = 50, readers: int = 8) -> bool:
+    """
+    Hot reload under load: readers keep taking snapshots while the content files are
+    rewritten and reloaded. Every file carries the reload number; a reader that sees two
+    numbers in one snapshot (or in its compiled playbook) has seen a torn swap.
+    """
+    import json
+    import shutil
+    import tempfile
+
+    import smartie_playbook as pb
+    from content_store import CONTENT_DIR, ContentStore
+
+    tmp = tempfile.mkdtemp(prefix="smartie-content-")
+    try:
+        shutil.copytree(CONTENT_DIR, tmp, dirs_exist_ok=True)
+        files = {}
+        for name in ("playbook", "baseline", "coaching"):
+            with open(os.path.join(tmp, name + ".json"), encoding="utf-8") as f:
+                files[name] = json.load(f)
+        warm_ack = files["playbook"]["tone"]["warm_ack"][0]
+        desc = files["baseline"]["pillar_desc"]["sleep"]
+        outcome = files["coaching"]["pillar_outcomes"]["sleep"]
+
+        def write(n):
+            files["playbook"]["tone"]["warm_ack"][0] = f"{warm_ack} #{n}"
+            files["baseline"]["pillar_desc"]["sleep"] = f"{desc} #{n}"
+            files["coaching"]["pillar_outcomes"]["sleep"] = f"{outcome} #{n}"
+            for name, data in files.items():
+                path = os.path.join(tmp, name + ".json")
+                with open(path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(path + ".tmp", path)
+
+        def marks(snap):
+            return {
+                snap.data["playbook"]["tone"]["warm_ack"][0].rsplit("#", 1)[-1],
+                snap.data["baseline"]["pillar_desc"]["sleep"].rsplit("#", 1)[-1],
+                snap.data["coaching"]["pillar_outcomes"]["sleep"].rsplit("#", 1)[-1],
+                snap.index("playbook").pillars["sleep"].nudge_reply.split("\n")[0].rsplit("#", 1)[-1],
+            }
+
+        write(0)
+        store = ContentStore(tmp)
+        store.register("playbook", lambda data: pb.compile_playbook(data["playbook"]))
+        store.current
+        stop = threading.Event()
+        reloading = threading.Event()
+        reads, torn, during = [0] * readers, [0] * readers, [0] * readers
+        versions = set()
+
+        def reader(i):
+            while not stop.is_set():
+                busy = reloading.is_set()
+                snap = store.current
+                during[i] += busy
+                if len(marks(snap)) != 1:
+                    torn[i] += 1
+                versions.add(snap.version)
+                reads[i] += 1
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+        for t in threads:
+            t.start()
+        took = []
+        for n in range(1, reloads + 1):
+            write(n)
+            reloading.set()
+            t0 = time.perf_counter()
+            store.reload()
+            took.append(time.perf_counter() - t0)
+            reloading.clear()
+        stop.set()
+        for t in threads:
+            t.join()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    took.sort()
+    print(f"{reloads} reloads: median {took[len(took) // 2] * 1e3:.1f}ms, max {took[-1] * 1e3:.1f}ms "
+          f"(parse + compile + swap)")
+    print(f"{readers} readers: {sum(reads)} snapshots read, {len(versions)} versions seen, "
+          f"{sum(during)} of them while a reload was running, torn snapshots {sum(torn)}")
+    return sum(torn) == 0 and sum(during) > 0 and store.current.version == reloads + 1 and store.failures == 0
+
+
+def goals() -> bool:
+    """
+    Goals set in chat (pillar -> goal -> pick or type one) are saved as "most days";
+    a check-in must then show up in progress as done/expected with a real percentage.
+    """
+    import smartie_flask_backend_debug_verbose as backend
+    import tracker
+
+    expected = tracker._expected_count(tracker.Goal("", "", 0, "most days", tracker.today()), 14)
+    ok = expected > 0
+    for uid, pick in (("goals:pick", "1"), ("goals:own", "I will walk 10 minutes after lunch on weekdays")):
+        for msg in ("movement", "goal", "not sure", pick, "done"):
+            backend.route_message(uid, msg)
+        goal = tracker.get_goal(uid)
+        progress = backend.route_message(uid, "progress")["reply"]
+        want = f"1/{expected} check-ins → ~{round(100 / expected)}% adherence"
+        good = goal is not None and goal.cadence == "most days" and want in progress
+        shown = progress.splitlines()[1] if good else repr(progress)
+        print(f"{uid}: {shown}")
+        ok = ok and good
+    return ok
+
+
+@dataclass
+class _OldSession:   # baseline_flow.Session before __slots__, for `memory`
+    user_id: str
+    phase: Optional[int] = None
+    pillar_index: int = 0
+    ratings: Dict[str, int] = field(default_factory=dict)
+    lowest: List[str] = field(default_factory=list)
+    pareto_focus: Optional[str] = None
+    draft_goal: Optional[str] = None
+    checkin_cadence: Optional[str] = None
+    started_at: Optional[str] = None
+    concern: Optional[str] = None
+
+
+def memory(sessions: int = 1_000_000, seed: int = 3) -> bool:
+    """
+    Bytes per baseline session, `sessions` of them held at once (as SESSIONS does for
+    everyone who ever typed "baseline"): the slotted Session against the dataclass it
+    replaced, both mid-flow with all 8 ratings and a concern typed by the user.
+    """
+    import datetime as dt
+    import gc
+    import pickle
+    import tracemalloc
+
+    import baseline_flow
+    import pillars
+
+    rng = random.Random(seed)
+    concerns = ["weight", "sleep", "stress", "energy", "blood sugar", "ibs", "menopause", "cholesterol"]
+    plans = [(f"wa:+4477{i:08d}", [rng.randint(1, 10) for _ in range(pillars.COUNT)], rng.choice(concerns))
+             for i in range(sessions)]
+    started = dt.datetime(2026, 1, 1)
+
+    def old(uid, scores, concern):
+        s = _OldSession(user_id=uid, phase=baseline_flow.SUMMARY - 1, pillar_index=pillars.COUNT,
+                       started_at=started.isoformat(), concern=concern.encode().decode())   # fresh str, as typed
+        s.ratings = dict(zip(pillars.KEYS, scores))
+        s.lowest = [k for k, _ in sorted(s.ratings.items(), key=lambda kv: kv[1])[:2]]
+        return s
+
+    def new(uid, scores, concern):
+        s = baseline_flow.Session(uid)
+        s.restart(started.timestamp())
+        s.phase, s.pillar_index = baseline_flow.SUMMARY, pillars.COUNT
+        s.ratings[:] = bytes(scores)
+        s.set_concern(concern.encode().decode())
+        return s
+
+    def measure(make):
+        held = [None] * sessions
+        gc.collect()
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        for i, (uid, scores, concern) in enumerate(plans):
+            held[i] = make(uid, scores, concern)
+        took = time.perf_counter() - t0
+        used = tracemalloc.get_traced_memory()[0] - base
+        tracemalloc.stop()
+        pickled = sum(len(pickle.dumps(held[i], pickle.HIGHEST_PROTOCOL)) for i in range(0, sessions, 997))
+        return held, used / sessions, pickled / len(range(0, sessions, 997)), took
+
+    # user_id strings are shared by both (the store keys on them too), so they don't count here
+    old_held, old_b, old_p, old_t = measure(old)
+    sample = [(o.ratings, o.lowest) for o in old_held[:1000]]
+    del old_held
+    new_held, new_b, new_p, new_t = measure(new)
+    ok = all(list(s.ratings) == list(r.values()) and s.lowest == [pillars.ID[k] for k in low]
+             for s, (r, low) in zip(new_held, sample))
+    print(f"{sessions} sessions held: dataclass {old_b:.0f} B/session -> slots {new_b:.0f} B/session "
+          f"({old_b / new_b:.1f}x less, {(old_b - new_b) * sessions / 2**20:.0f} MiB saved)")
+    print(f"pickled per session: {old_p:.0f} B -> {new_p:.0f} B; "
+          f"build {old_t:.2f}s -> {new_t:.2f}s; same ratings/lowest: {ok}")
+    return ok and new_b < old_b
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("stress", help="concurrent turns against route_message")
+    p.add_argument("--users", type=int, default=200)
+    p.add_argument("--threads", type=int, default=32)
+    p = sub.add_parser("webhook", help="ack latency and drain time of /wa/webhook")
+    p.add_argument("--messages", type=int, default=2000)
+    p.add_argument("--users", type=int, default=200)
+    p.add_argument("--send-ms", type=float, default=50.0)
+    p.add_argument("--workers", type=int, help="WA_WORKERS for this run")
+    p.add_argument("--retry-rate", type=float, default=0.1)
+    p.add_argument("--mode", choices=["rest", "inline"], help="WA_REPLY_MODE for this run")
+    p = sub.add_parser("fallback", help="OpenAI fallback cache hit rate and latency")
+    p.add_argument("--turns", type=int, default=2000)
+    p.add_argument("--upstream-ms", type=float, default=20.0)
+    p.add_argument("--distinct", type=int, default=0)
+    p.add_argument("--threads", type=int, default=1)
+    p = sub.add_parser("resilience", help="LLM budget, retries and breaker through an outage")
+    p.add_argument("--turns", type=int, default=60)
+    p.add_argument("--upstream-ms", type=float, default=20.0)
+    p.add_argument("--budget", type=float, default=0.3, help="LLM budget in seconds")
+    p = sub.add_parser("stream", help="time to first token on /smartie/stream vs /smartie")
+    p.add_argument("--requests", type=int, default=20)
+    p.add_argument("--upstream-ms", type=float, default=300.0)
+    p.add_argument("--token-ms", type=float, default=15.0)
+    p = sub.add_parser("context", help="prompt size and memory per user of conversation memory")
+    p.add_argument("--turns", type=int, default=40)
+    p.add_argument("--users", type=int, default=2000)
+    p = sub.add_parser("e2e", help="throughput and tail latency over HTTP with a stand-in LLM")
+    p.add_argument("--requests", type=int, default=400)
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--latency-ms", type=float, default=300.0)
+    p.add_argument("--jitter-ms", type=float, default=150.0)
+    p.add_argument("--fallback-share", type=float, default=0.5)
+    p.add_argument("--backend", choices=["stub", "deterministic"], default="stub")
+    sub.add_parser("tracker", help="check-in queries at 10, 1k and 100k entries per user")
+    p = sub.add_parser("cohort", help="bulk adherence/streak report across all users")
+    p.add_argument("--users", type=int, default=1_000_000)
+    p.add_argument("--sample", type=int, default=20_000)
+    p = sub.add_parser("store", help="SQLite store shared by worker processes: no lost updates")
+    p.add_argument("--procs", type=int, default=4)
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--turns", type=int, default=300)
+    p = sub.add_parser("playbook", help="compose_reply per-call cost, compiled vs rebuilt")
+    p.add_argument("--calls", type=int, default=20_000)
+    p = sub.add_parser("content", help="content hot reload under concurrent readers")
+    p.add_argument("--reloads", type=int, default=50)
+    p.add_argument("--readers", type=int, default=8)
+    p = sub.add_parser("memory", help="bytes per baseline session at 1M sessions")
+    p.add_argument("--sessions", type=int, default=1_000_000)
+    sub.add_parser("goals", help="goal set in chat, then done and progress")
+    p = sub.add_parser("reminders", help="reminder scheduler over simulated days, with a restart")
+    p.add_argument("--users", type=int, default=20_000)
+    p.add_argument("--days", type=int, default=14)
+    args = ap.parse_args(argv)
+    if getattr(args, "workers", None):
+        os.environ["WA_WORKERS"] = str(args.workers)   # read when the backend is imported
+    if getattr(args, "mode", None):
+        os.environ["WA_REPLY_MODE"] = args.mode
+
+    if args.cmd == "stress":
+        return 0 if stress(args.users, args.threads) else 1
+    if args.cmd == "webhook":
+        return 0 if webhook(args.messages, args.users, args.send_ms, args.retry_rate) else 1
+    if args.cmd == "fallback":
+        return 0 if fallback(args.turns, args.upstream_ms, args.distinct, args.threads) else 1
+    if args.cmd == "resilience":
+        return 0 if resilience(args.turns, args.upstream_ms, args.budget) else 1
+    if args.cmd == "stream":
+        return 0 if stream(args.requests, args.upstream_ms, args.token_ms) else 1
+    if args.cmd == "context":
+        return 0 if context(args.turns, args.users) else 1
+    if args.cmd == "e2e":
+        return 0 if e2e(args.requests, args.concurrency, args.latency_ms, args.jitter_ms,
+                        args.fallback_share, args.backend) else 1
+    if args.cmd == "tracker":
+        return 0 if tracker_scaling() else 1
+    if args.cmd == "store":
+        return 0 if shared_store(args.procs, args.users, args.turns) else 1
+    if args.cmd == "cohort":
+        return 0 if cohort_report(args.users, args.sample) else 1
+    if args.cmd == "playbook":
+        return 0 if playbook(args.calls) else 1
+    if args.cmd == "content":
+        return 0 if content(args.reloads, args.readers) else 1
+    if args.cmd == "memory":
+        return 0 if memory(args.sessions) else 1
+    if args.cmd == "goals":
+        return 0 if goals() else 1
+    if args.cmd == "reminders":
+        return 0 if reminders_sim(args.users, args.days) else 1
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
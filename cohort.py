@@ -0,0 +1,225 @@
+# cohort.py
+"""
+Cohort analytics over every user's goal and check-ins, computed in bulk with NumPy.
+
+    c = cohort.load()                     # GOALS + LOGS from the configured store
+    r = c.report(days=14)                 # CohortReport
+    r.by_pillar["movement"].mean_adherence, r.streak_histogram, r.to_dict()
+
+Check-ins are held CSR-style: one int32 array of day ordinals for all users (sorted
+within each user) plus offsets, so user i owns days[offsets[i]:offsets[i+1]].
+Adherence follows tracker._expected_count (capped at 100%) and streaks follow
+tracker.summary, so the numbers for any one user match what the chat tells them.
+Goals with no expected count (a cadence tracker doesn't know) are left out of the
+adherence figures and counted under `scored` instead. pillar_idx holds the goal's
+pillar ID (pillars.py), so per-pillar totals are bincounts indexed by ID.
+"""
+import datetime as dt
+from array import array
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import pillars
+import tracker
+from storage import StateStore, get_store
+
+SWEET_SPOT = 80                                  # eity20: adherence % counted as on track
+STREAK_BINS = (0, 1, 2, 3, 5, 7, 14, 30, 60)     # lower edges of the streak histogram
+
+
+@dataclass
+class GroupStats:
+    users: int
+    scored: int            # users with an expected count; the adherence figures cover these
+    mean_adherence: float
+    median_adherence: float
+    on_track: float        # share of scored users at or above SWEET_SPOT
+    dropped: float         # share of users with no check-in in the window
+    mean_streak: float
+
+
+@dataclass
+class CohortReport:
+    as_of: dt.date
+    days: int
+    overall: GroupStats
+    by_pillar: Dict[str, GroupStats]
+    by_cadence: Dict[str, GroupStats]
+    streak_histogram: Dict[str, int]   # "0", "1", "3-4", ..., "60+" -> users
+    # per user, aligned with Cohort.user_ids
+    done: np.ndarray
+    expected: np.ndarray
+    adherence: np.ndarray
+    streak: np.ndarray
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The aggregates only, ready for json.dumps."""
+        return {
+            "as_of": self.as_of.isoformat(),
+            "days": self.days,
+            "overall": vars(self.overall),
+            "by_pillar": {k: vars(v) for k, v in self.by_pillar.items()},
+            "by_cadence": {k: vars(v) for k, v in self.by_cadence.items()},
+            "streak_histogram": self.streak_histogram,
+        }
+
+
+class Cohort:
+    def __init__(self, user_ids: List[str], cadences: List[str],
+                 pillar_idx: np.ndarray, cadence_idx: np.ndarray,
+                 days: np.ndarray, offsets: np.ndarray):
+        self.user_ids = user_ids
+        self.cadences = cadences          # code -> cadence
+        self.pillar_idx = pillar_idx      # int16 pillar ID per user
+        self.cadence_idx = cadence_idx    # int16 per user
+        self.days = days                  # int32 day ordinals, all users
+        self.offsets = offsets            # int64, len(user_ids) + 1
+        lens = np.diff(offsets)
+        self.owner = np.repeat(np.arange(len(user_ids), dtype=np.int32), lens)
+        # index where each check-in's consecutive run starts (runs never cross users)
+        brk = np.ones(len(days), dtype=bool)
+        brk[1:] = np.diff(days) != 1
+        brk[offsets[:-1][lens > 0]] = True
+        self.run_start = np.maximum.accumulate(np.where(brk, np.arange(len(days)), 0))
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple[str, "tracker.Goal", Any]]) -> "Cohort":
+        """Build from (user_id, Goal, CheckIns-or-None) triples."""
+        user_ids: List[str] = []
+        cadence_codes: Dict[str, int] = {}
+        pillar_idx, cadence_idx = array("h"), array("h")
+        days, offsets = array("i"), array("q", [0])
+        for uid, goal, logs in records:
+            user_ids.append(uid)
+            pillar_idx.append(goal.pillar)
+            cadence_idx.append(cadence_codes.setdefault(goal.cadence, len(cadence_codes)))
+            if logs is not None:
+                days.extend(_days_of(logs))
+            offsets.append(len(days))
+        return cls(user_ids, list(cadence_codes),
+                   np.frombuffer(pillar_idx, dtype=np.int16), np.frombuffer(cadence_idx, dtype=np.int16),
+                   np.frombuffer(days, dtype=np.int32), np.frombuffer(offsets, dtype=np.int64))
+
+    def expected(self, days: int) -> np.ndarray:
+        """tracker._expected_count per user, evaluated once per cadence."""
+        per_cadence = [tracker._expected_count(tracker.Goal("", "", 0, c, dt.date.min), days)
+                       for c in self.cadences]
+        return np.asarray(per_cadence, dtype=np.int32)[self.cadence_idx]
+
+    def window_counts(self, days: int, as_of: dt.date) -> np.ndarray:
+        """Check-in days per user among the `days` days ending `as_of`."""
+        t = as_of.toordinal()
+        in_window = (self.days > t - days) & (self.days <= t)
+        return np.bincount(self.owner[in_window], minlength=len(self)).astype(np.int32)
+
+    def streaks(self, as_of: dt.date) -> np.ndarray:
+        """Consecutive check-in days per user, counting back from `as_of`."""
+        t = as_of.toordinal()
+        if not len(self.days):
+            return np.zeros(len(self), dtype=np.int32)
+        upto = np.bincount(self.owner[self.days <= t], minlength=len(self))
+        pos = self.offsets[:-1] + upto - 1          # each user's last check-in on or before t
+        safe = np.maximum(pos, 0)
+        hit = (upto > 0) & (self.days[safe] == t)
+        return np.where(hit, safe - self.run_start[safe] + 1, 0).astype(np.int32)
+
+    def report(self, days: int = 14, as_of: Optional[dt.date] = None) -> CohortReport:
+        as_of = as_of or tracker.today()
+        done = self.window_counts(days, as_of)
+        expected = self.expected(days)
+        scored = expected > 0
+        ratio = np.divide(100 * done, expected, out=np.zeros(len(self)), where=scored)
+        adherence = np.round(np.minimum(ratio, 100)).astype(np.int32)   # half-to-even, like round()
+        streak = self.streaks(as_of)
+
+        everyone = np.zeros(len(self), dtype=np.int16)
+        by_pillar = _group_stats(self.pillar_idx, pillars.COUNT, scored, adherence, done, streak)
+        by_cadence = _group_stats(self.cadence_idx, len(self.cadences), scored, adherence, done, streak)
+        return CohortReport(
+            as_of=as_of,
+            days=days,
+            overall=_group_stats(everyone, 1, scored, adherence, done, streak)[0],
+            by_pillar={pillars.KEYS[i]: g for i, g in enumerate(by_pillar) if g.users},
+            by_cadence={c: g for c, g in zip(self.cadences, by_cadence) if g.users},
+            streak_histogram=_histogram(streak),
+            done=done, expected=expected, adherence=adherence, streak=streak,
+        )
+
+
+def _group_stats(group: np.ndarray, n: int, scored: np.ndarray, adherence: np.ndarray,
+                 done: np.ndarray, streak: np.ndarray) -> List[GroupStats]:
+    """
+    GroupStats for groups 0..n-1 of `group` (one code per user), from bincounts.
+    Adherence figures only count users where `scored` is set.
+    """
+    users = np.bincount(group, minlength=n)
+    safe = np.maximum(users, 1)
+
+    def mean(x, g=group, count=safe):
+        return np.bincount(g, weights=x, minlength=n) / count
+
+    mean_s, dropped = mean(streak), mean(done == 0)
+    group_s, adherence_s = group[scored], adherence[scored]
+    n_scored = np.bincount(group_s, minlength=n)
+    safe_s = np.maximum(n_scored, 1)
+    mean_a = mean(adherence_s, group_s, safe_s)
+    on_track = mean(adherence_s >= SWEET_SPOT, group_s, safe_s)
+    # medians: sort by (group, adherence), then each group's middle is at a known offset
+    ranked = adherence_s[np.lexsort((adherence_s, group_s))]
+    start = np.concatenate(([0], np.cumsum(n_scored)[:-1]))
+    lo, hi = start + (safe_s - 1) // 2, start + safe_s // 2
+    median = (ranked[np.minimum(lo, len(ranked) - 1)] + ranked[np.minimum(hi, len(ranked) - 1)]) / 2 \
+        if len(ranked) else np.zeros(n)
+    out = []
+    for i in range(n):
+        if not users[i]:
+            out.append(GroupStats(0, 0, 0.0, 0.0, 0.0, 0.0, 0.0))
+            continue
+        has = bool(n_scored[i])
+        out.append(GroupStats(
+            users=int(users[i]),
+            scored=int(n_scored[i]),
+            mean_adherence=round(float(mean_a[i]), 1),
+            median_adherence=float(median[i]) if has else 0.0,
+            on_track=round(float(on_track[i]), 4),
+            dropped=round(float(dropped[i]), 4),
+            mean_streak=round(float(mean_s[i]), 2),
+        ))
+    return out
+
+
+def _days_of(logs) -> array:
+    if isinstance(logs, tracker.CheckIns):
+        return logs.days
+    # records saved before CheckIns: [LogEntry, ...]; converted here without writing back
+    return array("i", sorted({e.date.toordinal() for e in logs}))
+
+
+def _histogram(streak: np.ndarray) -> Dict[str, int]:
+    edges = np.asarray(STREAK_BINS + (np.iinfo(np.int32).max,))
+    counts = np.histogram(streak, bins=edges)[0]
+    labels = []
+    for lo, hi in zip(STREAK_BINS, STREAK_BINS[1:] + (None,)):
+        labels.append(f"{lo}+" if hi is None else str(lo) if hi == lo + 1 else f"{lo}-{hi - 1}")
+    return dict(zip(labels, (int(c) for c in counts)))
+
+
+def load(store: Optional[StateStore] = None) -> Cohort:
+    """
+    Every user with a goal, from one store scan (a single SELECT on SQLite). The scan
+    doesn't count as a visit, so reports never keep idle users alive.
+    """
+    store = store or get_store()
+
+    def records():
+        for uid, rec in store.scan():
+            goal = rec.get(tracker.GOALS.namespace)
+            if goal is not None:
+                yield uid, goal, rec.get(tracker.LOGS.namespace)
+
+    return Cohort.from_records(records())
@@ -0,0 +1,168 @@
+# content_store.py
+"""
+Coaching content (playbook, baseline and coaching copy) loaded from JSON files in
+SMARTIE_CONTENT_DIR (default: ./content), with prebuilt indexes and hot reload.
+
+    CONTENT.register("playbook", build)   # build(data) -> index, run on every load
+    snap = CONTENT.current                # one immutable Snapshot
+    snap.data["coaching"]["pillar_outcomes"], snap.index("playbook")
+
+A reload reads every *.json file, runs every registered builder against the new
+data, and only then swaps the snapshot in with a single assignment. Readers never
+wait on a reload and never see a mix of old and new tables. If a file fails to
+parse or a builder raises, the old snapshot stays live and the error is reported in
+stats(). Builders get the data passed in and must not read CONTENT themselves.
+
+Trigger a reload with CONTENT.reload() (blocking), CONTENT.reload_async() (what
+POST /admin/content/reload does), or CONTENT.watch(interval), which polls the files'
+mtimes from a background thread.
+"""
+import json
+import os
+import threading
+import time
+import traceback
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+import metrics
+
+Builder = Callable[[Mapping[str, Any]], Any]
+
+
+def freeze(value):
+    """Read-only view of parsed JSON: dicts become MappingProxyType, lists tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: int
+    loaded_at: float
+    stamp: Tuple[Tuple[str, int, int], ...]   # (file, mtime_ns, size) it was loaded from
+    data: Mapping[str, Any]                   # file stem -> frozen JSON
+    indexes: Mapping[str, Any]                # builder name -> built index
+
+    def index(self, name: str) -> Any:
+        return self.indexes[name]
+
+
+class ContentStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._builders: Dict[str, Builder] = {}
+        self._snapshot: Optional[Snapshot] = None
+        self._lock = threading.Lock()   # serialises rebuilds; readers never take it
+        self._watch_pid: Optional[int] = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def current(self) -> Snapshot:
+        snap = self._snapshot
+        return snap if snap is not None else self._first_load()
+
+    def _first_load(self) -> Snapshot:
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self._build(None)
+            return self._snapshot
+
+    def register(self, name: str, builder: Builder) -> None:
+        """Add an index; it is built now if content is already loaded, and on every reload."""
+        with self._lock:
+            self._builders[name] = builder
+            snap = self._snapshot
+            if snap is not None:
+                indexes = MappingProxyType({**snap.indexes, name: builder(snap.data)})
+                self._snapshot = replace(snap, indexes=indexes)
+
+    # ---------- loading ----------
+    def _stamp(self) -> Tuple[Tuple[str, int, int], ...]:
+        stamp = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".json"):
+                st = os.stat(os.path.join(self.directory, name))
+                stamp.append((name, st.st_mtime_ns, st.st_size))
+        return tuple(stamp)
+
+    def _build(self, old: Optional[Snapshot]) -> Snapshot:
+        t0 = time.monotonic()
+        stamp = self._stamp()
+        data = {}
+        for name, _, _ in stamp:
+            with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                data[name[:-len(".json")]] = freeze(json.load(f))
+        data = MappingProxyType(data)
+        indexes = MappingProxyType({name: build(data) for name, build in self._builders.items()})
+        snap = Snapshot(version=old.version + 1 if old else 1, loaded_at=time.time(),
+                        stamp=stamp, data=data, indexes=indexes)
+        metrics.observe("content.reload", time.monotonic() - t0)
+        return snap
+
+    def reload(self) -> Snapshot:
+        """Rebuild everything from the files and swap it in. Keeps the old snapshot on error."""
+        with self._lock:
+            old = self._snapshot
+            try:
+                snap = self._build(old)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                metrics.incr("content.reload_failed")
+                if old is None:
+                    raise
+                traceback.print_exc()
+                return old
+            self._snapshot = snap
+            self.reloads += 1
+            self.last_error = None
+            metrics.incr("content.reloads")
+            return snap
+
+    def reload_async(self) -> None:
+        threading.Thread(target=self.reload, name="content-reload", daemon=True).start()
+
+    def changed(self) -> bool:
+        snap = self._snapshot
+        return snap is None or self._stamp() != snap.stamp
+
+    def watch(self, interval: float = 5.0) -> None:
+        """Poll the content files every `interval` seconds and reload on change (once per process)."""
+        with self._lock:
+            if self._watch_pid == os.getpid():
+                return
+            self._watch_pid = os.getpid()
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.changed():
+                        self.reload()
+                except Exception:
+                    traceback.print_exc()
+
+        threading.Thread(target=loop, name="content-watch", daemon=True).start()
+
+    def stats(self) -> Dict[str, Any]:
+        snap = self._snapshot
+        return {
+            "version": snap.version if snap else 0,
+            "loaded_at": snap.loaded_at if snap else None,
+            "files": [name for name, _, _ in snap.stamp] if snap else [],
+            "indexes": sorted(snap.indexes) if snap else [],
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+CONTENT_DIR = os.getenv("SMARTIE_CONTENT_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "content")
+CONTENT = ContentStore(CONTENT_DIR)
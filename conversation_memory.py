@@ -0,0 +1,116 @@
+# conversation_memory.py
+"""
+Bounded per-user conversation memory for the LLM fallback.
+
+Each user keeps a ring buffer of their last `max_messages` messages (user and Smartie
+lines, each clipped to `max_message_tokens`) plus a compact summary of the messages
+that fell out of the buffer, itself capped at `summary_tokens`. So memory per user is
+fixed at roughly (max_messages * max_message_tokens + summary_tokens) * 4 bytes of text.
+Users idle for `idle_ttl` seconds are dropped, and at most `max_users` are kept (LRU).
+
+`context(user_id, budget)` returns the summary and as many recent messages as fit in
+`budget` tokens, newest first, ready to put between the system prompt and the new line.
+"""
+import re
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from expiring import ExpiringDict
+
+CHARS_PER_TOKEN = 4   # rough English average; good enough for budgeting
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+
+def clip_tokens(text: str, max_tokens: int) -> str:
+    limit = max_tokens * CHARS_PER_TOKEN
+    text = (text or "").strip()
+    return text if len(text) <= limit else text[: limit - 1].rstrip() + "…"
+
+
+def _gist(text: str, words: int = 12) -> str:
+    """First sentence, at most `words` words: how an old message is kept in the summary."""
+    first = _SENTENCE_END.split(text.strip(), 1)[0]
+    parts = first.split()
+    return " ".join(parts[:words]) + ("…" if len(parts) > words else "")
+
+
+class History:
+    __slots__ = ("messages", "summary", "summary_tokens")
+
+    def __init__(self, max_messages: int):
+        self.messages: deque = deque(maxlen=max_messages)   # (role, text, tokens)
+        self.summary: deque = deque()                       # (gist, tokens), oldest first
+        self.summary_tokens = 0
+
+
+class ConversationMemory:
+    def __init__(self, max_messages: int = 12, max_message_tokens: int = 150,
+                 summary_tokens: int = 120, idle_ttl: Optional[float] = 2 * 3600,
+                 max_users: Optional[int] = 50_000):
+        self.max_messages = max_messages
+        self.max_message_tokens = max_message_tokens
+        self.summary_budget = summary_tokens
+        self._users = ExpiringDict(max_entries=max_users, ttl=idle_ttl)
+        self._lock = threading.Lock()
+
+    def add(self, user_id: str, role: str, text: str) -> None:
+        text = clip_tokens(text, self.max_message_tokens)
+        if not text:
+            return
+        with self._lock:
+            h = self._users.get(user_id)
+            if h is None:
+                h = self._users[user_id] = History(self.max_messages)
+            if len(h.messages) == h.messages.maxlen:
+                self._fold(h, *h.messages[0][:2])
+            h.messages.append((role, text, estimate_tokens(text)))
+
+    def add_exchange(self, user_id: str, user_text: str, reply: str) -> None:
+        self.add(user_id, "user", user_text)
+        self.add(user_id, "assistant", reply)
+
+    def _fold(self, h: History, role: str, text: str) -> None:
+        """Move the oldest message into the summary, dropping the oldest gists to fit."""
+        gist = f"{'User' if role == 'user' else 'You'}: {_gist(text)}"
+        tokens = estimate_tokens(gist) + 1
+        h.summary.append((gist, tokens))
+        h.summary_tokens += tokens
+        while h.summary_tokens > self.summary_budget and h.summary:
+            h.summary_tokens -= h.summary.popleft()[1]
+
+    def context(self, user_id: str, budget: int) -> Tuple[str, List[Dict[str, str]]]:
+        """(summary text, recent messages oldest-first) fitting in `budget` tokens."""
+        with self._lock:
+            h = self._users.get(user_id)
+            if h is None:
+                return "", []
+            summary = "; ".join(g for g, _ in h.summary)
+            left = budget - (h.summary_tokens if summary else 0)
+            if left < 0:
+                summary, left = "", budget
+            recent = []
+            for role, text, tokens in reversed(h.messages):
+                if tokens > left:
+                    break
+                recent.append({"role": role, "content": text})
+                left -= tokens
+        recent.reverse()
+        return summary, recent
+
+    def forget(self, user_id: str) -> None:
+        with self._lock:
+            self._users.pop(user_id)
+
+    def stats(self) -> Dict[str, int]:
+        s = self._users.stats()
+        return {
+            "users": s["size"],
+            "max_users": s["max_entries"],
+            "evictions_ttl": s["evictions_ttl"],
+            "evictions_lru": s["evictions_lru"],
+        }
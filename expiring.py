@@ -0,0 +1,177 @@
+# expiring.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional
+
+_MISSING = object()
+
+
+class ExpiringDict:
+    """
+    Bounded map with idle-TTL and LRU eviction.
+
+    - `ttl`: seconds since last access after which an entry expires (None = never). With
+      `sliding=False` it counts from when the key was first inserted instead: reads and
+      overwrites don't extend it, so an entry lives a fixed time.
+    - `max_entries`: least-recently-used entries are evicted past this size (None = unbounded).
+    - `max_weight` / `weigh(key, value)`: optional second cap, e.g. bytes; LRU entries are
+      evicted until the summed weight fits.
+    - `on_evict(key, value, reason)`: optional callback, reason is "ttl" or "lru".
+
+    Entries are kept in access order, so expired ones are always at the front and are
+    swept a few at a time on every write (no background thread). Thread-safe.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None,
+                 on_evict: Optional[Callable[[Hashable, Any, str], None]] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 max_weight: Optional[int] = None,
+                 weigh: Optional[Callable[[Hashable, Any], int]] = None,
+                 sliding: bool = True):
+        self.max_entries = max_entries
+        self.sliding = sliding
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weight = 0
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, list]" = OrderedDict()   # key -> [value, last_access]
+        self._lock = threading.RLock()
+        self.evictions_ttl = 0
+        self.evictions_lru = 0
+
+    def _expired(self, stamp: float, now: float) -> bool:
+        return self.ttl is not None and now - stamp >= self.ttl
+
+    def _weigh(self, key, value) -> int:
+        return self.weigh(key, value) if self.weigh is not None else 0
+
+    def _evict(self, key, value, reason: str) -> None:
+        self.weight -= self._weigh(key, value)
+        if reason == "ttl":
+            self.evictions_ttl += 1
+        else:
+            self.evictions_lru += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value, reason)
+
+    def sweep(self, limit: Optional[int] = None) -> int:
+        """Drop expired entries from the front (oldest first). Returns how many were dropped."""
+        if self.ttl is None:
+            return 0
+        dropped = 0
+        with self._lock:
+            now = self._clock()
+            while self._data and (limit is None or dropped < limit):
+                key, (value, stamp) = next(iter(self._data.items()))
+                if not self._expired(stamp, now):
+                    break
+                del self._data[key]
+                self._evict(key, value, "ttl")
+                dropped += 1
+        return dropped
+
+    def get(self, key, default=None, touch: bool = True):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            now = self._clock()
+            if self._expired(item[1], now):
+                del self._data[key]
+                self._evict(key, item[0], "ttl")
+                return default
+            if touch and self.sliding:
+                item[1] = now
+                self._data.move_to_end(key)
+            return item[0]
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING, touch=False) is not _MISSING
+
+    def __setitem__(self, key, value) -> None:
+        with self._lock:
+            self.sweep(limit=8)
+            item = self._data.get(key)
+            if item is None:
+                self._data[key] = [value, self._clock()]
+            else:
+                self.weight -= self._weigh(key, item[0])
+                item[0] = value
+                if self.sliding:
+                    item[1] = self._clock()
+                    self._data.move_to_end(key)
+            self.weight += self._weigh(key, value)
+            while self._data and (
+                (self.max_entries is not None and len(self._data) > self.max_entries)
+                or (self.max_weight is not None and self.weight > self.max_weight)
+            ):
+                old_key, (old_value, _) = self._data.popitem(last=False)
+                self._evict(old_key, old_value, "lru")
+
+    def setdefault(self, key, default):
+        with self._lock:
+            value = self.get(key, _MISSING)
+            if value is _MISSING:
+                self[key] = default
+                return default
+            return value
+
+    def add(self, key, value) -> bool:
+        """Insert `key` only if it is absent (or expired). Returns True if inserted."""
+        with self._lock:
+            if self.get(key, _MISSING) is not _MISSING:
+                return False
+            self[key] = value
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return default
+            self.weight -= self._weigh(key, item[0])
+            return item[0]
+
+    def __delitem__(self, key) -> None:
+        with self._lock:
+            value = self._data.pop(key)[0]
+            self.weight -= self._weigh(key, value)
+
+    def keys(self) -> Iterator[Hashable]:
+        with self._lock:
+            self.sweep()
+            return iter(list(self._data))
+
+    __iter__ = keys
+
+    def items(self) -> Iterator[tuple]:
+        """Snapshot of (key, value) pairs; does not count as an access."""
+        with self._lock:
+            self.sweep()
+            return iter([(k, item[0]) for k, item in self._data.items()])
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries or 0,
+            **({"weight": self.weight, "max_weight": self.max_weight} if self.weigh is not None else {}),
+            "evictions_ttl": self.evictions_ttl,
+            "evictions_lru": self.evictions_lru,
+        }
@@ -0,0 +1,160 @@
+# fallback_cache.py
+"""
+Response cache for the OpenAI fallback.
+
+Many unmatched messages are near-identical ("I feel rubbish today", "what should I do"),
+so the completion is cached on the normalised text plus the style directive it was sent
+with. Entries expire after a TTL and are evicted least-recently-used past an entry count
+or a byte budget. Concurrent misses for the same key share one upstream call
+(single-flight), so a campaign burst of identical replies costs one completion.
+"""
+import re
+import sys
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from expiring import ExpiringDict
+
+_PUNCT = re.compile(r"[^\w\s']+")
+_SPACES = re.compile(r"\s+")
+
+Key = Tuple[str, str]   # (style directive, normalised text)
+
+
+def normalize_prompt(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace: 'I feel rubbish today!!' == 'i feel  rubbish today'."""
+    t = _PUNCT.sub(" ", (text or "").lower())
+    return _SPACES.sub(" ", t).strip()
+
+
+def _entry_bytes(key: Key, value: str) -> int:
+    return sys.getsizeof(key[0]) + sys.getsizeof(key[1]) + sys.getsizeof(value)
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key: the first caller (the leader) runs
+    `fn`, later callers wait for its result. A follower that waits longer than
+    `timeout` raises TimeoutError rather than starting a second slow call.
+    """
+
+    def __init__(self, timeout: float = 30.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            wait = self.timeout if timeout is None else min(timeout, self.timeout)
+            if flight.done.wait(wait):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.value
+            with self._lock:
+                self.coalesced -= 1
+                self.timeouts += 1
+            raise TimeoutError(f"waited {wait:.1f}s for an in-flight call")
+        try:
+            flight.value = fn()
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._flights),
+            "flights": self.leaders,
+            "calls_saved": self.coalesced,
+            "follower_timeouts": self.timeouts,
+        }
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 5000, max_bytes: int = 8 * 1024 * 1024, ttl: Optional[float] = 6 * 3600,
+                 flight_timeout: float = 30.0):
+        self._entries = ExpiringDict(max_entries=max_entries, ttl=ttl,
+                                     max_weight=max_bytes, weigh=_entry_bytes)
+        self.flights = SingleFlight(timeout=flight_timeout)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()   # guards the counters (worker threads share the cache)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str, style: str) -> Key:
+        return (style, normalize_prompt(text))
+
+    def get(self, key: Key) -> Optional[str]:
+        value = self._entries.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: Key, value: str) -> None:
+        if value and _entry_bytes(key, value) <= self.max_bytes:
+            self._entries[key] = value
+
+    def get_or_call(self, key: Key, call: Callable[[], str], timeout: Optional[float] = None) -> str:
+        """
+        Cached value for `key`, else one shared `call()` among concurrent misses. A
+        waiter gives up after `timeout` (at most the cache's flight timeout).
+        """
+        value = self.get(key)
+        if value is None:
+            value = self.flights.do(key, lambda: self._fill(key, call), timeout)
+        return value
+
+    def _fill(self, key: Key, call: Callable[[], str]) -> str:
+        value = self._entries.get(key)   # a flight that just landed may have filled it
+        if value is None:
+            value = call()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        s = self._entries.stats()
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": s["size"],
+            "bytes": s["weight"],
+            "max_bytes": self.max_bytes,
+            "evictions_ttl": s["evictions_ttl"],
+            "evictions_lru": s["evictions_lru"],
+            "singleflight": self.flights.stats(),
+        }
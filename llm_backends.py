@@ -0,0 +1,258 @@
+# llm_backends.py
+"""
+LLM backends for the fallback reply.
+
+    OpenAIBackend        the real API (or anything that speaks it, via base_url)
+    DeterministicBackend in-process generator with configurable latency and jitter
+    stand-in server      `python llm_backends.py serve --port 8099 --latency-ms 300`
+                         mimics POST /v1/chat/completions (plain and stream=true)
+
+Pick one with LLM_BACKEND:
+
+    LLM_BACKEND=openai          (default; needs OPENAI_API_KEY, honours OPENAI_BASE_URL)
+    LLM_BACKEND=stub            OpenAI client against LLM_STUB_URL (default http://127.0.0.1:8099/v1)
+    LLM_BACKEND=deterministic   no network; LLM_FAKE_LATENCY_MS / LLM_FAKE_JITTER_MS / LLM_FAKE_TOKEN_MS
+
+Every backend raises TimeoutError (or the SDK's timeout/connection errors) when it
+cannot answer within `timeout`, so the same retry and breaker rules apply to all.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+
+Messages = List[Dict[str, str]]
+MODEL = "gpt-4o-mini"
+
+
+@dataclass
+class Completion:
+    text: str
+    prompt_tokens: Optional[int] = None   # as reported by the backend, if it does
+
+
+class LLMBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    def complete(self, messages: Messages, max_tokens: int = 420, temperature: float = 0.75,
+                 timeout: Optional[float] = None) -> Completion:
+        """The whole reply in one call."""
+
+    @abstractmethod
+    def stream(self, messages: Messages, max_tokens: int = 420, temperature: float = 0.75,
+               timeout: Optional[float] = None) -> Iterator[str]:
+        """Yield the reply in chunks as they are generated. Closing the iterator stops it."""
+
+
+class OpenAIBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 model: str = MODEL, client=None):
+        if client is None:
+            from openai import OpenAI
+            # Retries are the caller's job (resilience.call_with_deadline), not the SDK's
+            client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.client = client
+        self.model = model
+
+    def complete(self, messages, max_tokens=420, temperature=0.75, timeout=None):
+        resp = self.client.chat.completions.create(
+            model=self.model, messages=messages,
+            max_tokens=max_tokens, temperature=temperature, timeout=timeout,
+        )
+        usage = getattr(resp, "usage", None)
+        n = getattr(usage, "prompt_tokens", None)
+        return Completion(resp.choices[0].message.content.strip(), n if isinstance(n, int) else None)
+
+    def stream(self, messages, max_tokens=420, temperature=0.75, timeout=None):
+        resp = self.client.chat.completions.create(
+            model=self.model, messages=messages,
+            max_tokens=max_tokens, temperature=temperature, timeout=timeout, stream=True,
+        )
+        try:
+            for chunk in resp:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+        finally:
+            close = getattr(resp, "close", None)
+            if close is not None:
+                close()
+
+
+# ---------- deterministic stand-in ----------
+OPENERS = [
+    "That sounds like a lot — let’s keep it simple.",
+    "Good question — here’s a small place to start.",
+    "Thanks for sharing that. One step at a time.",
+    "You’re doing the right thing by asking.",
+]
+STEPS = [
+    "Pick one 5-minute action you can repeat tomorrow.",
+    "Anchor it to something you already do, like your morning coffee.",
+    "Drink a glass of water before each meal.",
+    "Take a 10-minute walk after lunch.",
+    "Put your phone outside the bedroom tonight.",
+    "Write down one thing that went well today.",
+    "Add one portion of veg to your evening meal.",
+    "Message a friend you haven’t spoken to in a while.",
+]
+
+
+def deterministic_reply(messages: Messages, max_tokens: int = 420) -> str:
+    """Same last message -> same reply; shaped like a real Smartie answer."""
+    last = messages[-1]["content"] if messages else ""
+    h = int.from_bytes(hashlib.blake2b(last.encode("utf-8"), digest_size=8).digest(), "big")
+    steps = [STEPS[(h >> (8 * i)) % len(STEPS)] for i in range(3)]
+    text = "\n".join([OPENERS[h % len(OPENERS)]] + [f"• {s}" for s in dict.fromkeys(steps)])
+    return text[: max_tokens * 4]
+
+
+def estimate_prompt_tokens(messages: Messages) -> int:
+    return sum(len(m.get("content", "")) for m in messages) // 4 + 4 * len(messages)
+
+
+class DeterministicBackend(LLMBackend):
+    """
+    No network. Waits `latency_ms` (+ uniform jitter up to `jitter_ms`) before the first
+    token and `token_ms` per word after it, so latency looks like a real completion.
+    `hang_rate` is the share of calls that stall until their timeout (outage drills).
+    """
+    name = "deterministic"
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, token_ms: float = 0.0,
+                 hang_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.token_delay = token_ms / 1000
+        self.hang_rate = hang_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _first_token_delay(self, timeout: Optional[float]) -> float:
+        with self._lock:
+            self.calls += 1
+            hang = self._rng.random() < self.hang_rate
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+        if hang or (timeout is not None and delay > timeout):
+            time.sleep(timeout if timeout is not None else delay)
+            raise TimeoutError("deterministic backend: timed out")
+        return delay
+
+    def complete(self, messages, max_tokens=420, temperature=0.75, timeout=None):
+        delay = self._first_token_delay(timeout)
+        text = deterministic_reply(messages, max_tokens)
+        time.sleep(delay + self.token_delay * len(text.split()))
+        return Completion(text, estimate_prompt_tokens(messages))
+
+    def stream(self, messages, max_tokens=420, temperature=0.75, timeout=None):
+        time.sleep(self._first_token_delay(timeout))
+        words = deterministic_reply(messages, max_tokens).split(" ")
+        for i, w in enumerate(words):
+            if i:
+                time.sleep(self.token_delay)
+            yield w if i == len(words) - 1 else w + " "
+
+
+# ---------- HTTP stand-in for the chat-completions API ----------
+def make_stub_handler(backend: DeterministicBackend):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):   # keep benchmarks quiet
+            pass
+
+        def _json(self, status: int, payload: dict):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                return self._json(404, {"error": {"message": "not found"}})
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            messages = req.get("messages") or []
+            max_tokens = int(req.get("max_tokens") or 420)
+            created = int(time.time())
+            cid = f"chatcmpl-stub{created}"
+            try:
+                if not req.get("stream"):
+                    c = backend.complete(messages, max_tokens=max_tokens, timeout=30)
+                    return self._json(200, {
+                        "id": cid, "object": "chat.completion", "created": created, "model": MODEL,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": c.text}}],
+                        "usage": {"prompt_tokens": c.prompt_tokens, "completion_tokens": len(c.text) // 4,
+                                  "total_tokens": c.prompt_tokens + len(c.text) // 4},
+                    })
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for piece in backend.stream(messages, max_tokens=max_tokens, timeout=30):
+                    chunk = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": MODEL,
+                             "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+            except TimeoutError:
+                self._json(504, {"error": {"message": "upstream timed out", "type": "timeout"}})
+
+    return StubHandler
+
+
+def serve_stub(host: str = "127.0.0.1", port: int = 8099, backend: Optional[DeterministicBackend] = None,
+               background: bool = False) -> ThreadingHTTPServer:
+    """Run the chat-completions stand-in. With background=True it runs on a daemon thread."""
+    server = ThreadingHTTPServer((host, port), make_stub_handler(backend or DeterministicBackend()))
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+def _env_ms(name: str) -> float:
+    return float(os.getenv(name, "0") or 0)
+
+def backend_from_env() -> LLMBackend:
+    kind = os.getenv("LLM_BACKEND", "openai").strip().lower()
+    if kind == "openai":
+        return OpenAIBackend(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL"))
+    if kind == "stub":
+        return OpenAIBackend(api_key="stub", base_url=os.getenv("LLM_STUB_URL", "http://127.0.0.1:8099/v1"))
+    if kind == "deterministic":
+        return DeterministicBackend(_env_ms("LLM_FAKE_LATENCY_MS"), _env_ms("LLM_FAKE_JITTER_MS"),
+                                    _env_ms("LLM_FAKE_TOKEN_MS"))
+    raise ValueError(f"Unknown LLM_BACKEND: {kind!r}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat-completions API")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("serve")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8099)
+    p.add_argument("--latency-ms", type=float, default=300.0)
+    p.add_argument("--jitter-ms", type=float, default=100.0)
+    p.add_argument("--token-ms", type=float, default=0.0)
+    args = ap.parse_args()
+    print(f"LLM stand-in on http://{args.host}:{args.port}/v1 "
+          f"(latency {args.latency_ms}ms + jitter {args.jitter_ms}ms)")
+    serve_stub(args.host, args.port, DeterministicBackend(args.latency_ms, args.jitter_ms, args.token_ms))
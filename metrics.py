@@ -0,0 +1,98 @@
+# metrics.py
+"""
+Process-wide counters, gauges and latency summaries, served as JSON on /metrics.
+
+    incr("wa.received")                 # counter
+    observe("wa.queue_wait", seconds)   # latency summary (count, mean, max, p50/p95/p99)
+    record("llm.prompt_tokens", n)      # summary of plain values (same shape, no unit)
+    register_gauge("wa.queue_depth", fn)  # value read at snapshot time
+"""
+import threading
+from collections import deque
+from typing import Any, Callable, Dict
+
+RESERVOIR = 2048   # recent samples kept per timing for percentiles
+
+_LOCK = threading.Lock()
+COUNTERS: Dict[str, float] = {}
+TIMINGS: Dict[str, "Timing"] = {}
+VALUES: Dict[str, "Timing"] = {}
+GAUGES: Dict[str, Callable[[], Any]] = {}
+
+
+class Timing:
+    """
+    Running count/total/max plus the most recent samples for percentiles. Samples are
+    seconds reported in ms by default; Timing(scale=1, unit="") summarises raw values.
+    """
+
+    __slots__ = ("count", "total", "max", "recent", "scale", "unit")
+
+    def __init__(self, scale: float = 1000.0, unit: str = "_ms"):
+        self.scale = scale
+        self.unit = unit
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=RESERVOIR)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.recent.append(value)
+
+    def summary(self) -> Dict[str, float]:
+        xs, k, u = sorted(self.recent), self.scale, self.unit
+        def pct(p):
+            return round(xs[min(len(xs) - 1, int(p * len(xs)))] * k, 3) if xs else 0.0
+        return {
+            "count": self.count,
+            f"mean{u}": round(self.total / self.count * k, 3) if self.count else 0.0,
+            f"max{u}": round(self.max * k, 3),
+            f"p50{u}": pct(0.50),
+            f"p95{u}": pct(0.95),
+            f"p99{u}": pct(0.99),
+        }
+
+
+def incr(name: str, n: float = 1) -> None:
+    with _LOCK:
+        COUNTERS[name] = COUNTERS.get(name, 0) + n
+
+def observe(name: str, seconds: float) -> None:
+    with _LOCK:
+        t = TIMINGS.get(name)
+        if t is None:
+            t = TIMINGS[name] = Timing()
+        t.add(seconds)
+
+def record(name: str, value: float) -> None:
+    with _LOCK:
+        v = VALUES.get(name)
+        if v is None:
+            v = VALUES[name] = Timing(scale=1, unit="")
+        v.add(value)
+
+def register_gauge(name: str, fn: Callable[[], Any]) -> None:
+    GAUGES[name] = fn
+
+def snapshot() -> Dict[str, Any]:
+    with _LOCK:
+        counters = dict(COUNTERS)
+        timings = {k: t.summary() for k, t in TIMINGS.items()}
+        values = {k: v.summary() for k, v in VALUES.items()}
+    gauges = {}
+    for name, fn in list(GAUGES.items()):
+        try:
+            gauges[name] = fn()
+        except Exception as e:   # a broken gauge must not take /metrics down
+            gauges[name] = f"error: {e}"
+    return {"counters": counters, "gauges": gauges, "timings": timings, "values": values}
+
+def reset() -> None:
+    with _LOCK:
+        COUNTERS.clear()
+        TIMINGS.clear()
+        VALUES.clear()
@@ -0,0 +1,90 @@
+# phrase_matcher.py
+from collections import deque
+from typing import Dict, Hashable, Iterable, List, Set, Tuple
+
+Hit = Tuple[str, Hashable]   # (table name, payload registered with the phrase)
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over many keyword tables.
+
+    Each phrase is registered with a table name and a payload (e.g. the index of its
+    alias group). One pass over the text returns every table that had a substring hit,
+    with the payloads that matched. Semantics match `phrase in text` for every phrase.
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[Hit, ...]] = [()]
+        self._pending: List[List[Hit]] = [[]]
+        self._built = False
+
+    def add(self, phrase: str, table: str, payload: Hashable = None) -> None:
+        if self._built:
+            raise RuntimeError("PhraseMatcher is already built; create a new one to add phrases")
+        phrase = (phrase or "").lower()
+        if not phrase:
+            return
+        node = 0
+        for ch in phrase:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._pending.append([])
+            node = nxt
+        hit = (table, payload)
+        if hit not in self._pending[node]:
+            self._pending[node].append(hit)
+
+    def add_table(self, table: str, groups: Iterable[Tuple[Iterable[str], Hashable]]) -> None:
+        """Register `(phrases, payload)` groups under one table name."""
+        for phrases, payload in groups:
+            for p in phrases:
+                self.add(p, table, payload)
+
+    def build(self) -> "PhraseMatcher":
+        """Compute failure links (BFS) and merge outputs along them."""
+        out: List[List[Hit]] = [list(x) for x in self._pending]
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(ch, 0)
+                for hit in out[self._fail[child]]:
+                    if hit not in out[child]:
+                        out[child].append(hit)
+        self._out = [tuple(x) for x in out]
+        self._pending = []
+        self._built = True
+        return self
+
+    def scan(self, text: str) -> Dict[str, Set[Hashable]]:
+        """Return {table: {payloads}} for every phrase that occurs in `text` (lowercased)."""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        hits: Dict[str, Set[Hashable]] = {}
+        node = 0
+        for ch in (text or "").lower():
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for table, payload in out[node]:
+                bucket = hits.get(table)
+                if bucket is None:
+                    hits[table] = {payload}
+                else:
+                    bucket.add(payload)
+        return hits
@@ -0,0 +1,103 @@
+# pillars.py
+"""
+The eight eity20 pillars: one registry, one small integer ID each.
+
+    pillars.ID["movement"] -> 3     pillars.KEYS[3] -> "movement"     pillars.LABELS[3]
+    pillars.texts().descriptions[3], .suggestions[3], .outcomes[3], ...
+
+IDs are positions in KEYS and never change meaning: goals, baseline ratings and
+cohort arrays store the ID, so KEYS may only be appended to. Keys ("movement") are
+what content files, state and log lines use; pillar_id() also accepts the older
+aliases. Per-pillar copy comes from content/*.json (keyed by pillar key there) and
+is rebuilt into tuples aligned with KEYS on every content load.
+"""
+from dataclasses import dataclass
+from typing import Any, Mapping, Tuple, Union
+
+from content_store import CONTENT
+
+KEYS = ("environment", "nutrition", "sleep", "movement", "stress", "thoughts", "emotions", "social")
+LABELS = (
+    "Environment & Structure",
+    "Nutrition & Gut Health",
+    "Sleep",
+    "Exercise & Movement",
+    "Stress Management",
+    "Thought Patterns",
+    "Emotional Regulation",
+    "Social Connection",
+)
+COUNT = len(KEYS)
+ENVIRONMENT, NUTRITION, SLEEP, MOVEMENT, STRESS, THOUGHTS, EMOTIONS, SOCIAL = range(COUNT)
+
+ID = {k: i for i, k in enumerate(KEYS)}
+ALIASES = {"exercise": "movement"}          # older keys still seen in saved state
+ID_BY_LABEL = {label.lower(): i for i, label in enumerate(LABELS)}
+
+
+def pillar_id(pillar: Union[str, int]) -> int:
+    """ID for a pillar key (or alias), or an ID passed through. KeyError if unknown."""
+    if isinstance(pillar, int):
+        if 0 <= pillar < COUNT:
+            return pillar
+        raise KeyError(pillar)
+    key = ALIASES.get(pillar, pillar)
+    return ID[key]
+
+
+def key_of(pid: int) -> str:
+    return KEYS[pid]
+
+
+def label_of(pid: int) -> str:
+    return LABELS[pid]
+
+
+@dataclass(frozen=True)
+class Texts:
+    """Per-pillar copy from the live content, each tuple indexed by pillar ID."""
+    descriptions: Tuple[str, ...]            # baseline: one line used while rating
+    suggestions: Tuple[Tuple[str, ...], ...]  # baseline: pick-one suggestions
+    why: Tuple[str, ...]                      # playbook
+    tips: Tuple[Tuple[str, ...], ...]         # playbook: advice suggestions
+    outcomes: Tuple[str, ...]                 # coaching: what improving it does for you
+    goals: Tuple[Tuple[str, ...], ...]        # coaching: suggested SMARTS goals
+
+
+def _aligned(table: Mapping[str, Any], name: str, default: Any = None) -> Tuple[Any, ...]:
+    unknown = [k for k in table if ALIASES.get(k, k) not in ID]
+    if unknown:
+        raise ValueError(f"{name}: unknown pillar keys {unknown}")
+    by_id = {ID[ALIASES.get(k, k)]: v for k, v in table.items()}
+    return tuple(by_id.get(i, default) for i in range(COUNT))
+
+
+def build_texts(data: Mapping[str, Any]) -> Texts:
+    playbook, baseline, coaching = data["playbook"], data["baseline"], data["coaching"]
+    book = _aligned(playbook["pillars"], "playbook.pillars", {})
+    return Texts(
+        descriptions=_aligned(baseline["pillar_desc"], "baseline.pillar_desc", ""),
+        suggestions=_aligned(baseline["pillar_suggestions"], "baseline.pillar_suggestions", ()),
+        why=tuple(p.get("why", "") for p in book),
+        tips=tuple(tuple(p.get("suggestions", ())) for p in book),
+        outcomes=_aligned(coaching["pillar_outcomes"], "coaching.pillar_outcomes", ""),
+        goals=_aligned(coaching["suggested_goals"], "coaching.suggested_goals", ()),
+    )
+
+
+CONTENT.register("pillars", build_texts)
+
+
+def texts() -> Texts:
+    return CONTENT.current.index("pillars")
+
+
+def label_for(key: str) -> str:
+    """Label for a pillar key (or alias); anything else comes back title-cased."""
+    pid = ID.get(ALIASES.get(key, key)) if key else None
+    return LABELS[pid] if pid is not None else (key or "").title()
+
+
+def outcome_for(key: str) -> str:
+    pid = ID.get(ALIASES.get(key, key)) if key else None
+    return texts().outcomes[pid] if pid is not None else ""
@@ -0,0 +1,248 @@
+# reminders.py
+"""
+Goal reminders over WhatsApp.
+
+Every user with a goal has one next-due time, kept in their record (the "reminder"
+namespace) and mirrored in an in-memory min-heap of (due, user_id). The due time is
+the last check-in (or the day before the goal starts) plus the cadence gap, at
+`hour_utc`:
+
+    daily: 1 day    3x/week, most days: 2 days    weekly: 7 days
+
+A new goal or check-in reschedules the user (hook it up with tracker.on_change). The
+scheduler thread pops due users in batches, marks each reminder as sent in the store
+and flushes before sending, then sends at most `rate` messages a second. The heap is
+rebuilt from the store at start, so a restart neither loses a reminder nor repeats
+one; a crash between the flush and the send drops that reminder instead of sending
+it twice. Run the scheduler in one process only.
+
+Reminders stop after `max_unanswered` in a row with no check-in (or new goal) in
+between, and for users with no check-in for longer than `idle_ttl` (the store's user
+TTL). The scheduler only reads records without touching them and writes only when it
+sends, so a user who has gone quiet is no longer kept alive by their own reminders
+and ages out of the store as usual.
+"""
+import datetime as dt
+import heapq
+import os
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional, Tuple
+
+import metrics
+import tracker
+from storage import UserMap, get_store, user_lock
+
+# { user_id: {"due": epoch s, "sent": due of the last one sent,
+#             "anchor": check-in day ordinal at that send, "unanswered": sends since a check-in} }
+REMINDERS = UserMap("reminder")
+
+CADENCE_GAP_DAYS = {"daily": 1, "3x/week": 2, "most days": 2, "weekly": 7}
+DEFAULT_GAP_DAYS = 2
+DAY = 86400.0
+
+
+def reminder_message(goal: "tracker.Goal") -> str:
+    return (
+        f"Quick nudge for your goal: “{goal.text}”.\n"
+        "Reply **done** once you’ve done it today, or **progress** to see how it’s going."
+    )
+
+
+def _gap(goal: "tracker.Goal") -> float:
+    return CADENCE_GAP_DAYS.get(goal.cadence, DEFAULT_GAP_DAYS) * DAY
+
+
+def _anchor(goal: "tracker.Goal", last: Optional[dt.date]) -> dt.date:
+    return last or goal.started - dt.timedelta(days=1)
+
+
+def _last_checkin(logs) -> Optional[dt.date]:
+    if isinstance(logs, list):   # records saved before CheckIns: [LogEntry, ...]
+        return max((e.date for e in logs), default=None)
+    return logs.last if logs is not None else None
+
+
+class Scheduler:
+    def __init__(self, send: Callable[[str, str], object], address: Callable[[str], Optional[str]],
+                 message: Callable[["tracker.Goal"], str] = reminder_message,
+                 hour_utc: int = 18, batch: int = 50, rate: float = 10.0, tick: float = 30.0,
+                 max_unanswered: int = 3, idle_ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.time):
+        self.send = send              # send(to, body)
+        self.address = address        # user_id -> recipient, or None if we can't message them
+        self.message = message
+        self.hour_utc = hour_utc
+        self.batch = batch
+        self.rate = rate
+        self.tick = tick
+        self.max_unanswered = max_unanswered   # 0 = no limit
+        self.idle_ttl = idle_ttl               # seconds since the last check-in; None = no limit
+        self.clock = clock
+        self._heap: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid: Optional[int] = None
+        self._next_send = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.stale = 0
+        self.stopped = 0
+
+    # ---------- scheduling ----------
+    def due_after(self, goal: "tracker.Goal", last: Optional[dt.date], sent: float) -> float:
+        """The reminder after `last` (or the goal's start), moved past one already sent."""
+        anchor = _anchor(goal, last)
+        gap = _gap(goal)
+        day = anchor + dt.timedelta(seconds=gap)
+        due = dt.datetime(day.year, day.month, day.day, self.hour_utc, tzinfo=dt.timezone.utc).timestamp()
+        if due <= sent:
+            due += ((sent - due) // gap + 1) * gap
+        return due
+
+    def gone_quiet(self, goal: "tracker.Goal", last: Optional[dt.date], rec: Optional[dict],
+                   now: float) -> bool:
+        """Too many reminders without a check-in, or no check-in for longer than idle_ttl."""
+        anchor = _anchor(goal, last)
+        if self.idle_ttl is not None:
+            since = dt.datetime(anchor.year, anchor.month, anchor.day, tzinfo=dt.timezone.utc).timestamp()
+            if now - since > self.idle_ttl + DAY:
+                return True
+        return bool(self.max_unanswered and rec and rec.get("anchor") == anchor.toordinal()
+                    and rec.get("unanswered", 0) >= self.max_unanswered)
+
+    def schedule(self, user_id: str) -> Optional[float]:
+        """(Re)compute a user's next reminder from their goal and last check-in."""
+        if self.address(user_id) is None:
+            return None
+        goal = tracker.get_goal(user_id)
+        if goal is None:
+            REMINDERS.pop(user_id, None)
+            return None
+        return self._schedule(user_id, goal, tracker._checkins(user_id).last, REMINDERS.get(user_id))
+
+    def _schedule(self, user_id: str, goal: "tracker.Goal", last: Optional[dt.date],
+                  rec: Optional[dict]) -> Optional[float]:
+        if self.gone_quiet(goal, last, rec, self.clock()):
+            return None
+        rec = rec or {"due": 0.0, "sent": 0.0}
+        due = self.due_after(goal, last, rec["sent"])
+        if due != rec["due"]:
+            REMINDERS[user_id] = {**rec, "due": due}
+        self._push(due, user_id)
+        return due
+
+    def _push(self, due: float, user_id: str) -> None:
+        with self._lock:
+            heapq.heappush(self._heap, (due, user_id))
+            first = self._heap[0][1] == user_id and self._heap[0][0] == due
+        if first:
+            self._wake.set()
+
+    def load(self) -> int:
+        """
+        Rebuild the heap from one scan of the store: every user with a goal who hasn't
+        gone quiet gets a due time.
+        """
+        with self._lock:
+            self._heap = []
+        n = 0
+        for uid, rec in get_store().scan():
+            goal = rec.get(tracker.GOALS.namespace)
+            if goal is None or self.address(uid) is None:
+                continue
+            last = _last_checkin(rec.get(tracker.LOGS.namespace))
+            with user_lock(uid):
+                if self._schedule(uid, goal, last, rec.get(REMINDERS.namespace)) is not None:
+                    n += 1
+        return n
+
+    # ---------- sending ----------
+    def run_due(self, now: Optional[float] = None) -> int:
+        """Send one batch of due reminders. Returns how many went out."""
+        now = self.clock() if now is None else now
+        with self._lock:
+            batch = []
+            while self._heap and self._heap[0][0] <= now and len(batch) < self.batch:
+                batch.append(heapq.heappop(self._heap))
+        store = get_store()
+        out = []
+        for due, uid in batch:
+            with user_lock(uid):
+                record = store.peek(uid, touch=False) or {}
+                rec = record.get(REMINDERS.namespace)
+                if rec is None or rec["due"] != due or rec["sent"] >= due:
+                    self.stale += 1      # rescheduled since, or already sent
+                    continue
+                goal, to = record.get(tracker.GOALS.namespace), self.address(uid)
+                if goal is None or to is None:
+                    REMINDERS.pop(uid, None)
+                    continue
+                last = _last_checkin(record.get(tracker.LOGS.namespace))
+                if self.gone_quiet(goal, last, rec, now):
+                    self.stopped += 1    # left alone until they check in or set a new goal
+                    continue
+                anchor = _anchor(goal, last).toordinal()
+                unanswered = rec.get("unanswered", 0) + 1 if rec.get("anchor") == anchor else 1
+                gap = _gap(goal)
+                nxt = due + ((now - due) // gap + 1) * gap   # missed slots are skipped, not caught up
+                REMINDERS[uid] = {"due": nxt, "sent": due, "anchor": anchor, "unanswered": unanswered}
+                out.append((to, self.message(goal), due))
+                if not (self.max_unanswered and unanswered >= self.max_unanswered):
+                    self._push(nxt, uid)
+        if not out:
+            return 0
+        get_store().flush()   # every send is recorded before any goes out
+        for to, body, due in out:
+            self._pace()
+            try:
+                self.send(to, body)
+                self.sent += 1
+                metrics.incr("reminders.sent")
+                metrics.observe("reminders.lag", max(0.0, self.clock() - due))
+            except Exception:
+                self.failed += 1
+                metrics.incr("reminders.failed")
+                traceback.print_exc()
+        return len(out)
+
+    def _pace(self) -> None:
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        if self._next_send > now:
+            time.sleep(self._next_send - now)
+        self._next_send = max(now, self._next_send) + 1.0 / self.rate
+
+    # ---------- thread ----------
+    def start(self) -> None:
+        """Run the scheduler on a daemon thread (once per process)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name="reminders", daemon=True).start()
+
+    def _run(self) -> None:
+        try:
+            self.load()
+        except Exception:
+            traceback.print_exc()
+        while True:
+            self._wake.clear()
+            try:
+                while self.run_due():
+                    pass
+            except Exception:
+                traceback.print_exc()
+            with self._lock:
+                wait = self._heap[0][0] - self.clock() if self._heap else self.tick
+            self._wake.wait(min(max(wait, 0.0), self.tick))
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            queued = len(self._heap)
+            next_in = round(self._heap[0][0] - self.clock(), 1) if self._heap else None
+        return {"queued": queued, "next_due_in_s": next_in, "sent": self.sent,
+                "failed": self.failed, "stale": self.stale, "stopped": self.stopped}
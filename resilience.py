@@ -0,0 +1,155 @@
+# resilience.py
+"""
+Deadline, retry and circuit-breaker helpers for upstream calls (the OpenAI fallback).
+
+    breaker = CircuitBreaker("openai", failure_threshold=5, reset_timeout=30)
+    text = call_with_deadline(lambda timeout: ask(timeout), budget=8.0, retries=2,
+                              breaker=breaker, retryable=(TimeoutError,))
+
+`fn` receives the seconds left in the budget and should pass them on as its own
+request timeout. When the budget is spent the call raises DeadlineExceeded; when the
+breaker is open it raises CircuitOpen without calling upstream at all.
+"""
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+import metrics
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream could not answer within the turn; serve a local reply instead."""
+
+class DeadlineExceeded(UpstreamUnavailable, TimeoutError):
+    pass
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds. Then one trial call is let through (half-open): success
+    closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                self._state, self._trial = HALF_OPEN, False
+            return self._state
+
+    def allow(self) -> bool:
+        state = self.state
+        with self._lock:
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            self.rejected += 1
+        metrics.incr(f"{self.name}.breaker_rejected")
+        return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state, self._failures, self._trial = CLOSED, 0, False
+
+    def release(self) -> None:
+        """The call allowed through ended without an outcome (e.g. the caller went away)."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opened += 1
+                    metrics.incr(f"{self.name}.breaker_opened")
+                self._state, self._opened_at, self._trial = OPEN, self._clock(), False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+def backoff(attempt: int, base: float, cap: float, rng: random.Random = random) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))."""
+    return rng.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def call_with_deadline(fn: Callable[[float], Any], budget: float, retries: int = 2,
+                       breaker: Optional[CircuitBreaker] = None,
+                       retryable: Tuple[Type[BaseException], ...] = (Exception,),
+                       base_delay: float = 0.2, max_delay: float = 2.0,
+                       name: str = "upstream") -> Any:
+    """
+    Call `fn(timeout)` at most `retries + 1` times within `budget` seconds. Retryable
+    errors back off with jitter (never past the deadline) and count against the
+    breaker; anything else is raised at once. Raises UpstreamUnavailable (or its
+    subclasses DeadlineExceeded / CircuitOpen) when no answer can be had in time.
+    """
+    deadline = time.monotonic() + budget
+    attempt = 0
+    while True:
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpen(f"{breaker.name} circuit is open")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            metrics.incr(f"{name}.timeouts")
+            raise DeadlineExceeded(f"{name}: {budget:.1f}s budget spent")
+        t0 = time.monotonic()
+        try:
+            result = fn(remaining)
+        except retryable as e:
+            metrics.observe(f"{name}.call", time.monotonic() - t0)
+            if isinstance(e, TimeoutError) or "timeout" in type(e).__name__.lower():
+                metrics.incr(f"{name}.timeouts")
+            else:
+                metrics.incr(f"{name}.errors")
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt >= retries:
+                raise UpstreamUnavailable(f"{name}: gave up after {attempt + 1} attempt(s): {e}") from e
+            delay = backoff(attempt, base_delay, max_delay)
+            if time.monotonic() + delay >= deadline:
+                raise DeadlineExceeded(f"{name}: no time left to retry: {e}") from e
+            metrics.incr(f"{name}.retries")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except BaseException:
+            # Not an availability problem (e.g. a 400): upstream answered, so the
+            # breaker counts it as alive, and the caller sees the real error.
+            if breaker is not None:
+                breaker.record_success()
+            raise
+        metrics.observe(f"{name}.call", time.monotonic() - t0)
+        if breaker is not None:
+            breaker.record_success()
+        return result
@@ -1,34 +1,55 @@
 # smartie_flask_backend_debug_verbose.py
 
 import os
+import time
 import hashlib
+import hmac
+import json
+import threading
 import traceback
-from flask import Flask, request, jsonify
+from functools import cached_property
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from openai import OpenAI
 from twilio.rest import Client
+from twilio.request_validator import RequestValidator
+from twilio.twiml.messaging_response import MessagingResponse
 from datetime import datetime, timezone, timedelta
 
 # Playbook (single source of truth for tone + advice)
 from smartie_playbook import (
-    compose_reply, PILLARS, EITY20_TAGLINE,
+    compose_reply, book, EITY20_TAGLINE,
     nutrition_rules_answer, NUTRITION_RULES_TRIGGERS,
     nutrition_foods_answer, FOODS_TRIGGERS
 )
 
 # Baseline + tracking
-from baseline_flow import handle_baseline
-from tracker import log_done, summary as tracker_summary, get_goal, last_n_logs
-
-PENDING_GOALS: dict[str, dict] = {}
-CONCERN_CHOICES: dict[str, dict] = {}
-# Last time we saw each user (in-memory; resets on restart unless you persist it)
-LAST_SEEN: dict[str, datetime] = {}
-LAST_CONCERN: dict[str, dict] = {}  # { user_id: {"key": str, "stack": [pillars]} }
+from content_store import CONTENT
+from pillars import ID as PILLAR_IDS, label_for as pillar_label, outcome_for as pillar_outcome, texts as pillar_texts
+from baseline_flow import handle_baseline, SESSIONS as BASELINE_SESSIONS
+from tracker import log_done, summary as tracker_summary, get_goal, last_n_logs, recent_count, on_change, set_goal as tracker_set_goal
+from phrase_matcher import PhraseMatcher
+from storage import UserMap, user_turn, get_store, user_ttl
+from workers import ShardedPool
+from fallback_cache import ResponseCache
+from conversation_memory import ConversationMemory, estimate_tokens
+from llm_backends import LLMBackend, backend_from_env
+from resilience import CircuitBreaker, DeadlineExceeded, UpstreamUnavailable, call_with_deadline
+from reminders import Scheduler, reminder_message
+import openai
+import zlib
+import metrics
+from expiring import ExpiringDict
+
+# Per-user maps are views over the configured store (see storage.py / SMARTIE_STORE)
+PENDING_GOALS = UserMap("pending_goal")      # { user_id: {"text", "pillar", "cadence"} }
+CONCERN_CHOICES = UserMap("concern_choice")
+# Last time we saw each user
+LAST_SEEN = UserMap("last_seen")             # { user_id: datetime }
+LAST_CONCERN = UserMap("last_concern")       # { user_id: {"key": str, "stack": [pillars]} }
 # Last conversational state per user (simple finite-state store)
 # e.g. STATE[user_id] = {"await": "advice_topic"} or {"await": "programme_confirm"}
 # Simple per-user state (mini state machine)
-STATE: dict[str, dict] = {}   # { user_id: {"await": "advice_topic"} }
+STATE = UserMap("state")                     # { user_id: {"await": "advice_topic"} }
 
 def get_state(uid: str) -> dict:
     return STATE.get(uid, {})
@@ -41,8 +62,7 @@ def clear_state(uid: str) -> None:
 
 from collections import defaultdict
 
-GOAL_LOG: dict[str, list] = defaultdict(list)
-INTRO_SHOWN: dict[str, bool] = {}
+INTRO_SHOWN = UserMap("intro_shown")                    # { user_id: bool }
 
 # ==================================================
 # Safety-first + concern mapping + intent helpers
@@ -58,8 +78,10 @@ SAFETY_TERMS = {
 }
 
 def safety_check_and_reply(text: str) -> str | None:
-    t = (text or "").lower()
-    if any(term in t for term in SAFETY_TERMS):
+    return _safety_reply(scan_routing(text))
+
+def _safety_reply(hits: dict) -> str | None:
+    if "safety" in hits:
         return (
             "I’m concerned about your safety. If you’re in immediate danger, call emergency services now "
             "(999 UK / 112 EU / 911 US).\n\n"
@@ -146,14 +168,15 @@ CONCERN_TO_PILLARS = {
 }
 
 def suggest_pillars_for_concern(text: str) -> list[str]:
-    t = (text or "").lower()
-    hits: list[str] = []
-    for k, pillars in CONCERN_TO_PILLARS.items():
-        if k in t:
-            for p in pillars:
-                if p not in hits:
-                    hits.append(p)
-    return hits
+    return _concern_pillars(scan_routing(text))
+
+def _concern_pillars(hits: dict) -> list[str]:
+    out: list[str] = []
+    for i in sorted(hits.get("concern_pillars", ())):
+        for p in CONCERN_TO_PILLARS_ITEMS[i][1]:
+            if p not in out:
+                out.append(p)
+    return out
 
 # 3) Intent keywords → pillar (fast routing to your playbook)
 INTENT_KEYWORDS = [
@@ -168,12 +191,14 @@ INTENT_KEYWORDS = [
 ]
 
 def map_intent_to_pillar(text: str) -> str | None:
-    t = (text or "").lower()
-    for words, pillar in INTENT_KEYWORDS:
-        if any(w in t for w in words):
-            return pillar
+    return _intent_pillar(scan_routing(text))
+
+def _intent_pillar(hits: dict) -> str | None:
+    idx = _first_hit(hits, "intent")
+    if idx is not None:
+        return INTENT_KEYWORDS[idx][1]
     # fallback to concern mapping
-    sp = suggest_pillars_for_concern(t)
+    sp = _concern_pillars(hits)
     return sp[0] if sp else None
 
 # 4) Tone nudger for the OpenAI fallback
@@ -255,6 +280,62 @@ Style: warm, encouraging, concrete, and human. Never mention you are an AI or a
 """
 
 # --- Priority concern detector (skip/short-circuit baseline when matched) ---
+PRIORITY_MAP: list[tuple[tuple[str, ...], list[str]]] = [
+    # ------------------ Physical health ------------------
+    (("cholesterol","hyperlipid","dyslipid"),                     ["nutrition","movement","environment"]),
+    (("overweight","obese","weight","weight loss","weight-loss",
+      "glp-1","ozempic","wegovy","mounjaro","tirzepatide","semaglutide"),
+                                                                 ["nutrition","movement","thoughts","environment"]),
+    (("blood sugar","insulin resistance","type 2 diabetes","t2d",
+      "pre-diabetes","prediabetes"),                             ["nutrition","movement","sleep","stress"]),
+    (("menopause","perimenopause","peri-menopause"),             ["sleep","stress","emotions","social"]),
+    (("hypertension","high blood pressure","blood pressure"),    ["nutrition","movement","stress","sleep"]),
+    (("osteoarthritis","arthritis","joint pain"),                ["movement","stress","environment","sleep"]),
+    (("coronary heart disease","chd","atrial fibrillation","afib",
+      "a-fib","heart problem","heart problems","heart issue","heart issues",
+      "heart condition","heart disease","cardiac","cardio","heart health"),
+                                                                 ["nutrition","movement","stress","sleep"]),
+
+    (("copd","asthma","breathing difficulties","sleep apnoea","sleep apnea"),
+                                                                 ["movement","sleep","stress","environment"]),
+    (("liver disease","alcohol-related liver disease","arld",
+      "non-alcoholic fatty liver disease","nafld","fatty liver"),
+                                                                 ["nutrition","movement","stress","sleep"]),
+    (("kidney disease","ckd","chronic kidney"),                  ["nutrition","sleep","stress","movement"]),
+    (("osteopenia","osteoporosis","bone health"),                ["movement","nutrition","environment","sleep"]),
+    (("metabolic syndrome","high triglycerides","low hdl","large waist","waist circumference"),
+                                                                 ["nutrition","movement","sleep","stress"]),
+    (("autoimmune","multiple sclerosis","ms","graves","type 1 diabetes",
+      "rheumatoid arthritis","psoriasis","vasculitis"),          ["stress","nutrition","movement","sleep"]),
+
+    # ------------------ Mental health (ICD-11-ish) ------------------
+    (("low mood","depression","bipolar","seasonal affective","sad"),
+                                                                 ["sleep","movement","thoughts","social"]),
+    (("anxiety","gad","generalised anxiety","generalized anxiety"),
+                                                                 ["stress","thoughts","sleep","emotions"]),
+    (("ptsd","post-traumatic stress","stress disorder","trauma"),["stress","emotions","social","sleep"]),
+    (("emotional dysregulation","emotional disorder","binge eating","binge-eating",
+      "emotional eating","comfort eating","eating disorder","bed"),
+                                                                 ["nutrition","environment","emotions","thoughts"]),
+    (("adhd","attention deficit","asd","autism","neurodevelopmental"),
+                                                                 ["environment","nutrition","sleep","thoughts"]),
+    (("addiction","addictive behaviour","gaming","screen time","television","tv"),
+                                                                 ["environment","thoughts","social","sleep"]),
+    (("sleep-wake","circadian","insomnia","sleep disorder"),     ["sleep","environment","stress","thoughts"]),
+    (("mci","cognitive decline","neurocognitive","dementia","alzheimer"),
+                                                                 ["sleep","nutrition","movement","social"]),
+
+    # ------------------ Gut health ------------------
+    (("ibs","irritable bowel","bloating","constipation","diarrhoea","diarrhea"),
+                                                                 ["nutrition","stress","sleep","emotions"]),
+    (("leaky gut","intestinal permeability","crohn","ulcerative colitis","ibd",
+      "coeliac","celiac","autoimmune gastritis"),
+                                                                 ["nutrition","stress","sleep","emotions"]),
+    (("food allergy","food intolerance","gluten","dairy","wheat","histamine","mold","mould",
+      "reflux","gerd","acid reflux"),
+                                                                 ["nutrition","emotions","stress","sleep"]),
+]
+
 def detect_priority_stack(text: str) -> list[str]:
     """
     Return a curated, ordered list of pillar keys for priority concerns.
@@ -262,69 +343,11 @@ def detect_priority_stack(text: str) -> list[str]:
     Pillar keys: "environment","nutrition","sleep","movement",
                  "stress","thoughts","emotions","social"
     """
-    t = (text or "").lower()
+    return _priority_stack(scan_routing(text))
 
-    PRIORITY_MAP: list[tuple[tuple[str, ...], list[str]]] = [
-        # ------------------ Physical health ------------------
-        (("cholesterol","hyperlipid","dyslipid"),                     ["nutrition","movement","environment"]),
-        (("overweight","obese","weight","weight loss","weight-loss",
-          "glp-1","ozempic","wegovy","mounjaro","tirzepatide","semaglutide"),
-                                                                     ["nutrition","movement","thoughts","environment"]),
-        (("blood sugar","insulin resistance","type 2 diabetes","t2d",
-          "pre-diabetes","prediabetes"),                             ["nutrition","movement","sleep","stress"]),
-        (("menopause","perimenopause","peri-menopause"),             ["sleep","stress","emotions","social"]),
-        (("hypertension","high blood pressure","blood pressure"),    ["nutrition","movement","stress","sleep"]),
-        (("osteoarthritis","arthritis","joint pain"),                ["movement","stress","environment","sleep"]),
-        (("coronary heart disease","chd","atrial fibrillation","afib",
-          "a-fib","heart problem","heart problems","heart issue","heart issues",
-          "heart condition","heart disease","cardiac","cardio","heart health"),
-                                                                     ["nutrition","movement","stress","sleep"]),
-
-        (("copd","asthma","breathing difficulties","sleep apnoea","sleep apnea"),
-                                                                     ["movement","sleep","stress","environment"]),
-        (("liver disease","alcohol-related liver disease","arld",
-          "non-alcoholic fatty liver disease","nafld","fatty liver"),
-                                                                     ["nutrition","movement","stress","sleep"]),
-        (("kidney disease","ckd","chronic kidney"),                  ["nutrition","sleep","stress","movement"]),
-        (("osteopenia","osteoporosis","bone health"),                ["movement","nutrition","environment","sleep"]),
-        (("metabolic syndrome","high triglycerides","low hdl","large waist","waist circumference"),
-                                                                     ["nutrition","movement","sleep","stress"]),
-        (("autoimmune","multiple sclerosis","ms","graves","type 1 diabetes",
-          "rheumatoid arthritis","psoriasis","vasculitis"),          ["stress","nutrition","movement","sleep"]),
-
-        # ------------------ Mental health (ICD-11-ish) ------------------
-        (("low mood","depression","bipolar","seasonal affective","sad"),
-                                                                     ["sleep","movement","thoughts","social"]),
-        (("anxiety","gad","generalised anxiety","generalized anxiety"),
-                                                                     ["stress","thoughts","sleep","emotions"]),
-        (("ptsd","post-traumatic stress","stress disorder","trauma"),["stress","emotions","social","sleep"]),
-        (("emotional dysregulation","emotional disorder","binge eating","binge-eating",
-          "emotional eating","comfort eating","eating disorder","bed"),
-                                                                     ["nutrition","environment","emotions","thoughts"]),
-        (("adhd","attention deficit","asd","autism","neurodevelopmental"),
-                                                                     ["environment","nutrition","sleep","thoughts"]),
-        (("addiction","addictive behaviour","gaming","screen time","television","tv"),
-                                                                     ["environment","thoughts","social","sleep"]),
-        (("sleep-wake","circadian","insomnia","sleep disorder"),     ["sleep","environment","stress","thoughts"]),
-        (("mci","cognitive decline","neurocognitive","dementia","alzheimer"),
-                                                                     ["sleep","nutrition","movement","social"]),
-
-        # ------------------ Gut health ------------------
-        (("ibs","irritable bowel","bloating","constipation","diarrhoea","diarrhea"),
-                                                                     ["nutrition","stress","sleep","emotions"]),
-        (("leaky gut","intestinal permeability","crohn","ulcerative colitis","ibd",
-          "coeliac","celiac","autoimmune gastritis"),
-                                                                     ["nutrition","stress","sleep","emotions"]),
-        (("food allergy","food intolerance","gluten","dairy","wheat","histamine","mold","mould",
-          "reflux","gerd","acid reflux"),
-                                                                     ["nutrition","emotions","stress","sleep"]),
-    ]
-
-    for aliases, stack in PRIORITY_MAP:
-        if any(k in t for k in aliases):
-            return stack
-
-    return []
+def _priority_stack(hits: dict) -> list[str]:
+    idx = _first_hit(hits, "priority")
+    return PRIORITY_MAP[idx][1] if idx is not None else []
 
 # Short, consistent eity20 intro used on first contact + concern-first replies
 EITY20_INTRO = (
@@ -365,40 +388,10 @@ HUMAN_LABELS = {
     # fallback keys will be title-cased if not present
 }
 
-# Tailored leading questions by concern label (used right after the intro)
-LEADING_QUESTIONS = {
-    # Physical
-    "cholesterol": "What do you think has driven your cholesterol up lately — food choices, weight, family history, or something else?",
-    "weight": "What makes losing weight so tough right now — hunger, evening snacking, routine, or energy for movement?",
-    "blood sugar": "What do you think most affects your blood sugar — meal timing, carb type/size, activity, or sleep/stress?",
-    "menopause": "Which symptom bothers you most — sleep, hot flushes, mood, or weight changes?",
-    "blood pressure": "When is your blood pressure highest — stressful days, poor sleep, salty foods, or inactivity?",
-    "joint": "Which joints limit you most and when — mornings, after sitting, or with activity?",
-    "cvd": "What feels most important to work on first — movement, food quality, blood pressure, or stress?",
-    "breathing": "What tends to trigger symptoms — exertion, allergens, sleep position, or stress?",
-    "liver": "Which area do you want to focus on — alcohol, weight, balanced meals, or daily movement?",
-    "kidney": "What’s your current priority — blood pressure control, blood sugars, protein balance, or salt intake?",
-    "bone": "Which change feels most doable — strength exercises, calcium/protein at meals, or vitamin D checks?",
-    "metabolic": "Which piece feels most moveable first — waist size, triglycerides, fasting glucose, or blood pressure?",
-    "autoimmune": "What tends to cause a flare up — stress, poor sleep, infections, or specific foods?",
-
-    # Mental
-    "low mood": "What shifts your mood most — sleep quality, activity, social contact, or self-talk?",
-    "anxiety": "When does anxiety spike — mornings, social settings, at night, or after caffeine/sugar?",
-    "ptsd": "What’s your main stress load — work, caring, finances, health, or something else?",
-    "emotional eating": "What’s the usual pattern before eating episodes — strong feelings, tiredness, being unprepared, or restrictive rules?",
-    "adhd": "What do you think will help — routines, sleep, food planning, or focus breaks?",
-    "addiction": "What’s the main trigger — boredom, late-night routine, stress, or social cues?",
-    "sleep": "Which part is hardest — getting to sleep, staying asleep, wake time, or caffeine timing?",
-    "cognitive": "Which daily function needs the most help — remembering tasks, planning, or staying focused?",
-
-    # Gut
-    "ibs": "What most sets symptoms off — certain foods, stress spikes, poor sleep, or irregular meals?",
-    "functional gi": "What’s most noticeable — bloating, pain, constipation, diarrhoea, or post-meal fatigue?",
-    "autoimmune gi": "What tends to precede flare ups — stress, infections, specific foods, or inconsistent meds?",
-    "food intolerance": "Which foods are you most suspicious of right now?",
-    "reflux": "When is reflux worst — late meals, lying down after eating, trigger foods, or larger portions?",
-}
+# Tailored leading questions by concern label (used right after the intro) live in
+# content/coaching.json; per-pillar outcomes and goals are read through pillars.texts().
+def coaching():
+    return CONTENT.current.data["coaching"]
 
 # Map many user phrases to one canonical concern key
 CONCERN_ALIASES: list[tuple[tuple[str, ...], str]] = [
@@ -431,11 +424,11 @@ CONCERN_ALIASES: list[tuple[tuple[str, ...], str]] = [
 
 def match_concern_key(text: str) -> str | None:
     """Return the canonical concern key from user text, or None."""
-    t = (text or "").lower()
-    for aliases, key in CONCERN_ALIASES:
-        if any(a in t for a in aliases):
-            return key
-    return None
+    return _concern_key(scan_routing(text))
+
+def _concern_key(hits: dict) -> str | None:
+    idx = _first_hit(hits, "concern")
+    return CONCERN_ALIASES[idx][1] if idx is not None else None
 
 def human_label_for(key: str) -> str:
     """Return a human-friendly label for a concern key, with fallback."""
@@ -444,7 +437,7 @@ def human_label_for(key: str) -> str:
     return HUMAN_LABELS.get(key, key.replace("_", " ").title())
 
 def leading_question_for(key: str) -> str:
-    return LEADING_QUESTIONS.get(
+    return coaching()["leading_questions"].get(
         key, f"What do you think is contributing most to your {human_label_for(key)} right now?"
     )
 
@@ -460,10 +453,9 @@ def make_concern_intro_reply(concern_key: str, stack: list[str], user_text: str
     """
     # human labels + pillar labels
     concern_label = human_label_for(concern_key)
-    label_map = {k: v["label"] for k, v in PILLARS.items()}
     first = stack[0]
-    first_label = label_map.get(first, first.title())
-    rest_labels = [label_map.get(p, p.title()) for p in stack[1:]]
+    first_label = pillar_label(first)
+    rest_labels = [pillar_label(p) for p in stack[1:]]
     rest_part = f" Next up: {', '.join(rest_labels)}." if rest_labels else ""
 
     # 1) Empathetic opener
@@ -504,7 +496,7 @@ def make_concern_intro_reply(concern_key: str, stack: list[str], user_text: str
         "5) **Not sure where to begin?** Type *baseline* for a 1-minute assessment to prioritise your pillars."
     )
     
-    outcomes = PILLAR_OUTCOMES.get(first, "")
+    outcomes = pillar_outcome(first)
     
     return (
         f"{opener}\n\n"
@@ -557,11 +549,11 @@ def mentions_glp1(text: str) -> bool:
     return any(w in t for w in ["glp-1", "glp1", "ozempic", "wegovy", "mounjaro", "tirzepatide", "semaglutide"])
 
 def detect_program_key(text: str) -> str | None:
-    t = (text or "").lower()
-    for aliases, key in PROGRAM_ALIASES:
-        if any(w in t for w in aliases):
-            return key
-    return None
+    return _program_key(scan_routing(text))
+
+def _program_key(hits: dict) -> str | None:
+    idx = _first_hit(hits, "program")
+    return PROGRAM_ALIASES[idx][1] if idx is not None else None
 
 def program_pitch_context(topic_key: str, concern_key: str | None = None, user_text: str | None = None) -> str:
     """Return a context-aware programme pitch."""
@@ -581,7 +573,7 @@ def program_pitch_context(topic_key: str, concern_key: str | None = None, user_t
         label = variants.get(concern_key, label)
 
     pillar = base["pillar"]
-    human_pillar = PILLARS.get(pillar, {}).get("label", pillar.title())
+    human_pillar = pillar_label(pillar)
     return f"an eity20 programme to **{label}** (Pillar: {human_pillar})"
 
 def program_pitch(key: str) -> str:
@@ -615,7 +607,7 @@ def display_for_menu(topic_key: str, pillar_key: str) -> str:
         """Prefer the user's topic for display; otherwise use the pillar's label."""
         if topic_key and topic_key.strip():
             return topic_key.strip()
-        return PILLARS.get(pillar_key, {}).get("label", (pillar_key or "").title())
+        return pillar_label(pillar_key)
 
 def start_baseline_now(user_id: str, text: str, now: datetime):
     # 1) Try to seed baseline with the user’s last concern/topic or this message
@@ -634,7 +626,10 @@ def start_baseline_now(user_id: str, text: str, now: datetime):
         bl = handle_baseline(user_id, text, seed_concern_key=seed_key)  # preferred
     except TypeError:
         preface = f"Great — we’ll keep *{human_label_for(seed_key)}* in mind.\n\n" if seed_key else ""
-        bl = preface + (handle_baseline(user_id, text) or "")
+        hb = handle_baseline(user_id, text) or ""
+        if isinstance(hb, dict):
+            hb = hb.get("reply", "")
+        bl = preface + hb
 
     if bl is not None:
         LAST_SEEN[user_id] = now
@@ -660,44 +655,11 @@ def related_concerns_for_pillar(pillar: str) -> str:
     items = RELATED_CONCERNS_BY_PILLAR.get(pillar, [])
     return ", ".join(items[:5])
 
-PILLAR_OUTCOMES = {
-    "sleep": (
-        "Better sleep can lift your mood, sharpen focus, improve memory, balance blood sugar, "
-        "reduce cravings, support immunity, help manage weight and improve energy."
-    ),
-    "nutrition": (
-        "Improving nutrition can ease gut issues, balance blood sugar, "
-        "reduce inflammation, improve bone health, reduce risk of chronic diseases, boost energy, and support brain health."
-    ),
-    "movement": (
-        "Moving more can reduce stress and anxiety, improve sleep, reduce risk of chronic diseases like type 2 diabetes, "
-        "boost mood, ease joint pain, and increase energy."
-    ),
-    "stress": (
-        "Managing stress can reduce anxiety, improve sleep, lower blood pressure, "
-        "calm digestion, improve mental clarity and strengthen your resilience."
-    ),
-    "thoughts": (
-        "Changing thought patterns can boost mood, regulate emotions, "
-        "reduce stress and anxiety, lift self-esteem, reduce inflammation, "
-        "and support healthier habits."
-    ),
-    "emotions": (
-        "Regulating emotions can improve relationships, reduce stress, "
-        "stabilise mood, cut down emotional eating, and support mental clarity."
-    ),
-    "environment": (
-        "Shaping your environment can make healthy habits easier, reduce distractions, "
-        "improve sleep routines, improve your mood, increase motivation, lower stress and improve your overall health."
-    ),
-    "social": (
-        "Strengthening social connections can lift mood, reduce loneliness, "
-        "increase motivation, protect heart health, improve immunity and build resilience."
-    ),
-}
+# What improving each pillar does for you: content/coaching.json "pillar_outcomes",
+# served aligned by pillar ID (pillars.texts().outcomes)
 
 def pillar_detail_prompt(pillar: str) -> str:
-    human = PILLARS.get(pillar, {}).get("label", pillar.title())
+    human = pillar_label(pillar)
     related = related_concerns_for_pillar(pillar)
     programme_hint = f"the eity20 programme for *{human}*"
     return (
@@ -708,55 +670,13 @@ def pillar_detail_prompt(pillar: str) -> str:
         f"2) Start {programme_hint} to see what the programme covers.\n"
         f"3) If you’d like suggestions, say **general tips** and I can share some helpful advice with you.\n"
         f"4) Set a SMARTS goal for {human.lower()} — just type *goal*.\n\n"
-        f"{PILLAR_OUTCOMES.get(pillar, '')}"
+        f"{pillar_outcome(pillar)}"
     )
 
-# --- SMARTS goal suggestions by pillar ---------------------------------------
-SUGGESTED_GOALS = {
-    "sleep": [
-        "Lights out by 10:30pm on weeknights",
-        "No screens after 10pm; read 5–10 minutes instead",
-        "Out of bed within 15 minutes of waking"
-    ],
-    "nutrition": [
-        "Add a palm-sized protein to lunch daily",
-        "Eat a high-fibre breakfast 5 days/week",
-        "Close the kitchen at 9pm on weeknights"
-    ],
-    "movement": [
-        "10-minute walk after lunch on workdays",
-        "Strength routine (2 sets) on Mon/Wed/Fri",
-        "Stand up and stretch every hour 9–5"
-    ],
-    "stress": [
-        "2 minutes of slow breathing at 3pm daily",
-        "Write tomorrow’s top 1 task at 6pm",
-        "10-minute wind-down walk after work"
-    ],
-    "thoughts": [
-        "Do a 2-minute ‘name the thought + reframe’ once daily",
-        "Write 1 helpful counter-thought each morning",
-        "3 gratitudes before bed on weeknights"
-    ],
-    "emotions": [
-        "Urge surf for 90 seconds before snacking",
-        "Label the feeling once per day",
-        "3-minute body scan after lunch daily"
-    ],
-    "environment": [
-        "Set clothes/water/shoes out the night before (Sun–Thu)",
-        "Prep tomorrow’s lunch at 8pm on weeknights",
-        "Homescreen: only essentials for 7 days"
-    ],
-    "social": [
-        "Send one ‘How are you?’ message every other day",
-        "Plan one 20-minute walk with a friend this week",
-        "Reply to messages within 24 hours for 5 days"
-    ],
-}
-
+# --- SMARTS goal suggestions by pillar: content/coaching.json "suggested_goals" ---
 def suggest_goals_for(pillar: str) -> list[str]:
-    return SUGGESTED_GOALS.get(pillar, SUGGESTED_GOALS["nutrition"])
+    goals = pillar_texts().goals
+    return list(goals[PILLAR_IDS.get(pillar, PILLAR_IDS["nutrition"])] or goals[PILLAR_IDS["nutrition"]])
 
 # --- Advice intent (first-contact) -------------------------------------------
 ADVICE_INTENT_TERMS = {
@@ -781,78 +701,338 @@ def advice_opening_message() -> str:
         "If it’s for you, tell me your focus (e.g., sleep, nutrition, movement, stress) or say **baseline** to set a SMARTS goal."
     )
 
+# Direct pillar keywords (checked in order; first matching pillar wins)
+PILLAR_KEYWORDS: list[tuple[tuple[str, ...], str]] = [
+    (("environment", "structure", "routine", "organise", "organize"), "environment"),
+    (("nutrition", "gut", "food", "diet", "ibs", "bloating"), "nutrition"),
+    (("sleep", "insomnia", "tired", "can't sleep", "cant sleep"), "sleep"),
+    (("exercise", "movement", "workout", "walk", "steps"), "movement"),
+    (("stress", "stressed", "anxiety", "anxious", "overwhelmed"), "stress"),
+    (("thought", "mindset", "self-talk", "self talk", "motivation"), "thoughts"),
+    (("emotion", "feelings", "craving", "urge", "binge", "comfort eat", "comfort-eat"), "emotions"),
+    (("social", "connection", "friends", "lonely", "isolation", "isolated"), "social"),
+]
+
+# Fallback normalisation when the user picks a lifestyle area in their own words
+LIFESTYLE_PILLAR_MAP = {
+    # environment cluster
+    "environment": "environment", "structure": "environment", "routine": "environment",
+    "organize": "environment", "organise": "environment",
+
+    # nutrition cluster
+    "nutrition": "nutrition", "gut": "nutrition", "food": "nutrition", "diet": "nutrition",
+    "ibs": "nutrition", "bloating": "nutrition",
+
+    # sleep
+    "sleep": "sleep", "insomnia": "sleep",
+
+    # movement
+    "exercise": "movement", "movement": "movement", "walk": "movement", "steps": "movement",
+    "workout": "movement",
+
+    # stress
+    "stress": "stress",
+
+    # thoughts
+    "thoughts": "thoughts", "mindset": "thoughts", "self talk": "thoughts", "self-talk": "thoughts",
+    "motivation": "thoughts",
+
+    # emotions
+    "emotions": "emotions", "emotion": "emotions",
+
+    # social
+    "social": "social", "connection": "social", "friends": "social", "lonely": "social",
+    "isolation": "social", "isolated": "social",
+}
+
 # ==================================================
-# Unified router
+# Compiled keyword matcher (built once at import)
 # ==================================================
-def route_message(user_id: str, text: str) -> dict:
-    lower = (text or "").strip().lower()
-    now = datetime.now(timezone.utc)
-    tag = f"\n\n{EITY20_TAGLINE}" if 'EITY20_TAGLINE' in globals() else ""
+# Every routing table is compiled into one Aho-Corasick automaton, so a single pass
+# over the message finds all hits. Payloads are table positions, so "first match wins"
+# ordering is preserved by taking the smallest index.
+CONCERN_TO_PILLARS_ITEMS = list(CONCERN_TO_PILLARS.items())
+LIFESTYLE_PILLAR_ITEMS = list(LIFESTYLE_PILLAR_MAP.items())
+
+def _build_routing_matcher() -> PhraseMatcher:
+    m = PhraseMatcher()
+    m.add_table("safety", [(SAFETY_TERMS, None)])
+    m.add_table("concern", [(aliases, i) for i, (aliases, _) in enumerate(CONCERN_ALIASES)])
+    m.add_table("priority", [(aliases, i) for i, (aliases, _) in enumerate(PRIORITY_MAP)])
+    m.add_table("concern_pillars", [((k,), i) for i, (k, _) in enumerate(CONCERN_TO_PILLARS_ITEMS)])
+    m.add_table("intent", [(words, i) for i, (words, _) in enumerate(INTENT_KEYWORDS)])
+    m.add_table("program", [(aliases, i) for i, (aliases, _) in enumerate(PROGRAM_ALIASES)])
+    m.add_table("pillar_kw", [(words, i) for i, (words, _) in enumerate(PILLAR_KEYWORDS)])
+    m.add_table("lifestyle", [((k,), i) for i, (k, _) in enumerate(LIFESTYLE_PILLAR_ITEMS)])
+    return m.build()
+
+ROUTING_MATCHER = _build_routing_matcher()
+
+def scan_routing(text: str) -> dict:
+    """One pass over the text → {table: {indexes}} for every routing table."""
+    return ROUTING_MATCHER.scan(text)
+
+def _first_hit(hits: dict, table: str) -> int | None:
+    idxs = hits.get(table)
+    return min(idxs) if idxs else None
+
+class MessageFeatures:
+    """
+    Everything the router needs to know about one message, computed once per turn.
+    Detector results are memoised on first access; `classify_seconds` holds the time
+    spent scanning, so classification cost is measured in one place.
+    """
 
-    # --- A) First-message fast-path: if the user already asked for something, skip the intro
-    first_time = user_id not in LAST_SEEN
-    if first_time:
-        # direct commands
-        if lower in {"advice", "tip", "tips"}:
-            set_state(user_id, **{"await": "advice_topic"})
-            LAST_SEEN[user_id] = now
-            return {"reply": (
-                "What advice would you like?\n"
-                "You can say things like: worry/anxiety, sleep, food/nutrition, movement, low mood, IBS — "
-                "or another topic in your own words.\n\n"
-                "If you’re unsure, you can also type *baseline*."
-            )}
-
-        if lower in {"baseline", "start baseline", "start-baseline"}:
-            # (this is your existing direct-baseline block)
-            return start_baseline_now(user_id, text, now)  # helper wrapper you already have
-
-        # NEW: advice-like first message → show the warm advice opening (skip intro)
-        if is_advice_intent(text):
-            LAST_SEEN[user_id] = now
-            return {"reply": advice_opening_message()}
-        
-        # 1) health concern keywords (e.g., “cholesterol”, “ibs”, “type 2 diabetes”)
-        concern_key = match_concern_key(text)
-        if concern_key:
-            stack = detect_priority_stack(text) or [concern_key]
-            LAST_CONCERN[user_id] = {"key": concern_key, "stack": stack}
-            set_state(user_id, **{
-                "await": "concern_choice",
-                "concern": concern_key,
-                "first": stack[0],
-                "stack": stack,
-            })
-            LAST_SEEN[user_id] = now
-            return {"reply": make_concern_intro_reply(concern_key, stack, user_text=text) + tag}
-
-        # 2) lifestyle area mapping
-        pillar = map_intent_to_pillar(text)
-        if pillar:
-            set_state(user_id, **{"await": "pillar_detail", "pillar": pillar})
-            LAST_SEEN[user_id] = now
-            return {"reply": pillar_detail_prompt(pillar)}
-
-    # 0) Greetings — clean separation of first-time / return / long-gap
+    def __init__(self, text: str):
+        self.text = text or ""
+        self.lower = self.text.strip().lower()
+        self.tokens = self.lower.split()
+        self.classify_seconds = 0.0
+
+    @cached_property
+    def hits(self) -> dict:
+        t0 = time.perf_counter()
+        hits = scan_routing(self.lower)
+        self.classify_seconds += time.perf_counter() - t0
+        return hits
+
+    @cached_property
+    def safety_reply(self) -> str | None:
+        return _safety_reply(self.hits)
+
+    @cached_property
+    def concern_key(self) -> str | None:
+        return _concern_key(self.hits)
+
+    @cached_property
+    def priority_stack(self) -> list[str]:
+        return _priority_stack(self.hits)
+
+    @cached_property
+    def intent_pillar(self) -> str | None:
+        return _intent_pillar(self.hits)
+
+    @cached_property
+    def concern_pillars(self) -> list[str]:
+        return _concern_pillars(self.hits)
+
+    @cached_property
+    def program_key(self) -> str | None:
+        return _program_key(self.hits)
+
+    @cached_property
+    def keyword_pillar(self) -> str | None:
+        idx = _first_hit(self.hits, "pillar_kw")
+        return PILLAR_KEYWORDS[idx][1] if idx is not None else None
+
+    @cached_property
+    def lifestyle_pillar(self) -> str | None:
+        idx = _first_hit(self.hits, "lifestyle")
+        return LIFESTYLE_PILLAR_ITEMS[idx][1] if idx is not None else None
+
+    @cached_property
+    def advice_intent(self) -> bool:
+        return is_advice_intent(self.lower)
+
+    @cached_property
+    def wants_program_start(self) -> bool:
+        return wants_program_start(self.lower)
+
+# ==================================================
+# Unified router (dispatch tables)
+# ==================================================
+# Each turn only runs the handlers that can apply to it:
+#   1) first-contact handlers (users we have never seen)
+#   2) greetings / long-gap nudge, then safety (always)
+#   3) exact global commands, looked up by the whole message ("done", "baseline", ...)
+#   4) an in-progress baseline session (baseline_flow owns those turns)
+#   5) phrase-triggered globals ("start a ... programme", "lifestyle area")
+#   6) the handler registered for STATE[user_id]["await"]
+#   7) free-text routing, ending in the OpenAI fallback
+# A handler takes a Turn and returns a reply dict, or None to let the next one try.
+
+class Turn:
+    """One inbound message, as seen by the router handlers."""
+
+    def __init__(self, user_id: str, text: str, now: datetime | None = None, stream: bool = False,
+                 deadline: float | None = None):
+        self.user_id = user_id
+        self.text = text
+        self.stream = stream          # caller can take the LLM reply as a token stream
+        self.deadline = deadline      # time.monotonic() by which the turn should be answered
+        self.f = MessageFeatures(text)
+        self.lower = self.f.lower
+        self.now = now or datetime.now(timezone.utc)
+        self.tag = f"\n\n{EITY20_TAGLINE}"
+
+    @property
+    def state(self) -> dict:
+        return get_state(self.user_id)
+
+    def llm_budget(self) -> float:
+        """Seconds the LLM may take on this turn: LLM_BUDGET, or less if the deadline is nearer."""
+        if self.deadline is None:
+            return LLM_BUDGET
+        return min(LLM_BUDGET, self.deadline - time.monotonic())
+
+    def reply(self, body: str) -> dict:
+        LAST_SEEN[self.user_id] = self.now
+        return {"reply": body}
+
+    def reply_stream(self, chunks) -> dict:
+        """Reply whose text arrives as an iterator of chunks (only when self.stream)."""
+        LAST_SEEN[self.user_id] = self.now
+        return {"stream": chunks}
+
+FIRST_CONTACT_HANDLERS: list = []
+COMMAND_HANDLERS: dict[str, object] = {}    # { exact lowercased message: handler }
+PHRASE_HANDLERS: list = []
+AWAIT_HANDLERS: dict[str, object] = {}      # { STATE[user_id]["await"]: handler }
+FREE_TEXT_HANDLERS: list = []
+# Per-handler timings: { handler name: [calls, total seconds] }
+HANDLER_STATS: dict[str, list] = defaultdict(lambda: [0, 0.0])
+
+def first_contact(fn):
+    FIRST_CONTACT_HANDLERS.append(fn)
+    return fn
+
+def command(*phrases: str):
+    def register(fn):
+        for p in phrases:
+            COMMAND_HANDLERS[p] = fn
+        return fn
+    return register
+
+def phrase(fn):
+    PHRASE_HANDLERS.append(fn)
+    return fn
+
+def on_await(*states: str):
+    def register(fn):
+        for s in states:
+            AWAIT_HANDLERS[s] = fn
+        return fn
+    return register
+
+def free_text(fn):
+    FREE_TEXT_HANDLERS.append(fn)
+    return fn
+
+def run_handler(fn, turn: Turn) -> dict | None:
+    """Run one handler and record its timing."""
+    t0 = time.perf_counter()
+    try:
+        return fn(turn)
+    finally:
+        stats = HANDLER_STATS[fn.__name__]
+        stats[0] += 1
+        stats[1] += time.perf_counter() - t0
+
+def _handlers_for(turn: Turn):
+    if turn.user_id not in LAST_SEEN:
+        yield from FIRST_CONTACT_HANDLERS
+    yield greeting
+    yield safety
+    cmd = COMMAND_HANDLERS.get(turn.lower)
+    if cmd:
+        yield cmd
+    if _baseline_active(turn.user_id) or turn.lower == "reset baseline":
+        yield baseline_session
+    yield from PHRASE_HANDLERS
+    waiting = AWAIT_HANDLERS.get(turn.state.get("await"))
+    if waiting:
+        yield waiting
+    yield from FREE_TEXT_HANDLERS
+
+def route_message(user_id: str, text: str, stream: bool = False, deadline: float | None = None) -> dict:
+    """
+    Route one message and return {"reply": str}. With stream=True a turn that ends in
+    the OpenAI fallback returns {"stream": iterator of text chunks} instead. `deadline`
+    (time.monotonic()) caps the LLM budget; past it the fallback gives the canned reply.
+    """
+    with user_turn(user_id):
+        turn = Turn(user_id, text, stream=stream, deadline=deadline)
+        for fn in _handlers_for(turn):
+            out = run_handler(fn, turn)
+            if out is not None:
+                return out
+        return turn.reply("Sorry — I didn’t quite catch that.")
+
+ADVICE_TOPIC_PROMPT = (
+    "What advice would you like?\n\n"
+    "You can say things like: worry/anxiety, sleep, food/nutrition, movement, low mood, IBS — "
+    "or another topic in your own words.\n\n"
+    "If you’re unsure, you can also type *baseline*."
+)
+
+# --- 1) First-message fast-path: if the user already asked for something, skip the intro
+@first_contact
+def first_command(turn: Turn) -> dict | None:
+    # direct commands
+    if turn.lower in {"advice", "tip", "tips"}:
+        set_state(turn.user_id, **{"await": "advice_topic"})
+        return turn.reply(
+            "What advice would you like?\n"
+            "You can say things like: worry/anxiety, sleep, food/nutrition, movement, low mood, IBS — "
+            "or another topic in your own words.\n\n"
+            "If you’re unsure, you can also type *baseline*."
+        )
+    if turn.lower in {"baseline", "start baseline", "start-baseline"}:
+        return cmd_baseline(turn)
+    return None
+
+@first_contact
+def first_advice_intent(turn: Turn) -> dict | None:
+    # advice-like first message → show the warm advice opening (skip intro)
+    if not turn.f.advice_intent:
+        return None
+    return turn.reply(advice_opening_message())
+
+@first_contact
+def first_concern(turn: Turn) -> dict | None:
+    # health concern keywords (e.g., “cholesterol”, “ibs”, “type 2 diabetes”)
+    concern_key = turn.f.concern_key
+    if not concern_key:
+        return None
+    stack = turn.f.priority_stack or [concern_key]
+    LAST_CONCERN[turn.user_id] = {"key": concern_key, "stack": stack}
+    set_state(turn.user_id, **{
+        "await": "concern_choice",
+        "concern": concern_key,
+        "first": stack[0],
+        "stack": stack,
+    })
+    return turn.reply(make_concern_intro_reply(concern_key, stack, user_text=turn.text) + turn.tag)
+
+@first_contact
+def first_pillar(turn: Turn) -> dict | None:
+    # lifestyle area mapping
+    pillar = turn.f.intent_pillar
+    if not pillar:
+        return None
+    set_state(turn.user_id, **{"await": "pillar_detail", "pillar": pillar})
+    return turn.reply(pillar_detail_prompt(pillar))
+
+# --- 2) Greetings — clean separation of first-time / return / long-gap
+GREET_TRIGGERS = {
+    "hi", "hello", "hey", "hiya", "hi smartie", "hello smartie", "hey smartie"
+}
+
+def greeting(turn: Turn) -> dict | None:
+    user_id, lower = turn.user_id, turn.lower
     last = LAST_SEEN.get(user_id)
-    lower = (text or "").strip().lower()
-    
-    greet_triggers = {
-        "hi", "hello", "hey", "hiya", "hi smartie", "hello smartie", "hey smartie"
-    }
     is_plain_greeting = (
-        lower in greet_triggers
-        or any(lower.startswith(t) and len(lower.split()) <= 3 for t in greet_triggers)
+        lower in GREET_TRIGGERS
+        or any(lower.startswith(t) and len(turn.f.tokens) <= 3 for t in GREET_TRIGGERS)
     )
-    
+
     # Treat "first time" as "we've never shown the intro to this user in this deployment"
     first_time = not INTRO_SHOWN.get(user_id, False)
-    
+
     # A) True first-time users → show full onboarding once
     if first_time and (is_plain_greeting or not lower):
         INTRO_SHOWN[user_id] = True
-        LAST_SEEN[user_id] = now
-        intro = (
+        return turn.reply(
             "Hello, I'm Smartie. I am here to help you stay eity20 — "
             "80% consistent, 20% flexible, 100% human.\n\n"
             "How would you like me to support your health & wellbeing journey?\n"
@@ -862,617 +1042,701 @@ def route_message(user_id: str, text: str) -> dict:
             "• Type *baseline* for a 1-minute assessment\n\n"
             "Aim for 80% consistency, 20% flexibility — 100% human."
         )
-        return {"reply": intro}
-    
+
     # If it’s their first message but they typed a real request (not just “hi”),
     # don’t block them with the long intro; mark it shown and continue normally.
     if first_time:
         INTRO_SHOWN[user_id] = True
-        # (no return here; let the router continue to handle their request)
-    
+
     # B) Short welcome-back on simple greetings (any time)
     if is_plain_greeting:
-        LAST_SEEN[user_id] = now
-        return {"reply": (
+        return turn.reply(
             "Welcome back 👋\n\n"
             "What’s on your mind today — a health concern, a lifestyle habit, or would you like some advice?\n"
             "You can also say *baseline* to set a SMARTS goal now, or mention an area like *sleep*, *nutrition*, or *stress*."
-        )}
-    
+        )
+
     # C) Long gap (24h+) nudge — only if they didn’t just say “hi”
-    if last and (now - last) >= timedelta(hours=24):
-        LAST_SEEN[user_id] = now
-        return {"reply": (
+    if last and (turn.now - last) >= timedelta(hours=24):
+        return turn.reply(
             "Good to see you again 👋\n\n"
             "Remember: eity20 = 80% consistency, 20% flexibility — 100% human.\n"
             "How can I help?"
-        )}
+        )
+    return None
 
-    # 1) Safety first
-    s = safety_check_and_reply(text)
-    if s:
-        LAST_SEEN[user_id] = now
-        return {"reply": s}
-
-    # --- X) Free-form: “start a … programme” (no menu needed) ---
-    if wants_program_start(text):
-        # infer topic (e.g., "anxiety", "sleep", "nutrition", "movement")
-        topic = detect_topic_from_text(text) or "nutrition"
-        pillar = (
-            TOPIC_TO_PILLAR.get(topic)
-            or map_intent_to_pillar(topic)
-            or "nutrition"
+def safety(turn: Turn) -> dict | None:
+    s = turn.f.safety_reply
+    return turn.reply(s) if s else None
+
+# --- 3) Global commands ------------------------------------------------------
+@command("done", "i did it", "check in", "check-in", "log done", "logged")
+def cmd_done(turn: Turn) -> dict | None:
+    user_id = turn.user_id
+    # one check-in per day; "progress" and the summary both read it back from the tracker
+    log_done(user_id=user_id, now=turn.now)
+
+    g = get_goal(user_id)
+    if g:
+        return turn.reply((
+            "Nice work — logged for today! ✅\n"
+            f"Goal: “{g.text}” (Pillar: {g.pillar_key})\n"
+            "Say **progress** anytime to see the last 14 days."
+        ) + turn.tag)
+    return turn.reply("Logged! If you want this tied to a goal, say **goal** while we’re in a lifestyle area." + turn.tag)
+
+@command("progress", "summary", "stats")
+def cmd_progress(turn: Turn) -> dict | None:
+    return turn.reply(tracker_summary(turn.user_id, now=turn.now) + turn.tag)
+
+@command("history", "recent")
+def cmd_history(turn: Turn) -> dict | None:
+    logs = last_n_logs(turn.user_id, 5)
+    if not logs:
+        return turn.reply("No check-ins yet. Say **done** whenever you complete your goal today." + turn.tag)
+    lines = ["Recent check-ins:"] + [f"• {e.date.isoformat()}" for e in logs]
+    return turn.reply("\n".join(lines) + turn.tag)
+
+@command("what's my goal", "whats my goal", "show goal", "goal status")
+def cmd_goal_status(turn: Turn) -> dict | None:
+    # avoid stealing "goal" when we're setting one
+    if turn.state.get("await") in {"pillar_detail", "goal_text", "goal_pick"}:
+        return None
+    g = get_goal(turn.user_id)
+    if g:
+        return turn.reply((
+            f"Your goal: “{g.text}” (Pillar: {g.pillar_key}).\n"
+            "Aim for about **80% consistency** — we’re not chasing perfection."
+        ) + turn.tag)
+    return turn.reply("You don’t have an active goal yet. Say **goal** while we’re in a lifestyle area to set one." + turn.tag)
+
+@command("advice", "tips", "tip")
+def cmd_advice(turn: Turn) -> dict | None:
+    STATE[turn.user_id] = {"await": "advice_topic"}
+    return turn.reply(ADVICE_TOPIC_PROMPT)
+
+@command("baseline", "start baseline", "start-baseline")
+def cmd_baseline(turn: Turn) -> dict | None:
+    return start_baseline_now(turn.user_id, turn.text, turn.now)
+
+# --- 4) Baseline session in progress -----------------------------------------
+def _baseline_active(user_id: str) -> bool:
+    sess = BASELINE_SESSIONS.get(user_id)
+    return sess is not None and sess.active
+
+def baseline_session(turn: Turn) -> dict | None:
+    bl = handle_baseline(turn.user_id, turn.text)
+    return turn.reply(bl["reply"]) if bl is not None else None
+
+# --- 5) Phrase-triggered globals ---------------------------------------------
+@phrase
+def program_start(turn: Turn) -> dict | None:
+    # Free-form: “start a … programme” (no menu needed)
+    if not turn.f.wants_program_start:
+        return None
+    # infer topic (e.g., "anxiety", "sleep", "nutrition", "movement")
+    topic = detect_topic_from_text(turn.text) or "nutrition"
+    pillar = (
+        TOPIC_TO_PILLAR.get(topic)
+        or map_intent_to_pillar(topic)
+        or "nutrition"
+    )
+
+    # remember for follow-ups
+    LAST_CONCERN[turn.user_id] = {"topic": topic}
+
+    # human-friendly label, e.g. “an eity20 programme to reduce anxiety”
+    pitch = program_pitch(topic) or f"an eity20 programme for *{topic}*"
+
+    safety_note = (
+        "Heads-up: this isn’t a medical diagnostic service. "
+        "eity20 supports health & wellbeing via lifestyle change."
+    )
+    return turn.reply(
+        f"Brilliant — let’s begin {pitch}.\n"
+        f"{safety_note}\n\n"
+        + compose_reply(pillar, f"start programme: {topic}")
+    )
+
+LIFESTYLE_TRIGGERS = (
+    "lifestyle area",
+    "choose lifestyle area",
+    "pick a lifestyle area",
+    "pick an area",
+    "choose an area",
+    "lifestyle focus",
+    "lifestyle",
+)
+
+@phrase
+def lifestyle_area(turn: Turn) -> dict | None:
+    # Lifestyle area intent: ask which pillar they want
+    if not any(p in turn.lower for p in LIFESTYLE_TRIGGERS):
+        return None
+    pillar = turn.f.intent_pillar
+    if pillar:
+        # we detected the pillar → jump straight to the clarifier
+        set_state(turn.user_id, **{"await": "pillar_detail", "pillar": pillar})
+        return turn.reply(pillar_detail_prompt(pillar))
+    # couldn’t detect → show the menu prompt (so the user can pick one)
+    set_state(turn.user_id, **{"await": "lifestyle_pillar"})
+    return turn.reply(
+        "Which *lifestyle area* would you like to focus on?\n"
+        "• Environment & Structure\n"
+        "• Nutrition & Gut Health\n"
+        "• Sleep\n"
+        "• Exercise & Movement\n"
+        "• Stress Management\n"
+        "• Thought Patterns\n"
+        "• Emotional Regulation\n"
+        "• Social Connection\n\n"
+        "Type the area (e.g., *sleep*)."
+    )
+
+# --- 6) Await-state handlers -------------------------------------------------
+@on_await("advice_topic")
+def await_advice_topic(turn: Turn) -> dict | None:
+    user_id, text = turn.user_id, turn.text
+    topic_key = turn.f.program_key
+    if not topic_key:
+        return turn.reply(
+            "Thank you. Tell me in a few words what you would like help with "
+            "(e.g., anxiety, sleep, food, movement, IBS). Or type *baseline* if you’re not sure."
         )
-    
-        # remember for follow-ups
-        LAST_CONCERN[user_id] = {"topic": topic}
-    
-        # human-friendly label, e.g. “an eity20 programme to reduce anxiety”
-        pitch = program_pitch(topic) or f"an eity20 programme for *{topic}*"
-    
-        safety = (
-            "Heads-up: this isn’t a medical diagnostic service. "
-            "eity20 supports health & wellbeing via lifestyle change."
+
+    mapped_pillar = TOPIC_TO_PILLAR.get(topic_key) or map_intent_to_pillar(topic_key) or topic_key
+    LAST_CONCERN[user_id] = {
+        "topic": topic_key,       # user’s words (e.g., “stress”, “IBS”)
+        "pillar": mapped_pillar   # eity20 category (e.g., “stress” → stress pillar)
+    }
+
+    human_pillar = pillar_label(mapped_pillar)
+    focus_name   = display_for_menu(topic_key, mapped_pillar)
+    ck = LAST_CONCERN.get(user_id, {}).get("key")  # may be None
+    pitch = program_pitch_context(topic_key, concern_key=ck, user_text=text) \
+            or f"the eity20 programme for *{human_pillar}*"
+
+    set_state(user_id, **{"await": "advice_choice"})
+    return turn.reply(
+        f"Great — we can focus on *{focus_name}*.\n\n"
+        "What would you like to do next?\n"
+        f"1) Start {pitch}\n"
+        "2) Do a quick *baseline* to prioritise what matters most\n"
+        "3) Get *general advice* on this topic\n\n"
+        "Reply with **1**, **2**, or **3**."
+    )
+
+@on_await("advice_choice")
+def await_advice_choice(turn: Turn) -> dict | None:
+    # Follow-up menu for advice on a chosen topic (1/2/3)
+    cmd = turn.lower
+    if cmd not in {"1", "2", "3"}:
+        return None
+    user_id = turn.user_id
+    saved = LAST_CONCERN.get(user_id, {})
+
+    # Resolve the topic (user words) and the normalized pillar you’ll use for logic
+    topic  = (saved.get("topic") or "").strip()
+    pillar = (saved.get("pillar")
+              or TOPIC_TO_PILLAR.get(topic)
+              or map_intent_to_pillar(topic)
+              or "nutrition")
+
+    # Labels + display name (prefer user's words where possible)
+    human_pillar = pillar_label(pillar)
+    focus_name   = display_for_menu(topic, pillar)
+
+    # Programme pitch (fall back to pillar-name version)
+    ck = saved.get("key")  # may be None
+    pitch = program_pitch_context(topic or pillar, concern_key=ck, user_text=turn.text) \
+            or f"the eity20 programme for *{human_pillar}*"
+
+    clear_state(user_id)
+
+    if cmd == "1":
+        # Start the programme (short intro + playbook advice)
+        safety_note = ("(For information: this isn’t a medical diagnostic service. "
+                       "eity20 supports health & wellbeing via lifestyle change.)")
+        return turn.reply(
+            f"Brilliant — let’s begin {pitch}.\n{safety_note}\n\n"
+            + compose_reply(pillar, f"start programme: {focus_name}")
         )
-    
-        LAST_SEEN[user_id] = now
-        return {"reply": (
-            f"Brilliant — let’s begin {pitch}.\n"
-            f"{safety}\n\n"
-            + compose_reply(pillar, f"start programme: {topic}")
-        )}
-    
-    # 2) Tracking quick commands  (log "done" + show progress later)
-    if lower in {"done", "i did it", "check in", "check-in", "log done", "logged"}:
-        # 1) persist via your tracker (existing behaviour)
-        _ = log_done(user_id=user_id)
-    
-        # 2) also record a local tick so "progress" can report 14-day consistency
-        #    (avoid duplicate ticks on the same day)
-        today = now.date()
-        already_today = any((ts.date() == today) for ts in GOAL_LOG[user_id])
-        if not already_today:
-            GOAL_LOG[user_id].append(now)
-    
-        g = get_goal(user_id)
-        LAST_SEEN[user_id] = now
-        if g:
-            return {"reply": (
-                "Nice work — logged for today! ✅\n"
-                f"Goal: “{g.text}” (Pillar: {g.pillar_key})\n"
-                "Say **progress** anytime to see the last 14 days."
-            ) + tag}
-        return {"reply": "Logged! If you want this tied to a goal, say **goal** while we’re in a lifestyle area." + tag}
-        if lower in {"progress", "summary", "stats"}:
-            LAST_SEEN[user_id] = now
-            return {"reply": tracker_summary(user_id) + tag}
-
-    if lower in {"history", "recent"}:
-        logs = last_n_logs(user_id, 5)
-        LAST_SEEN[user_id] = now
-        if not logs:
-            return {"reply": "No check-ins yet. Say **done** whenever you complete your goal today." + tag}
-        lines = ["Recent check-ins:"] + [f"• {e.date.isoformat()}" for e in logs]
-        return {"reply": "\n".join(lines) + tag}
-
-    # Show goal status (avoid stealing "goal" when we're setting one)
-    if lower in {"what's my goal", "whats my goal", "show goal", "goal status"} \
-        and get_state(user_id).get("await") not in {"pillar_detail", "goal_text", "goal_pick"}:
-        g = get_goal(user_id)
-        LAST_SEEN[user_id] = now
-        if g:
-            return {"reply": (
-                f"Your goal: “{g.text}” (Pillar: {g.pillar_key}).\n"
-                "Aim for about **80% consistency** — we’re not chasing perfection."
-            ) + tag}
-        return {"reply": "You don’t have an active goal yet. Say **goal** while we’re in a lifestyle area to set one." + tag}
-
-    # 2.x Direct commands: advice / baseline (run early)
-    cmd = lower.strip()
-
-    # ---- Advice flow (mini state machine) ----
-    if cmd in {"advice", "tips", "tip"}:
-        STATE[user_id] = {"await": "advice_topic"}
-        LAST_SEEN[user_id] = now
-        return {"reply": (
-            "What advice would you like?\n\n"
-            "You can say things like: worry/anxiety, sleep, food/nutrition, movement, low mood, IBS — "
-            "or another topic in your own words.\n\n"
-            "If you’re unsure, you can also type *baseline*."
-        )}
-
-    waiting = STATE.get(user_id, {}).get("await")
-    if waiting == "advice_topic":
-        topic_key = detect_program_key(text)
-        if not topic_key:
-            LAST_SEEN[user_id] = now
-            return {"reply": (
-                "Thank you. Tell me in a few words what you would like help with "
-                "(e.g., anxiety, sleep, food, movement, IBS). Or type *baseline* if you’re not sure."
-            )}
-    
-        STATE.pop(user_id, None)  # clear state
-
-        mapped_pillar = TOPIC_TO_PILLAR.get(topic_key) or map_intent_to_pillar(topic_key) or topic_key
-        
-        LAST_CONCERN[user_id] = {
-            "topic": topic_key,       # user’s words (e.g., “stress”, “IBS”)
-            "pillar": mapped_pillar   # eity20 category (e.g., “stress” → stress pillar)
-        }
-        
-        human_pillar = PILLARS.get(mapped_pillar, {}).get("label", mapped_pillar.title())
-        focus_name   = display_for_menu(topic_key, mapped_pillar)
-        ck = LAST_CONCERN.get(user_id, {}).get("key")  # may be None
-        pitch = program_pitch_context(topic_key, concern_key=ck, user_text=text) \
-                or f"the eity20 programme for *{human_pillar}*"
-
-        set_state(user_id, **{"await": "advice_choice"})
-        
-        LAST_SEEN[user_id] = now
-        return {"reply": (
-            f"Great — we can focus on *{focus_name}*.\n\n"
-            "What would you like to do next?\n"
-            f"1) Start {pitch}\n"
-            "2) Do a quick *baseline* to prioritise what matters most\n"
-            "3) Get *general advice* on this topic\n\n"
-            "Reply with **1**, **2**, or **3**."
-        )}
-    
-    # Handle follow-up menu for advice on a chosen topic (1/2/3)
-    if get_state(user_id).get("await") == "advice_choice" and cmd in {"1", "2", "3"}:
-        saved = LAST_CONCERN.get(user_id, {})
-    
-        # Resolve the topic (user words) and the normalized pillar you’ll use for logic
-        topic  = (saved.get("topic") or "").strip()
-        pillar = (saved.get("pillar")
-                  or TOPIC_TO_PILLAR.get(topic)
-                  or map_intent_to_pillar(topic)
-                  or "nutrition")
-    
-        # Labels + display name (prefer user's words where possible)
-        human_pillar = PILLARS.get(pillar, {}).get("label", pillar.title())
-        focus_name   = display_for_menu(topic, pillar)  # <- NEW helper you added
-    
-        # Programme pitch (fall back to pillar-name version)
-        ck = LAST_CONCERN.get(user_id, {}).get("key")  # may be None
-        pitch = program_pitch_context(topic or pillar, concern_key=ck, user_text=text) \
-                or f"the eity20 programme for *{human_pillar}*"
-    
-        clear_state(user_id)
-        LAST_SEEN[user_id] = now
-    
-        if cmd == "1":
-            # Start the programme (short intro + playbook advice)
-            safety = ("(For information: this isn’t a medical diagnostic service. "
-                      "eity20 supports health & wellbeing via lifestyle change.)")
-            return {"reply": (
-                f"Brilliant — let’s begin {pitch}.\n{safety}\n\n"
-                + compose_reply(pillar, f"start programme: {focus_name}")
-            )}
-    
-        if cmd == "2":
-            # Quick baseline (your unified helper)
-            return start_baseline_now(user_id, text, now)
-    
-        if cmd == "3":
-            # General tips for this pillar/topic
-            extra = (
-                "\n\nEverything connects — improvements here support your mind, body and gut health.\n"
-                "Want a SMARTS goal to monitor progress? Type *goal*."
-            )
-            return {"reply": (
-                "Here are two small actions you can try today 👇\n"
-                f"(Focus: {focus_name} — Pillar: {human_pillar})\n\n"
-                + compose_reply(pillar, f"general advice: {focus_name}") + extra
-            )}
-    
-    # ------------------------------------------------------------
-    #  A) Direct command: BASELINE (run early)
-    # ------------------------------------------------------------
-    cmd = (text or "").strip().lower()
-    if cmd in {"baseline", "start baseline", "start-baseline"}:
-        # 1) Try to seed baseline with user's concern, if we have one
-        seed_key = None
-        saved = LAST_CONCERN.get(user_id)  # read BEFORE clearing
-        if saved:
-            seed_key = saved.get("key") or saved.get("topic")
-        seed_key = seed_key or match_concern_key(text)
-    
-        # 2) Clear context so baseline owns the conversation
-        LAST_CONCERN.pop(user_id, None)
-        STATE.pop(user_id, None)
-    
-        # 3) Start baseline (prefer new signature with seed; fallback to old)
-        try:
-            bl = handle_baseline(user_id, text, seed_concern_key=seed_key)  # preferred
-        except TypeError:
-            preface = f"We will keep *{human_label_for(seed_key)}* in mind.\n\n" if seed_key else ""
-            hb = handle_baseline(user_id, text) or ""
-            if isinstance(hb, dict):
-                hb = hb.get("reply", "")
-            bl = preface + hb
-    
-        if bl is not None:
-            LAST_SEEN[user_id] = now
-            # Normalize to the router’s shape
-            return bl if isinstance(bl, dict) else {"reply": bl}
-
-    # --- Lifestyle area intent: ask which pillar they want -------------------
-    if any(p in lower for p in [
-        "lifestyle area",
-        "choose lifestyle area",
-        "pick a lifestyle area",
-        "pick an area",
-        "choose an area",
-        "lifestyle focus",
-        "lifestyle",
-    ]):
-        set_state(user_id, **{"await": "lifestyle_pillar"})
-    
-        pillar = map_intent_to_pillar(text)
-        if pillar:
-            # we detected the pillar → jump straight to the clarifier
-            set_state(user_id, **{"await": "pillar_detail", "pillar": pillar})
-            LAST_SEEN[user_id] = now
-            return {"reply": pillar_detail_prompt(pillar)}
-        else:
-            # couldn’t detect → show the menu prompt (so the user can pick one)
-            LAST_SEEN[user_id] = now
-            return {"reply": (
-                "Which *lifestyle area* would you like to focus on?\n"
-                "• Environment & Structure\n"
-                "• Nutrition & Gut Health\n"
-                "• Sleep\n"
-                "• Exercise & Movement\n"
-                "• Stress Management\n"
-                "• Thought Patterns\n"
-                "• Emotional Regulation\n"
-                "• Social Connection\n\n"
-                "Type the area (e.g., *sleep*)."
-            )}
-            
-    # --- Handle the user's pillar choice (after we asked for a lifestyle area)
-    if get_state(user_id).get("await") == "lifestyle_pillar":
-        # allow quick jump to baseline at any time
-        if "baseline" in lower:
-            set_state(user_id, **{"await": None})
-            LAST_SEEN[user_id] = now
-            bl = handle_baseline(user_id, text)
-            if bl is not None:
-                return bl
-
-        # try your existing mapper first (env/sleep/etc.)
-        pillar = map_intent_to_pillar(text)
-
-        # fallback normalisation for common variants
-        if not pillar:
-            pillar_map = {
-                # environment cluster
-                "environment": "environment", "structure": "environment", "routine": "environment",
-                "organize": "environment", "organise": "environment",
-
-                # nutrition cluster
-                "nutrition": "nutrition", "gut": "nutrition", "food": "nutrition", "diet": "nutrition",
-                "ibs": "nutrition", "bloating": "nutrition",
-
-                # sleep
-                "sleep": "sleep", "insomnia": "sleep",
-
-                # movement
-                "exercise": "movement", "movement": "movement", "walk": "movement", "steps": "movement",
-                "workout": "movement",
-
-                # stress
-                "stress": "stress",
-
-                # thoughts
-                "thoughts": "thoughts", "mindset": "thoughts", "self talk": "thoughts", "self-talk": "thoughts",
-                "motivation": "thoughts",
-
-                # emotions
-                "emotions": "emotions", "emotion": "emotions",
-
-                # social
-                "social": "social", "connection": "social", "friends": "social", "lonely": "social",
-                "isolation": "social", "isolated": "social",
-            }
-            for k in pillar_map:
-                if k in lower:
-                    pillar = pillar_map[k]
-                    break
 
-        if not pillar:
-            LAST_SEEN[user_id] = now
-            return {"reply": (
-                "I didn’t catch that pillar. Please type one of: environment, nutrition, sleep, "
-                "movement, stress, thoughts, emotions, or social."
-            )}
+    if cmd == "2":
+        # Quick baseline (your unified helper)
+        return start_baseline_now(user_id, turn.text, turn.now)
 
-        # >>> NEW: jump to your tailored clarifier
-        set_state(user_id, **{"await": "pillar_detail", "pillar": pillar})
-        LAST_SEEN[user_id] = now
-        return {"reply": pillar_detail_prompt(pillar)}
-
-    # --- Follow-up after pillar choice: habit vs health concern (clarifier path)
-    if get_state(user_id).get("await") == "pillar_detail":
-        chosen = get_state(user_id).get("pillar") or map_intent_to_pillar(text) or "nutrition"
-        human_label = PILLARS.get(chosen, {}).get("label", chosen.title())
-
-        # NEW: set a SMARTS goal now (pillar-specific + quick picks)
-        if any(k in lower for k in {"goal", "set goal", "smart goal", "set a goal"}):
-            set_state(user_id, **{"await": "goal_text", "pillar": chosen})
-            LAST_SEEN[user_id] = now
-        
-            opts = suggest_goals_for(chosen)  # uses your SUGGESTED_GOALS helper
-            return {"reply": (
-                f"Let’s set a SMARTS goal for *{human_label}*.\n"
-                "Pick one to start or write your own:\n"
-                f"1) {opts[0]}\n"
-                f"2) {opts[1]}\n"
-                f"3) {opts[2]}\n\n"
-                "Reply **1**, **2**, or **3** — or type your own in your words."
-            )}
-
-        # allow quick jump to baseline
-        if "baseline" in lower:
-            set_state(user_id, **{"await": None})
-            LAST_SEEN[user_id] = now
-            bl = handle_baseline(user_id, text)
-            if bl is not None:
-                return bl
-
-        # --- Track progress over the last 14 days (with encouragement tiers) ---------
-        if "progress" in lower:
-            # Pull completions and compute 14-day consistency
-            completions = GOAL_LOG.get(user_id, [])
-            cutoff = now.date() - timedelta(days=14)
-            last_14 = [ts for ts in completions if ts.date() >= cutoff]
-            count = len(last_14)
-            percent = round((count / 14) * 100) if count else 0
-        
-            # Encouragement tiers
-            if percent >= 80:
-                encouragement = (
-                    "Fantastic — you’re right around the eity20 sweet spot. "
-                    "Keep doing what’s working and bank the routine!"
-                )
-            elif percent >= 50:
-                encouragement = (
-                    "Solid momentum — you’re over halfway. "
-                    "What’s one small tweak that would bump you +10% this week?"
-                )
-            elif count == 0:
-                encouragement = (
-                    "Everyone starts at 0. Let’s make it easy: pick a tiny version of your goal "
-                    "(or say **goal** to set a simpler one)."
-                )
-            else:  # 1–49%
-                encouragement = (
-                    "Good start — small steps stick. "
-                    "What would make this 10% easier this week (time, reminder, smaller step)?"
-                )
-        
-            return {"reply": (
-                f"You’ve completed your goal on {count} of the last 14 days "
-                f"— that’s about {percent}% consistency.\n\n"
-                f"{encouragement}\n\n"
-                "The eity20 ethos is 80% consistency, 20% flexibility — 100% human.\n"
-                "Tip: reply **done** on days you do it; say **goal** to adjust your goal; "
-                "or ask for **general tips** for ideas."
-            )}
-        
-        # NEW: if they ask for general tips/suggestions, give pillar advice now
-        if any(k in lower for k in {"general tips", "tips", "advice", "suggestions"}):
-            set_state(user_id, **{"await": None})
-            LAST_SEEN[user_id] = now
-            extra = (
-                "\n\nEverything connects — improvements here support mood, stress, appetite and energy.\n"
-                "Would you like to set a SMARTS goal to track progress? Type *baseline*. "
-                "Or say *start* to begin the eity20 programme for this area."
+    # General tips for this pillar/topic
+    extra = (
+        "\n\nEverything connects — improvements here support your mind, body and gut health.\n"
+        "Want a SMARTS goal to monitor progress? Type *goal*."
+    )
+    return turn.reply(
+        "Here are two small actions you can try today 👇\n"
+        f"(Focus: {focus_name} — Pillar: {human_pillar})\n\n"
+        + compose_reply(pillar, f"general advice: {focus_name}") + extra
+    )
+
+def _jump_to_baseline(turn: Turn) -> dict | None:
+    # allow quick jump to baseline at any time
+    if "baseline" not in turn.lower:
+        return None
+    set_state(turn.user_id, **{"await": None})
+    LAST_SEEN[turn.user_id] = turn.now
+    return handle_baseline(turn.user_id, turn.text)
+
+@on_await("lifestyle_pillar")
+def await_lifestyle_pillar(turn: Turn) -> dict | None:
+    # Handle the user's pillar choice (after we asked for a lifestyle area)
+    bl = _jump_to_baseline(turn)
+    if bl is not None:
+        return bl
+
+    # try the intent mapper first (env/sleep/etc.), then common variants
+    pillar = turn.f.intent_pillar or turn.f.lifestyle_pillar
+    if not pillar:
+        return turn.reply(
+            "I didn’t catch that pillar. Please type one of: environment, nutrition, sleep, "
+            "movement, stress, thoughts, emotions, or social."
+        )
+
+    # jump to the tailored clarifier
+    set_state(turn.user_id, **{"await": "pillar_detail", "pillar": pillar})
+    return turn.reply(pillar_detail_prompt(pillar))
+
+@on_await("pillar_detail")
+def await_pillar_detail(turn: Turn) -> dict | None:
+    # Follow-up after pillar choice: habit vs health concern (clarifier path)
+    user_id, lower, now = turn.user_id, turn.lower, turn.now
+    chosen = turn.state.get("pillar") or turn.f.intent_pillar or "nutrition"
+    human_label = pillar_label(chosen)
+
+    # set a SMARTS goal now (pillar-specific + quick picks)
+    if any(k in lower for k in {"goal", "set goal", "smart goal", "set a goal"}):
+        set_state(user_id, **{"await": "goal_text", "pillar": chosen})
+        opts = suggest_goals_for(chosen)
+        return turn.reply(
+            f"Let’s set a SMARTS goal for *{human_label}*.\n"
+            "Pick one to start or write your own:\n"
+            f"1) {opts[0]}\n"
+            f"2) {opts[1]}\n"
+            f"3) {opts[2]}\n\n"
+            "Reply **1**, **2**, or **3** — or type your own in your words."
+        )
+
+    bl = _jump_to_baseline(turn)
+    if bl is not None:
+        return bl
+
+    # --- Track progress over the last 14 days (with encouragement tiers) ---------
+    if "progress" in lower:
+        # 14-day consistency from the tracker's check-ins
+        count = recent_count(user_id, 14, now=now)
+        percent = round((count / 14) * 100) if count else 0
+
+        # Encouragement tiers
+        if percent >= 80:
+            encouragement = (
+                "Fantastic — you’re right around the eity20 sweet spot. "
+                "Keep doing what’s working and bank the routine!"
             )
-            return {"reply": compose_reply(chosen, f"general tips for {chosen}") + extra + tag}
-        
-        # If they named a health concern, branch to the concern/programme path
-        concern_key = match_concern_key(text)
-        if concern_key:
-            LAST_CONCERN[user_id] = {"key": concern_key}
-            set_state(user_id, **{"await": None})
-            LAST_SEEN[user_id] = now
-            prog_key = detect_program_key(text) or concern_key
-            return {"reply": (
-                f"Thank you - I heard *{human_label_for(concern_key)}*.\n"
-                "Would you like to:\n"
-                f"1) Start {program_pitch(prog_key)} (type: *start*)\n"
-                "2) Do a 1-minute *baseline* to prioritise\n"
-                "3) Or get *advice* for today?\n"
-                f"{EITY20_TAGLINE}"
-            )}
-    
-        # Otherwise treat their message as habit/context → focused advice
+        elif percent >= 50:
+            encouragement = (
+                "Solid momentum — you’re over halfway. "
+                "What’s one small tweak that would bump you +10% this week?"
+            )
+        elif count == 0:
+            encouragement = (
+                "Everyone starts at 0. Let’s make it easy: pick a tiny version of your goal "
+                "(or say **goal** to set a simpler one)."
+            )
+        else:  # 1–49%
+            encouragement = (
+                "Good start — small steps stick. "
+                "What would make this 10% easier this week (time, reminder, smaller step)?"
+            )
+
+        return turn.reply(
+            f"You’ve completed your goal on {count} of the last 14 days "
+            f"— that’s about {percent}% consistency.\n\n"
+            f"{encouragement}\n\n"
+            "The eity20 ethos is 80% consistency, 20% flexibility — 100% human.\n"
+            "Tip: reply **done** on days you do it; say **goal** to adjust your goal; "
+            "or ask for **general tips** for ideas."
+        )
+
+    # if they ask for general tips/suggestions, give pillar advice now
+    if any(k in lower for k in {"general tips", "tips", "advice", "suggestions"}):
         set_state(user_id, **{"await": None})
-        LAST_SEEN[user_id] = now
-        connection = (
-            "\n\nEverything links together — gains here can improve your mood, stress and overall health.\n"
-            "Want a SMARTS goal to monitor progress? Type *baseline*. "
-            "You can also *start* the eity20 programme for this area."
+        extra = (
+            "\n\nEverything connects — improvements here support mood, stress, appetite and energy.\n"
+            "Would you like to set a SMARTS goal to track progress? Type *baseline*. "
+            "Or say *start* to begin the eity20 programme for this area."
         )
-        return {"reply": compose_reply(chosen, text) + connection + tag}
-
-        # Optional: mid-conversation broad advice request → advice opening
-        if is_advice_intent(text):
-            LAST_SEEN[user_id] = now
-            return {"reply": advice_opening_message()}
-
-    # --- Capture the user's goal text (or suggest options if unsure) -------------
-    if get_state(user_id).get("await") == "goal_text":
-        goal_text = (text or "").strip()
-        pillar = get_state(user_id).get("pillar", "nutrition")
-        human_label = PILLARS.get(pillar, {}).get("label", pillar.title())
-
-        # If they ask a question / seem unsure, offer suggestions
-        unsure = (
-            goal_text.endswith("?")
-            or any(k in goal_text.lower() for k in [
-                "what do you think", "not sure", "don't know", "dont know",
-                "help", "suggest", "idea", "which", "how should"
-            ])
+        return turn.reply(compose_reply(chosen, f"general tips for {chosen}") + extra + turn.tag)
+
+    # If they named a health concern, branch to the concern/programme path
+    concern_key = turn.f.concern_key
+    if concern_key:
+        LAST_CONCERN[user_id] = {"key": concern_key}
+        set_state(user_id, **{"await": None})
+        prog_key = turn.f.program_key or concern_key
+        return turn.reply(
+            f"Thank you - I heard *{human_label_for(concern_key)}*.\n"
+            "Would you like to:\n"
+            f"1) Start {program_pitch(prog_key)} (type: *start*)\n"
+            "2) Do a 1-minute *baseline* to prioritise\n"
+            "3) Or get *advice* for today?\n"
+            f"{EITY20_TAGLINE}"
         )
-        if unsure or len(goal_text.split()) <= 2:
-            options = get_state(user_id).get("opts") or suggest_goals_for(pillar)
-            set_state(user_id, **{"await": "goal_pick", "pillar": pillar, "opts": options})
-            LAST_SEEN[user_id] = now
-            return {"reply": (
-                f"Here are a few SMARTS goal ideas for *{human_label}*:\n"
-                f"1) {options[0]}\n"
-                f"2) {options[1]}\n"
-                f"3) {options[2]}\n\n"
-                "Reply with **1**, **2**, or **3** to pick one — or type your own in your words."
-            )}
-
-        if get_state(user_id).get("await") == "goal_pick":
-            user_input  = (text or "").strip()
-            pillar      = get_state(user_id).get("pillar", "nutrition")
-            human_label = PILLARS.get(pillar, {}).get("label", pillar.title())
-        
-            if user_input in {"1","2","3"}:
-                options = get_state(user_id).get("opts") or suggest_goals_for(pillar)
-                idx = int(user_input) - 1
-                goal_text = options[idx] if 0 <= idx < len(options) else options[0]
-            else:
-                goal_text = user_input
-            
-            # Fallback if user typed nothing or just spaces
-            used_fallback = False
-            if not goal_text.strip():
-                options = get_state(user_id).get("opts") or suggest_goals_for(pillar)
-                goal_text = options[0]
-                used_fallback = True
-        
-            try:
-                from tracker import set_goal as tracker_set_goal  # optional
-                tracker_set_goal(user_id=user_id, text=goal_text, pillar_key=pillar, cadence="most days")
-                saved_via_tracker = True
-            except Exception:
-                saved_via_tracker = False
-        
-            if not saved_via_tracker:
-                PENDING_GOALS[user_id] = {"text": goal_text, "pillar": pillar, "cadence": "most days"}
-        
-            clear_state(user_id)
-            LAST_SEEN[user_id] = now
-            
-            reply_text = (
-                f"Goal saved: “{goal_text}” (Pillar: {human_label}).\n"
-                "Aim for about **80% consistency** — the eity20 way.\n"
-                "To track it: reply **done** on days you do it, and **progress** anytime to see your last 14 days.\n\n"
-                "Want a couple of helpful tips for this area? Say **general tips**."
-            )
-            
-            if used_fallback:
-                reply_text = (
-                    f"You didn’t type a goal, so I’ve chosen a default one for you:\n"
-                    f"“{goal_text}” (Pillar: {human_label}).\n\n"
-                    "Aim for about **80% consistency** — the eity20 way.\n"
-                    "To track it: reply **done** on days you do it, and **progress** anytime to see your last 14 days.\n\n"
-                    "Want a couple of helpful tips for this area? Say **general tips**."
-                )
-            
-            return {"reply": reply_text}
-
-    # 3) Human menu triggers for open-ended requests
-    MENU_TRIGGERS = {
-        "help", "support", "change my lifestyle", "change my life",
-        "improve my lifestyle", "get healthier", "where do i start"
-    }
-    if any(phrase in lower for phrase in MENU_TRIGGERS):
-        LAST_SEEN[user_id] = now
-        return {"reply": (
-            "I completely understand. We’ll use eity20’s 8 pillars to prevent ill health and for lasting health & wellbeing.\n\n"
-            "How would you like to begin?\n"
-            "• Type a *health concern* (e.g., cholesterol, depression, IBS)\n"
-            "• Type a *lifestyle area* (e.g., sleep, nutrition, movement, stress)\n"
-            "• Type *advice* for general tips\n"
-            "• Type *baseline* for a 1-minute assessment\n\n"
-            "Aim for 80% consistency, 20% flexibility — 100% human."
-        )}
-
-    # 4) Concern-first (if the message clearly contains a priority concern)
-    stack = detect_priority_stack(text)
-    if stack:
-        key = match_concern_key(text) or "blood sugar"
-        LAST_CONCERN[user_id] = {"key": key, "stack": stack}
-        set_state(user_id, **{
-            "await": "concern_choice",
-            "concern": key,
-            "first": stack[0],
-            "stack": stack,
-        })
-        LAST_SEEN[user_id] = now
-        return {"reply": make_concern_intro_reply(key, stack, user_text=text) + tag}
 
-    # 5) Pillar advice (direct keyword routing)
-    if any(k in lower for k in ["environment", "structure", "routine", "organise", "organize"]):
-        LAST_SEEN[user_id] = now
-        return {"reply": compose_reply("environment", text)}
-    if any(k in lower for k in ["nutrition", "gut", "food", "diet", "ibs", "bloating"]):
-        LAST_SEEN[user_id] = now
-        return {"reply": compose_reply("nutrition", text)}
-    if any(k in lower for k in ["sleep", "insomnia", "tired", "can't sleep", "cant sleep"]):
-        LAST_SEEN[user_id] = now
-        return {"reply": compose_reply("sleep", text)}
-    if any(k in lower for k in ["exercise", "movement", "workout", "walk", "steps"]):
-        LAST_SEEN[user_id] = now
-        return {"reply": compose_reply("movement", text)}
-    if any(k in lower for k in ["stress", "stressed", "anxiety", "anxious", "overwhelmed"]):
-        LAST_SEEN[user_id] = now
-        return {"reply": compose_reply("stress", text)}
-    if any(k in lower for k in ["thought", "mindset", "self-talk", "self talk", "motivation"]):
-        LAST_SEEN[user_id] = now
-        return {"reply": compose_reply("thoughts", text)}
-    if any(k in lower for k in ["emotion", "feelings", "craving", "urge", "binge", "comfort eat", "comfort-eat"]):
-        LAST_SEEN[user_id] = now
-        return {"reply": compose_reply("emotions", text)}
-    if any(k in lower for k in ["social", "connection", "friends", "lonely", "isolation", "isolated"]):
-        LAST_SEEN[user_id] = now
-        return {"reply": compose_reply("social", text)}
+    # Otherwise treat their message as habit/context → focused advice
+    set_state(user_id, **{"await": None})
+    connection = (
+        "\n\nEverything links together — gains here can improve your mood, stress and overall health.\n"
+        "Want a SMARTS goal to monitor progress? Type *baseline*. "
+        "You can also *start* the eity20 programme for this area."
+    )
+    return turn.reply(compose_reply(chosen, turn.text, features=turn.f) + connection + turn.tag)
+
+@on_await("goal_text")
+def await_goal_text(turn: Turn) -> dict | None:
+    # Capture the user's goal text (or suggest options if unsure)
+    goal_text = (turn.text or "").strip()
+    state = turn.state
+    pillar = state.get("pillar", "nutrition")
+    human_label = pillar_label(pillar)
+
+    # If they ask a question / seem unsure, offer suggestions
+    unsure = (
+        goal_text.endswith("?")
+        or any(k in turn.lower for k in [
+            "what do you think", "not sure", "don't know", "dont know",
+            "help", "suggest", "idea", "which", "how should"
+        ])
+    )
+    if unsure or len(goal_text.split()) <= 2 and goal_text not in {"1", "2", "3"}:
+        options = state.get("opts") or suggest_goals_for(pillar)
+        set_state(turn.user_id, **{"await": "goal_pick", "pillar": pillar, "opts": options})
+        return turn.reply(
+            f"Here are a few SMARTS goal ideas for *{human_label}*:\n"
+            f"1) {options[0]}\n"
+            f"2) {options[1]}\n"
+            f"3) {options[2]}\n\n"
+            "Reply with **1**, **2**, or **3** to pick one — or type your own in your words."
+        )
 
-    # 6) Intent/concern mapper → pillar → playbook
-    pillar = map_intent_to_pillar(text)
-    if pillar:
-        LAST_SEEN[user_id] = now
-        return {"reply": compose_reply(pillar, text)}
+    # A pick from the list we just showed, or their own goal in their words
+    return await_goal_pick(turn)
+
+@on_await("goal_pick")
+def await_goal_pick(turn: Turn) -> dict | None:
+    user_id = turn.user_id
+    user_input  = (turn.text or "").strip()
+    state       = turn.state
+    pillar      = state.get("pillar", "nutrition")
+    human_label = pillar_label(pillar)
+    options     = state.get("opts") or suggest_goals_for(pillar)
+
+    if user_input in {"1", "2", "3"}:
+        idx = int(user_input) - 1
+        goal_text = options[idx] if 0 <= idx < len(options) else options[0]
+    else:
+        goal_text = user_input
 
-    pillars = suggest_pillars_for_concern(text)
-    if pillars:
-        labels = [PILLARS[p]["label"] for p in pillars if p in PILLARS]
-        suggestion = ", ".join(labels[:3]) or ", ".join(pillars[:3])
-        LAST_SEEN[user_id] = now
-        return {"reply": (
-            f"Thanks — that helps focus the right areas. These pillars usually help most: {suggestion}.\n"
-            f"Want to do a 1-minute baseline and pick one to start?\n{EITY20_TAGLINE}"
-        )}
+    # Fallback if user typed nothing or just spaces
+    used_fallback = False
+    if not goal_text.strip():
+        goal_text = options[0]
+        used_fallback = True
 
-    # 7) OpenAI fallback (short, warm, actionable, 80/20 tone)
-    sd = style_directive(text)
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": SMARTIE_SYSTEM_PROMPT},
-            {"role": "user", "content": f"{sd}\n\nUser: {text}"},
-        ],
-        max_tokens=420,
-        temperature=0.75,
+    try:
+        tracker_set_goal(user_id=user_id, text=goal_text, pillar_key=pillar, cadence="most days")
+        saved_via_tracker = True
+    except Exception:
+        saved_via_tracker = False
+
+    if not saved_via_tracker:
+        PENDING_GOALS[user_id] = {"text": goal_text, "pillar": pillar, "cadence": "most days"}
+
+    clear_state(user_id)
+
+    tail = (
+        "Aim for about **80% consistency** — the eity20 way.\n"
+        "To track it: reply **done** on days you do it, and **progress** anytime to see your last 14 days.\n\n"
+        "Want a couple of helpful tips for this area? Say **general tips**."
     )
-    LAST_SEEN[user_id] = now
-    return {"reply": resp.choices[0].message.content.strip() + tag}
-    
+    if used_fallback:
+        return turn.reply(
+            f"You didn’t type a goal, so I’ve chosen a default one for you:\n"
+            f"“{goal_text}” (Pillar: {human_label}).\n\n" + tail
+        )
+    return turn.reply(f"Goal saved: “{goal_text}” (Pillar: {human_label}).\n" + tail)
+
+# --- 7) Free-text routing ----------------------------------------------------
+# Human menu triggers for open-ended requests
+MENU_TRIGGERS = {
+    "help", "support", "change my lifestyle", "change my life",
+    "improve my lifestyle", "get healthier", "where do i start"
+}
+
+@free_text
+def menu(turn: Turn) -> dict | None:
+    if not any(p in turn.lower for p in MENU_TRIGGERS):
+        return None
+    return turn.reply(
+        "I completely understand. We’ll use eity20’s 8 pillars to prevent ill health and for lasting health & wellbeing.\n\n"
+        "How would you like to begin?\n"
+        "• Type a *health concern* (e.g., cholesterol, depression, IBS)\n"
+        "• Type a *lifestyle area* (e.g., sleep, nutrition, movement, stress)\n"
+        "• Type *advice* for general tips\n"
+        "• Type *baseline* for a 1-minute assessment\n\n"
+        "Aim for 80% consistency, 20% flexibility — 100% human."
+    )
+
+@free_text
+def concern_first(turn: Turn) -> dict | None:
+    # Concern-first (if the message clearly contains a priority concern)
+    stack = turn.f.priority_stack
+    if not stack:
+        return None
+    key = turn.f.concern_key or "blood sugar"
+    LAST_CONCERN[turn.user_id] = {"key": key, "stack": stack}
+    set_state(turn.user_id, **{
+        "await": "concern_choice",
+        "concern": key,
+        "first": stack[0],
+        "stack": stack,
+    })
+    return turn.reply(make_concern_intro_reply(key, stack, user_text=turn.text) + turn.tag)
+
+@free_text
+def pillar_keywords(turn: Turn) -> dict | None:
+    # Pillar advice (direct keyword routing), then intent/concern mapper → playbook
+    pillar = turn.f.keyword_pillar or turn.f.intent_pillar
+    if not pillar:
+        return None
+    return turn.reply(compose_reply(pillar, turn.text, features=turn.f))
+
+@free_text
+def concern_pillars(turn: Turn) -> dict | None:
+    keys = turn.f.concern_pillars
+    if not keys:
+        return None
+    labels = [pillar_label(p) for p in keys if p in PILLAR_IDS]
+    suggestion = ", ".join(labels[:3]) or ", ".join(keys[:3])
+    return turn.reply(
+        f"Thanks — that helps focus the right areas. These pillars usually help most: {suggestion}.\n"
+        f"Want to do a 1-minute baseline and pick one to start?\n{EITY20_TAGLINE}"
+    )
+
+# Each fallback turn gets LLM_BUDGET_S for the OpenAI call, retries included
+# (LLM_RETRIES, full-jitter backoff). LLM_BREAKER_FAILURES consecutive failures open
+# the breaker for LLM_BREAKER_RESET_S; meanwhile, and whenever the budget runs out,
+# the user gets a canned playbook reply instead of an error.
+LLM_BUDGET = float(os.getenv("LLM_BUDGET_S", "8"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_BREAKER = CircuitBreaker(
+    "llm",
+    failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("LLM_BREAKER_RESET_S", "30")),
+)
+LLM_RETRYABLE = (
+    openai.APITimeoutError, openai.APIConnectionError,
+    openai.RateLimitError, openai.InternalServerError, TimeoutError,
+)
+metrics.register_gauge("llm.breaker", LLM_BREAKER.stats)
+
+# Cache of fallback completions keyed on (style directive, normalised text); a hit
+# skips the OpenAI call and concurrent misses share one call. FALLBACK_CACHE_SIZE=0
+# turns caching off (coalescing stays on).
+FALLBACK_CACHE = ResponseCache(
+    max_entries=int(os.getenv("FALLBACK_CACHE_SIZE", "5000")),
+    max_bytes=int(float(os.getenv("FALLBACK_CACHE_MB", "8")) * 1024 * 1024),
+    ttl=float(os.getenv("FALLBACK_CACHE_TTL_S", "21600")),
+    flight_timeout=float(os.getenv("FALLBACK_COALESCE_TIMEOUT_S", str(LLM_BUDGET))),
+)
+metrics.register_gauge("fallback.cache", FALLBACK_CACHE.stats)
+
+# Recent fallback exchanges per user, so the LLM can answer follow-ups. Each prompt
+# carries at most CONVO_BUDGET_TOKENS of history: a summary of older turns plus the
+# newest ones. Deterministic flows are not recorded (they keep their own state), which
+# also keeps a user's first free-text question cacheable.
+CONVO = ConversationMemory(
+    max_messages=int(os.getenv("CONVO_MAX_MESSAGES", "12")),
+    max_message_tokens=int(os.getenv("CONVO_MESSAGE_TOKENS", "150")),
+    summary_tokens=int(os.getenv("CONVO_SUMMARY_TOKENS", "120")),
+    idle_ttl=float(os.getenv("CONVO_IDLE_MIN", "120")) * 60,
+    max_users=int(os.getenv("CONVO_MAX_USERS", "50000")),
+)
+CONVO_BUDGET = int(os.getenv("CONVO_BUDGET_TOKENS", "600"))
+metrics.register_gauge("convo", CONVO.stats)
+
+def fallback_messages(turn: Turn, sd: str) -> list[dict]:
+    """System prompt, then the user's conversation context, then the new line."""
+    summary, recent = CONVO.context(turn.user_id, CONVO_BUDGET)
+    messages = [{"role": "system", "content": SMARTIE_SYSTEM_PROMPT}]
+    if summary:
+        messages.append({"role": "system", "content": f"Earlier in this conversation: {summary}"})
+    messages += recent
+    messages.append({"role": "user", "content": f"{sd}\n\nUser: {turn.text}"})
+    return messages
+
+def record_prompt_tokens(messages: list[dict], reported: int | None = None) -> None:
+    n = reported if reported is not None else sum(estimate_tokens(m["content"]) for m in messages)
+    metrics.record("llm.prompt_tokens", n)
+
+def llm_complete(messages: list[dict], timeout: float | None = None) -> str:
+    c = get_llm().complete(messages, max_tokens=420, temperature=0.75, timeout=timeout)
+    record_prompt_tokens(messages, c.prompt_tokens)
+    return c.text
+
+def llm_complete_within_budget(messages: list[dict], budget: float | None = None) -> str:
+    return call_with_deadline(
+        lambda remaining: llm_complete(messages, timeout=remaining),
+        budget=LLM_BUDGET if budget is None else budget, retries=LLM_RETRIES,
+        breaker=LLM_BREAKER, retryable=LLM_RETRYABLE, name="llm",
+    )
+
+def canned_reply(turn: Turn) -> str:
+    """Deterministic stand-in for the LLM: playbook advice for a detectable pillar,
+    otherwise a TONE-based nudge (same message -> same reply)."""
+    f = turn.f
+    pillar = f.intent_pillar or f.keyword_pillar or f.lifestyle_pillar or next(iter(f.concern_pillars), None)
+    if pillar in PILLAR_IDS:
+        return compose_reply(pillar, turn.text, features=f)
+    i, tone = zlib.crc32(f.lower.encode("utf-8")), book().tone
+    return "\n".join([
+        tone["warm_ack"][i % len(tone["warm_ack"])],
+        tone["normalize"][i % len(tone["normalize"])],
+        "Pick one tiny action you can repeat this week — or type **advice** for ideas "
+        "or **baseline** to find your focus.",
+    ])
+
+def stream_fallback(turn: Turn, messages: list[dict], key):
+    """
+    Yield the fallback reply as it is generated: a cached reply in one piece, else
+    OpenAI tokens as they arrive, ending with the 80/20 reminder. Breaker and budget
+    apply as for the blocking call; if nothing arrived in time the canned reply is
+    sent instead. The full text is cached (context-free prompts only) and remembered.
+    """
+    sent = []
+    for piece in _stream_fallback(turn, messages, key):
+        sent.append(piece)
+        yield piece
+    CONVO.add_exchange(turn.user_id, turn.text, "".join(sent))
+
+def _stream_fallback(turn: Turn, messages: list[dict], key):
+    cached = FALLBACK_CACHE.get(key) if key is not None else None
+    if cached is not None:
+        yield cached + turn.tag
+        return
+    if not LLM_BREAKER.allow():
+        metrics.incr("llm.canned")
+        yield ensure_eity20_reminder(canned_reply(turn))
+        return
+    budget = turn.llm_budget()
+    deadline = time.monotonic() + budget
+    parts, chunks, outcome = [], None, None   # outcome: True ok, False failed, None no verdict
+    try:
+        if budget <= 0:
+            metrics.incr("llm.late")
+        else:
+            record_prompt_tokens(messages)
+            chunks = get_llm().stream(messages, max_tokens=420, temperature=0.75, timeout=budget)
+            for delta in chunks:
+                parts.append(delta)
+                yield delta
+                if time.monotonic() > deadline:
+                    metrics.incr("llm.timeouts")
+                    outcome = False
+                    break
+            else:
+                outcome = True
+                if key is not None:
+                    FALLBACK_CACHE.put(key, "".join(parts).strip())
+    except LLM_RETRYABLE:
+        metrics.incr("llm.timeouts")
+        outcome = False
+    except Exception:
+        traceback.print_exc()
+        metrics.incr("llm.errors")
+        outcome = False
+    finally:
+        # every exit settles the breaker once; a client that went away only frees the trial
+        if chunks is not None and hasattr(chunks, "close"):
+            chunks.close()
+        if outcome is True:
+            LLM_BREAKER.record_success()
+        elif outcome is False:
+            LLM_BREAKER.record_failure()
+        else:
+            LLM_BREAKER.release()
+    if not parts:
+        metrics.incr("llm.canned")
+        yield ensure_eity20_reminder(canned_reply(turn))
+        return
+    if EITY20_REMINDER.lower() not in "".join(parts).lower():
+        yield "\n\n" + EITY20_REMINDER
+
+@free_text
+def openai_fallback(turn: Turn) -> dict | None:
+    # OpenAI fallback (short, warm, actionable, 80/20 tone)
+    text = turn.text
+    sd = style_directive(text)
+    messages = fallback_messages(turn, sd)
+    # Only context-free prompts (no history) are cached and coalesced: with history
+    # the reply depends on more than the text.
+    key = FALLBACK_CACHE.key(text, sd) if len(messages) == 2 else None
+    if turn.stream:
+        return turn.reply_stream(stream_fallback(turn, messages, key))
+    budget = turn.llm_budget()
+    try:
+        if budget <= 0:
+            metrics.incr("llm.late")   # the turn's time went on waiting in the queue
+            raise DeadlineExceeded("turn deadline passed before the LLM call")
+        if key is None:
+            reply = llm_complete_within_budget(messages, budget)
+        else:
+            reply = FALLBACK_CACHE.get_or_call(key, lambda: llm_complete_within_budget(messages, budget),
+                                               timeout=budget)
+    except Exception as e:
+        # whatever kept the model from answering (budget, breaker, a 4xx, a bad
+        # response), the user still gets the playbook reply
+        if not isinstance(e, (UpstreamUnavailable, TimeoutError)):
+            traceback.print_exc()
+            metrics.incr("llm.errors")
+        metrics.incr("llm.canned")
+        reply = ensure_eity20_reminder(canned_reply(turn))
+        CONVO.add_exchange(turn.user_id, text, reply)
+        return turn.reply(reply)
+    CONVO.add_exchange(turn.user_id, text, reply)
+    return turn.reply(reply + turn.tag)
+
 # ==================================================
-# Flask app + OpenAI client
+# Flask app + LLM backend
 # ==================================================
 app = Flask(__name__)
 CORS(app)
 
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# The fallback's LLM is built on first use from LLM_BACKEND (see llm_backends.py):
+# the OpenAI API by default, or a local stand-in for load tests.
+_LLM: LLMBackend | None = None
+_LLM_LOCK = threading.Lock()
+
+def get_llm() -> LLMBackend:
+    global _LLM
+    if _LLM is None:
+        with _LLM_LOCK:
+            if _LLM is None:
+                _LLM = backend_from_env()
+    return _LLM
+
+def set_llm(backend: LLMBackend) -> None:
+    """Swap the fallback's LLM backend (e.g. at startup or in a benchmark)."""
+    global _LLM
+    with _LLM_LOCK:
+        _LLM = backend
 
 # ==================================================
 # Twilio WhatsApp setup
@@ -1497,15 +1761,149 @@ def send_wa(to_e164: str, body: str):
 # ---------------------------
 # WhatsApp inbound webhook
 # ---------------------------
-from flask import request, jsonify
+# The webhook only validates and enqueues; routing and the outbound send run on a
+# bounded pool sharded by user, so one user's messages keep their order and a slow
+# OpenAI turn never holds Twilio's request open (which is what made Twilio retry).
+WA_WORKERS    = int(os.getenv("WA_WORKERS", "16"))
+WA_QUEUE_SIZE = int(os.getenv("WA_QUEUE_SIZE", "256"))      # per worker
+# Each worker is one thread, so a turn's time counts from when the webhook got it: a
+# turn that waited behind a slow one gets only what is left of WA_TURN_BUDGET_S for
+# the LLM, and the canned reply once it is spent, so a backed-up shard catches up.
+WA_TURN_BUDGET = float(os.getenv("WA_TURN_BUDGET_S", str(LLM_BUDGET)))
+# Set TWILIO_VALIDATE_SIGNATURE=1 to reject requests without a valid X-Twilio-Signature.
+# Behind a proxy, TWILIO_WEBHOOK_URL is the public URL Twilio actually posts to.
+WA_VALIDATE_SIGNATURE = os.getenv("TWILIO_VALIDATE_SIGNATURE", "0") == "1"
+WA_WEBHOOK_URL = os.getenv("TWILIO_WEBHOOK_URL")
+wa_validator = RequestValidator(AUTH_TOKEN or "")
+
+def wa_signature_ok(flask_request) -> bool:
+    if not WA_VALIDATE_SIGNATURE:
+        return True
+    signature = flask_request.headers.get("X-Twilio-Signature", "")
+    url = WA_WEBHOOK_URL or flask_request.url
+    return bool(signature) and wa_validator.validate(url, flask_request.form.to_dict(), signature)
+
+# Reply mode: "rest" sends every reply with send_wa. "inline" waits up to
+# WA_INLINE_BUDGET_MS for the turn and returns the reply as TwiML in the webhook
+# response; only turns slower than that (e.g. the OpenAI fallback) go out over REST.
+WA_REPLY_MODE = os.getenv("WA_REPLY_MODE", "rest").strip().lower()
+WA_INLINE_BUDGET = float(os.getenv("WA_INLINE_BUDGET_MS", "1500")) / 1000
+
+class InlineReply:
+    """Hand-off between the webhook waiting on a turn and the worker running it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.text = None
+        self.abandoned = False
+
+    def offer(self, text: str) -> bool:
+        """Worker side: True if the webhook is still waiting and will deliver `text`."""
+        with self.lock:
+            if self.abandoned:
+                return False
+            self.text = text
+        self.done.set()
+        return True
+
+    def wait(self, timeout: float):
+        """Webhook side: the reply if it arrived in time, else None (worker sends it)."""
+        self.done.wait(timeout)
+        with self.lock:
+            if self.text is None:
+                self.abandoned = True
+            return self.text
+
+def twiml_reply(text: str) -> tuple:
+    r = MessagingResponse()
+    r.message(text)
+    return (str(r), 200, {"Content-Type": "text/xml"})
+
+def process_wa(from_num: str, body: str, received_at: float, inline: InlineReply = None):
+    """Worker side of the webhook: route the turn, then deliver the reply."""
+    user_id = f"wa:{from_num}"
+    result  = route_message(user_id, body, deadline=received_at + WA_TURN_BUDGET) or {}
+    reply_text = result.get("reply", "Sorry — I didn’t quite catch that.")
+    if inline is not None and inline.offer(reply_text):
+        metrics.incr("wa.inline")
+    else:
+        try:
+            send_wa(from_num, reply_text)
+            metrics.incr("wa.sent")
+        except Exception:
+            metrics.incr("wa.send_failed")
+            traceback.print_exc()
+    metrics.observe("wa.turn", time.monotonic() - received_at)
+
+WA_POOL = ShardedPool("wa", process_wa, shards=WA_WORKERS, queue_size=WA_QUEUE_SIZE)
+metrics.register_gauge("wa.pool", WA_POOL.stats)
+
+# Twilio retries a webhook it thinks failed, with the same MessageSid. Remember recent
+# SIDs (bounded) with the response we gave for WA_DEDUPE_WINDOW_S after each first
+# arrived (retries don't extend it), and answer retries without routing the turn again.
+WA_DEDUPE_WINDOW = float(os.getenv("WA_DEDUPE_WINDOW_S", "3600"))
+WA_DEDUPE_SIZE   = int(os.getenv("WA_DEDUPE_SIZE", "100000"))
+WA_SEEN = ExpiringDict(max_entries=WA_DEDUPE_SIZE, ttl=WA_DEDUPE_WINDOW,   # { MessageSid: (body, status) }
+                       sliding=False)
+WA_IN_FLIGHT = object()   # claimed, response not recorded yet
+WA_ACCEPTED = ("", 204)
+metrics.register_gauge("wa.dedupe", WA_SEEN.stats)
+
+def wa_claim(sid: str):
+    """
+    Claim a MessageSid for processing. Returns None for a first delivery, or the
+    response to give when this is a retry (or a duplicate still in flight).
+    """
+    if not sid or WA_SEEN.add(sid, WA_IN_FLIGHT):
+        return None
+    metrics.incr("wa.duplicate")
+    seen = WA_SEEN.get(sid, WA_ACCEPTED)
+    return WA_ACCEPTED if seen is WA_IN_FLIGHT else seen
+
+def wa_remember(sid: str, response: tuple) -> None:
+    if sid:
+        WA_SEEN[sid] = response
+
+def wa_release(sid: str) -> None:
+    """Drop an in-flight claim (the message wasn't taken), so a retry is processed."""
+    if sid and WA_SEEN.get(sid, touch=False) is WA_IN_FLIGHT:
+        WA_SEEN.pop(sid, None)
+
+# Goal reminders (see reminders.py) for WhatsApp users, due from their cadence and last
+# check-in. Off unless REMINDERS_ENABLED=1; enable it in one process only.
+REMINDERS_ENABLED = os.getenv("REMINDERS_ENABLED", "0") == "1"
+REMINDER_SCHEDULER = Scheduler(
+    send=send_wa,
+    address=lambda user_id: user_id[3:] if user_id.startswith("wa:") else None,
+    message=lambda goal: reminder_message(goal) + f"\n\n{EITY20_TAGLINE}",
+    hour_utc=int(os.getenv("REMINDER_HOUR_UTC", "18")),
+    batch=int(os.getenv("REMINDER_BATCH", "50")),
+    rate=float(os.getenv("REMINDER_RATE_PER_S", "10")),
+    max_unanswered=int(os.getenv("REMINDER_MAX_UNANSWERED", "3")),
+    idle_ttl=user_ttl(),
+)
+if REMINDERS_ENABLED:
+    on_change(REMINDER_SCHEDULER.schedule)
+    REMINDER_SCHEDULER.start()
+    metrics.register_gauge("reminders", REMINDER_SCHEDULER.stats)
 
 @app.route("/wa/webhook", methods=["POST"])
 def wa_webhook():
     """
     Twilio -> Smartie -> Twilio
     Expects x-www-form-urlencoded from Twilio's WhatsApp Sandbox/Number.
+    Acknowledges as soon as the message is queued and the reply goes out from a worker,
+    or, with WA_REPLY_MODE=inline, returns a fast turn's reply as TwiML.
     """
+    t0 = time.monotonic()
+    sid, queued = "", False
     try:
+        metrics.incr("wa.received")
+        if not wa_signature_ok(request):
+            metrics.incr("wa.bad_signature")
+            return jsonify({"error": "invalid signature"}), 403
+
         # 1) Read Twilio form fields safely
         from_num = (request.form.get("From") or "").replace("whatsapp:", "").strip()
         body     = (request.form.get("Body") or "").strip()
@@ -1514,26 +1912,46 @@ def wa_webhook():
             # Bad payload from source; reply 400 but don't crash
             return jsonify({"error": "missing From"}), 400
 
-        # 2) Route through Smartie brain
-        user_id = f"wa:{from_num}"
-        result  = route_message(user_id, body) or {}
-        reply_text = result.get("reply", "Sorry — I didn’t quite catch that.")
-
-        # 3) Send the reply back over WhatsApp (fire-and-forget)
-        try:
-            send_wa(from_num, reply_text)
-        except Exception:
-            # Log but still return 200/204 so Twilio doesn’t retry forever
-            traceback.print_exc()
-
-        # 4) MUST return a response to Twilio quickly (2xx)
-        # 204 = No Content (OK)
-        return ("", 204)
+        # 2) Twilio retry of a message we already took? Answer as we did the first time.
+        sid = request.form.get("MessageSid") or request.form.get("SmsMessageSid") or ""
+        cached = wa_claim(sid)
+        if cached is not None:
+            return cached
+
+        # 3) Hand the turn to the worker pool (same user -> same worker, in order)
+        inline = InlineReply() if WA_REPLY_MODE == "inline" else None
+        if not WA_POOL.submit(from_num, from_num, body, t0, inline):
+            # Shard is full: shed load rather than queue without bound,
+            # and forget the SID so a retry of this message gets processed.
+            wa_release(sid)
+            return jsonify({"error": "busy"}), 503
+        queued = True
+
+        # 4) Inline mode: a fast turn's reply rides back on this response as TwiML
+        if inline is not None:
+            text = inline.wait(max(0.0, WA_INLINE_BUDGET - (time.monotonic() - t0)))
+            if text is not None:
+                response = twiml_reply(text)
+                wa_remember(sid, response)
+                return response
+            metrics.incr("wa.inline_timeout")
+
+        # 5) MUST return a response to Twilio quickly (2xx)
+        # 204 = No Content (OK); the worker sends the reply over REST
+        wa_remember(sid, WA_ACCEPTED)
+        return WA_ACCEPTED
 
     except Exception as e:
-        # Safety net: never let the endpoint crash
+        # Safety net: never let the endpoint crash. A turn that never got queued gives
+        # up its SID so Twilio's retry is handled; a queued one is answered as accepted.
         traceback.print_exc()
+        if queued:
+            wa_remember(sid, WA_ACCEPTED)
+        else:
+            wa_release(sid)
         return jsonify({"error": str(e)}), 500
+    finally:
+        metrics.observe("wa.ack", time.monotonic() - t0)
 
 # ==================================================
 # Web JSON endpoint (/smartie)
@@ -1556,6 +1974,85 @@ def smartie_reply():
         traceback.print_exc()
         return jsonify({"reply": "Oops—something went wrong. Try again in a moment."}), 500
 
+# ==================================================
+# Streaming web endpoint (/smartie/stream, server-sent events)
+# ==================================================
+# Events: "token" {"text"} for each chunk of an LLM reply, "reply" {"reply"} for a
+# deterministic reply sent whole, then "done" {"reply": full text}; "error" on failure.
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route("/smartie/stream", methods=["POST"])
+def smartie_stream():
+    t0 = time.monotonic()
+    data = request.get_json(silent=True) or {}
+    user_input = data.get("message", "")
+    user_id = derive_user_id(data, request)
+
+    def events():
+        try:
+            result = route_message(user_id, user_input, stream=True)
+            if "stream" not in result:
+                metrics.observe("stream.ttft", time.monotonic() - t0)
+                yield sse("reply", {"reply": result.get("reply")})
+                yield sse("done", {"reply": result.get("reply")})
+                return
+            parts = []
+            for piece in result["stream"]:
+                if not parts:
+                    metrics.observe("stream.ttft", time.monotonic() - t0)
+                parts.append(piece)
+                yield sse("token", {"text": piece})
+            yield sse("done", {"reply": "".join(parts)})
+        except Exception:
+            traceback.print_exc()
+            yield sse("error", {"reply": "Oops—something went wrong. Try again in a moment."})
+        finally:
+            metrics.observe("stream.total", time.monotonic() - t0)
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ==================================================
+# Metrics (/metrics)
+# ==================================================
+def handler_timings() -> dict:
+    return {name: {"calls": calls, "mean_ms": round(secs / calls * 1000, 3) if calls else 0.0}
+            for name, (calls, secs) in list(HANDLER_STATS.items())}
+
+metrics.register_gauge("handlers", handler_timings)
+metrics.register_gauge("store", lambda: get_store().stats())
+
+# /metrics and /admin/* need X-Admin-Token: $ADMIN_TOKEN (both are off without it).
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def admin_ok(flask_request) -> bool:
+    token = flask_request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    if not admin_ok(request):
+        return jsonify({"error": "forbidden"}), 403
+    return jsonify(metrics.snapshot())
+
+# ==================================================
+# Content (content/*.json, see content_store.py)
+# ==================================================
+# POST /admin/content/reload (admin token) rebuilds the content in the background and
+# swaps it in; CONTENT_WATCH_S > 0 also polls the files for changes.
+CONTENT_WATCH_S = float(os.getenv("CONTENT_WATCH_S", "0"))
+if CONTENT_WATCH_S > 0:
+    CONTENT.watch(CONTENT_WATCH_S)
+metrics.register_gauge("content", CONTENT.stats)
+
+@app.route("/admin/content/reload", methods=["POST"])
+def content_reload():
+    if not admin_ok(request):
+        return jsonify({"error": "forbidden"}), 403
+    CONTENT.reload_async()
+    return jsonify({"status": "reloading", "version": CONTENT.current.version}), 202
+
 
 # ==================================================
 # Run app (dev/prod)
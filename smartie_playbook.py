@@ -1,135 +1,32 @@
 # smartie_playbook.py
+import re
+import unicodedata
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Tuple
+
+import pillars as registry
+from content_store import CONTENT, freeze
 
 EITY20_TAGLINE = "Aim for 80% consistency, 20% flexibility — 100% human."
 
 # -------------------------------------------------
 # Nutrition library (80% foundation / 20% flexibility)
 # -------------------------------------------------
+# The coaching content itself (PILLARS, TONE, FOCUS_OPTIONS, SPECIFIC_MAP,
+# NUTRITION_80/20 and the nutrition rules) lives in content/playbook.json and is
+# compiled into a Playbook on every (re)load; see content_store.py.
 
 def _norm(s: str) -> str:  # simple normaliser for keyword matching
     return (s or "").lower()
 
-NUTRITION_80 = {
-    "starchy_carbohydrates": {
-        "whole_grains": [
-            "brown rice","wild rice","corn","whole oats","quinoa","barley",
-            "rye","amaranth","buckwheat","spelt","sorghum","bulgur wheat","freekeh"
-        ],
-        "starchy_foods": [
-            "bread","crackers","rice cakes","oat cakes","breakfast cereal (Weetabix, Bran Flakes, All Bran)",
-            "popcorn","couscous","pasta","noodles"
-        ],
-        "fruit": [
-            "bananas","apples","kiwifruit","berries","mango","citrus fruits",
-            "pineapple","plums","raisins","dates"
-        ],
-        "vegetables": [
-            "parsnips","carrots","white potato","sweet potato","corn","peas","squash"
-        ],
-        "nutritional_benefits": [
-            "high fibre (gut health)","B vitamins (e.g. thiamine for energy & nerves)",
-            "folate (blood cells & nervous system)","magnesium (reduces fatigue)",
-            "copper (immune function)","antioxidants (vit C, E, flavonoids, polyphenols)"
-        ],
-        "health_benefits": [
-            "steady energy & blood sugar","improves gut health",
-            "supports mood, concentration, cognition; reduces brain fog",
-            "satiating; supports healthy cholesterol & heart health; lowers risk of T2D & bowel cancer"
-        ],
-    },
-
-    "protein": {
-        "lean_meat": ["chicken","turkey","beef (moderation)","lamb (moderation)","venison","pork (moderation)","veal","goat"],
-        "organ_meat": ["liver","kidney","heart"],
-        "oily_fish": ["salmon","trout","mackerel","sardines","whitebait"],
-        "dairy": ["milk","yoghurt","cheese","cream cheese"],
-        "dairy_alternatives": ["soya drinks","soya yoghurts","oat milk","nut milks","rice milk"],
-        "legumes": [
-            "beans (kidney, soybeans, chickpeas, butter, cannellini)",
-            "lentils (puy, green, brown, red, black)",
-            "peas (chickpeas, split peas, sweet peas, shelling peas)"
-        ],
-        "nutritional_benefits": [
-            "high-quality protein","fibre (legumes)","iron, zinc, selenium, calcium",
-            "B vitamins (B12, B6, B9, B2)","vitamins A, D",
-            "omega-3 fatty acids","taurine, creatine, carnitine, carnosine",
-            "tryptophan, tyrosine"
-        ],
-        "health_benefits": [
-            "muscle growth & repair; stronger tendons","reduces sarcopenia & bone loss",
-            "better sleep patterns","satiating (supports weight management)",
-            "tryptophan → serotonin/melatonin (mood & sleep)","tyrosine → dopamine & adrenaline (emotion & stress regulation; thyroid support)"
-        ],
-    },
-
-    "healthy_unsaturated_fat": {
-        "oily_fish": ["salmon","mackerel","sardines","anchovies","kippers","pilchards","trout","herring"],
-        "seeds": ["flax","chia","sesame","sunflower"],
-        "nuts": ["almonds","brazil nuts","walnuts","hazelnuts"],
-        "plant_oils": ["olive oil","rapeseed oil","flaxseed oil","soybean oil"],
-        "fortified_omega3": ["eggs","yoghurt","milk","soy beverages","bread","butter spreads"],
-        "fruit_veg_fats": ["avocados","olives","coconut"],
-        "nutritional_benefits": [
-            "fibre (seeds)","vitamin B12 & D (fish)","omega-3 & omega-6 fatty acids",
-            "MUFAs (olive oil, avocado)","PUFAs (walnuts, fish)","improves absorption of vitamins A, D, E, K"
-        ],
-        "health_benefits": [
-            "supports heart health (BP, clotting)","lower dementia risk (esp. Alzheimer’s)",
-            "improves cognition & working memory","benefits ADHD symptoms (attention, impulsivity)",
-            "regulates mood (depression)","eye health (reduced AMD risk)",
-            "reduces inflammation (e.g., RA, joint health)","may lower breast/colon cancer risk"
-        ],
-    },
-
-    "fruit_veg_target": {
-        "guidance": ["aim ≥5 portions/day; rich in antioxidants, nutrients & fibre for brain and body"]
-    },
-
-    "gut_brain_support": {
-        "examples": [
-            "antioxidants","omega-3 fatty acids","probiotics & prebiotics",
-            "high-fibre foods","fermented foods (sauerkraut, kimchi, Greek yoghurt, kefir)"
-        ]
-    },
-
-    "fluids": {
-        "guidance": ["drink 6–8 glasses (≈2L) water daily; supports cognition, attention, emotions, energy"]
-    },
-}
-
-NUTRITION_20 = {
-    "unhealthy_saturated_fat": {
-        "snacks": ["peanuts (salted/roasted)","vegetable crisps","crisps","milk/white chocolate","cheese straws"],
-        "takeaway": ["pizza","curry","fish & chips","burgers","Chinese"],
-        "processed": ["processed meats (ham, bacon, salami, sausage, pâté, tinned)","ready meals","powdered soup",
-                      "packaged cakes, pastries, biscuits, puddings"],
-    },
-    "sugar_and_alcohol": {
-        "alcohol": [
-            "wine (red/white/rosé)","sparkling (Prosecco, Champagne)","beer/lager/ale/stout/cider",
-            "spirits (gin, whisky, rum, vodka)","alcopops (e.g., Smirnoff Ice, Bacardi Breezer, WKD)"
-        ],
-        "processed_drinks": ["fizzy drinks (cola, lemonade, Fanta)","energy drinks (Monster, Red Bull)"],
-        "processed_foods": [
-            "confectionery (chocolate, sweets)","ready meals","powdered soups","breakfast cereals & bars",
-            "packaged cakes, pastries, biscuits, puddings","canned fruit in syrup","ice cream","bread/rolls (sweetened)"
-        ],
-    },
-    "salt_processed": {
-        "salty_snacks": ["crisps","salted nuts","biscuits","popcorn"],
-        "cheese": ["halloumi","blue cheese"],
-        "takeaway": ["pizza","curry","Chinese"],
-        "processed": ["ready meals","processed meat (sausages, bacon, ham, pâté, chorizo, salami)",
-                      "retail sauces (ketchup, soy sauce, mayonnaise, pickles, pasta sauces)"],
-    },
-}
-
 # quick keyword detector for "food lists" requests
 _FOOD_KEYS = {"food","foods","eat","eating","protein","carb","carbs","fat","fats","snack","snacks","examples","list","what to eat"}
 
 def wants_food_list(user_line: str) -> bool:
+    """Asking for food examples, or asking where a named 80/20 food sits."""
     t = _norm(user_line)
-    return any(k in t for k in _FOOD_KEYS)
+    return any(k in t for k in book().food_keys) or bool(asks_placement(t) and find_foods(t))
 
 def _fmt(items: list[str], max_n=8) -> str:
     if not items:
@@ -138,91 +35,215 @@ def _fmt(items: list[str], max_n=8) -> str:
     more = "…" if len(items) > max_n else ""
     return ", ".join(cut) + more
 
-def nutrition_foods_answer(user_line: str) -> str:
+# --- Food search index ------------------------------------------------------
+# Every food named in NUTRITION_80/20 is indexed by its whole name (normalised
+# tokens joined by spaces: "ready meal", "halloumi", "organ meat" is not a food), so
+# "is halloumi 80 or 20?" is a few dict lookups over the question's n-grams. Names
+# come from the item ("ready meals"), its slash/comma parts ("beer/lager") and the
+# varieties in brackets ("processed meats (ham, bacon)"). Foods are only looked up
+# when the user asks where something sits (asks_placement), so everyday words that
+# happen to be foods ("date", "heart") don't hijack ordinary nutrition questions.
+
+_WORD = re.compile(r"[a-z0-9]+")
+_NOT_FOODS = {"nutritional_benefits", "health_benefits", "guidance"}   # leaf lists that aren't foods
+# one-word names that are qualifiers or too ambiguous to place on their own
+_INDEX_STOPWORDS = {"and", "with", "the", "all", "moderation", "salted", "roasted", "sweetened", "tinned",
+                    "retail", "packaged", "processed", "green", "brown", "red", "black", "white", "blue",
+                    "rose", "food", "high", "fibre", "fatty", "acid", "fermented", "energy", "fizzy",
+                    "bar", "bull", "butter", "whole", "ready", "split", "sweet"}
+_NOT_FOOD_NAMES = {"antioxidant", "probiotic", "prebiotic", "probiotic prebiotic", "probiotic and prebiotic",
+                   "omega 3 fatty acid", "high fibre food",
+                   "fermented food", "spirit", "sparkling", "confectionery"}   # classes, not foods
+_MAX_NAME_WORDS = 4
+# "is X 80 or 20?", "20%?", "foundation or flexibility", "which list is X in?"
+_PLACEMENT = re.compile(
+    r"\b(?:80|20)\s*(?:%|percent|or|vs|/)|\b(?:eighty|twenty)\b|\bfoundation or flexibility\b"
+    r"|\bflexibility or foundation\b|\bwhich (?:list|side|group)\b"
+    r"|\bwhere (?:does|do|would|should) .+ (?:sit|fit|go|belong)\b")
+_LABELS = {"unhealthy_saturated_fat": "saturated fat", "sugar_and_alcohol": "sugar & alcohol",
+           "salt_processed": "salt & processed", "healthy_unsaturated_fat": "healthy fats",
+           "gut_brain_support": "gut-brain support"}
+
+# Question words that pick a food-list topic; the first topic (in this order) wins
+FOOD_TOPICS = {
+    "20":      ["treat", "treats", "20", "twenty", "alcohol", "sugar", "sweet", "sweets", "takeaway",
+                "crisps", "chocolate", "salt", "salty"],
+    "protein": ["protein", "meat", "fish", "dairy", "legume", "legumes", "beans", "lentil", "lentils"],
+    "carbs":   ["carb", "carbs", "carbohydrate", "carbohydrates", "starch", "starchy", "grain", "grains",
+                "oats", "rice", "pasta", "bread", "cereal", "noodles"],
+    "fats":    ["fat", "fats", "omega", "nuts", "seeds", "oil", "oils", "olive", "avocado"],
+    "gut":     ["gut", "microbiome", "fermented", "fibre", "fiber", "kefir", "yoghurt", "yogurt", "kimchi"],
+    "fruit_veg": ["fruit", "fruits", "veg", "vegetable", "vegetables", "5"],
+    "fluids":  ["drink", "drinks", "water", "fluid", "fluids", "hydrate", "hydration"],
+}
+
+def _words(text: str) -> List[str]:
+    folded = unicodedata.normalize("NFKD", (text or "").lower()).encode("ascii", "ignore").decode()
+    return _WORD.findall(folded)
+
+def _token(word: str) -> str:
+    """Fold accents and plurals: 'Pâtés' -> 'pate', 'berries' -> 'berry'."""
+    word = unicodedata.normalize("NFKD", word.lower()).encode("ascii", "ignore").decode()
+    if len(word) > 4 and word.endswith("ies"):
+        word = word[:-3] + "y"
+    elif len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+        word = word[:-1]
+    return word
+
+def _tokens(text: str) -> List[str]:
+    return [_token(w) for w in _words(text)]
+
+def asks_placement(text: str) -> bool:
+    """An explicit "80 or 20?"-style question about where a food sits."""
+    return bool(_PLACEMENT.search(_norm(text)))
+
+def _food_names(item: str) -> List[str]:
     """
-    Return an 80/20 foods overview or a focused category list based on the user query.
-    Keeps output compact and scannable, with prompts to ask for more.
+    Index keys for one list item: 'milk/white chocolate' -> ['milk chocolate', 'white
+    chocolate']; 'beans (kidney, butter)' -> ['bean', 'kidney', 'kidney bean', 'butter bean'].
     """
-    t = _norm(user_line)
+    head, _, rest = item.partition("(")
+    heads = [_tokens(p) for p in re.split(r"[/,;]", head.replace("&", " and "))]
+    heads = [t for t in heads if t]
+    if len(heads) > 1 and len(heads[-1]) > 1:    # 'milk/white chocolate': the noun is shared
+        noun = heads[-1][-1]
+        heads = [t + [noun] if len(t) == 1 else t for t in heads]
+    varieties = [_tokens(p) for p in re.split(r"[/,;]", rest.rstrip(")").replace("e.g.", ""))]
+    varieties = [t for t in varieties if t]
+    if len(heads) == 1 and len(heads[0]) == 1:   # 'beans (kidney, …)': 'kidney bean' too
+        noun = heads[0][0]
+        varieties += [t + [noun] for t in varieties
+                      if len(t) == 1 and t[0] not in _INDEX_STOPWORDS and not t[0].endswith(noun)]
+    heads += [[w for w in t if w != "and"] for t in heads if "and" in t]   # 'fish & chips' typed as 'fish chips'
+    names = []
+    for toks in heads + varieties:
+        name = " ".join(toks)
+        if len(toks) > _MAX_NAME_WORDS or name in _NOT_FOOD_NAMES:
+            continue
+        if len(toks) == 1 and (len(name) < 3 or name in _INDEX_STOPWORDS):
+            continue
+        names.append(name)
+    return names
+
+def build_food_index(nutrition_80, nutrition_20) -> Dict[str, Tuple[Tuple[str, str, str], ...]]:
+    """food name -> ((tier, category, subcategory), ...) over every food leaf list."""
+    index: Dict[str, List[Tuple[str, str, str]]] = {}
+    for tier, table in (("80", nutrition_80), ("20", nutrition_20)):
+        for category, subs in table.items():
+            for sub, items in subs.items():
+                if sub in _NOT_FOODS:
+                    continue
+                for item in items:
+                    for name in _food_names(item):
+                        hits = index.setdefault(name, [])
+                        if (tier, category, sub) not in hits:
+                            hits.append((tier, category, sub))
+    return {name: tuple(hits) for name, hits in index.items()}
+
+def _topic_index(topics) -> Dict[str, Tuple[int, str]]:
+    index: Dict[str, Tuple[int, str]] = {}
+    for rank, (topic, words) in enumerate(topics.items()):
+        for w in words:
+            index.setdefault(_token(w), (rank, topic))
+    return index
+
+def find_foods(text: str) -> List[Tuple[str, Tuple[Tuple[str, str, str], ...]]]:
+    """Foods named in `text`, longest name first, with where they sit."""
+    book_, seen, found = book(), set(), []
+    words = _words(text)
+    toks = [_token(w) for w in words]
+    i = 0
+    while i < len(toks):
+        for n in range(min(_MAX_NAME_WORDS, len(toks) - i), 0, -1):
+            name = " ".join(toks[i:i + n])
+            hits = book_.food_index.get(name)
+            if hits:
+                if name not in seen:
+                    seen.add(name)
+                    found.append((" ".join(words[i:i + n]), hits))
+                i += n
+                break
+        else:
+            i += 1
+    return found
+
+def _label(key: str) -> str:
+    return _LABELS.get(key, key.replace("_", " "))
+
+def _placement(food: str, hits) -> str:
+    tiers = {t for t, _, _ in hits}
+    where = "; ".join(f"{_label(c)}: {_label(s)}" for _, c, s in hits)
+    if tiers == {"80"}:
+        return f"- **{food.capitalize()}** → **80% foundation** ({where})"
+    if tiers == {"20"}:
+        return f"- **{food.capitalize()}** → **20% flexibility** ({where})"
+    return f"- **{food.capitalize()}** → depends on the version: {where}"
+
+def _food_topic_answers(nutrition_80, nutrition_20) -> Dict[str, str]:
+    """The focused 80/20 lists, rendered once per topic (plus the general overview)."""
+    u, eighty = nutrition_20, nutrition_80
+    s = eighty["starchy_carbohydrates"]; p = eighty["protein"]; f = eighty["healthy_unsaturated_fat"]
+    head = "**80% Foundation — everyday foods:**"
+    lists = {
+        "20": ["**20% Flexibility — examples (use sparingly):**",
+               f"- Saturated fat (snacks): {_fmt(u['unhealthy_saturated_fat']['snacks'])}",
+               f"- Saturated fat (takeaway): {_fmt(u['unhealthy_saturated_fat']['takeaway'])}",
+               f"- Saturated fat (processed): {_fmt(u['unhealthy_saturated_fat']['processed'])}",
+               f"- Sugar & alcohol (alcohol): {_fmt(u['sugar_and_alcohol']['alcohol'])}",
+               f"- Sugar & alcohol (drinks): {_fmt(u['sugar_and_alcohol']['processed_drinks'])}",
+               f"- Sugar & alcohol (foods): {_fmt(u['sugar_and_alcohol']['processed_foods'])}",
+               f"- Salt/processed (snacks): {_fmt(u['salt_processed']['salty_snacks'])}",
+               f"- Salt/processed (processed): {_fmt(u['salt_processed']['processed'])}"],
+        "protein": [head,
+                    f"- Lean meat: {_fmt(p['lean_meat'])}",
+                    f"- Oily fish: {_fmt(p['oily_fish'])}",
+                    f"- Dairy/alt: {_fmt(p['dairy'])}; {_fmt(p['dairy_alternatives'])}",
+                    f"- Legumes: {_fmt(p['legumes'])}",
+                    f"- Benefits: {_fmt(p['health_benefits'], max_n=4)}"],
+        "carbs": [head,
+                  f"- Whole grains: {_fmt(s['whole_grains'])}",
+                  f"- Starchy foods: {_fmt(s['starchy_foods'])}",
+                  f"- Fruit: {_fmt(s['fruit'])}",
+                  f"- Vegetables: {_fmt(s['vegetables'])}",
+                  f"- Benefits: {_fmt(s['health_benefits'], max_n=4)}"],
+        "fats": [head,
+                 f"- Oily fish: {_fmt(f['oily_fish'])}",
+                 f"- Nuts & seeds: {_fmt(f['nuts'])}; {_fmt(f['seeds'])}",
+                 f"- Plant oils: {_fmt(f['plant_oils'])}",
+                 f"- Fruit/veg fats: {_fmt(f['fruit_veg_fats'])}",
+                 f"- Benefits: {_fmt(f['health_benefits'], max_n=4)}"],
+        "gut": [head,
+                f"- Examples: {_fmt(eighty['gut_brain_support']['examples'])}",
+                "Tip: add one fermented food 3x/week."],
+        "fruit_veg": [head,
+                      f"- Guidance: {_fmt(eighty['fruit_veg_target']['guidance'])}",
+                      "Tip: add 1 portion at lunch today."],
+        "fluids": [head,
+                   f"- Guidance: {_fmt(eighty['fluids']['guidance'])}",
+                   "Tip: carry a bottle; aim for 6–8 glasses."],
+        "overview": [head,
+                     f"- Carbs (grains/veg/fruit): {_fmt(s['whole_grains'])}",
+                     f"- Protein (meat/fish/dairy/legumes): {_fmt(p['legumes'])}",
+                     f"- Healthy fats (oils/nuts/seeds/fish): {_fmt(f['plant_oils'])}",
+                     "Ask for details: try 'protein ideas', 'healthy fats', 'gut-friendly foods', or 'show 20%'."],
+    }
+    return {topic: "\n".join(lines + [EITY20_TAGLINE]) for topic, lines in lists.items()}
 
-    # If user hints at "20%" (treats/sugar/takeaway/alcohol)
-    if any(k in t for k in ["treat","20","twenty","alcohol","sugar","sweet","takeaway","crisps","chocolate","salt"]):
-        lines = ["**20% Flexibility — examples (use sparingly):**"]
-        u = NUTRITION_20
-        lines += [
-            f"- Saturated fat (snacks): {_fmt(u['unhealthy_saturated_fat']['snacks'])}",
-            f"- Saturated fat (takeaway): {_fmt(u['unhealthy_saturated_fat']['takeaway'])}",
-            f"- Saturated fat (processed): {_fmt(u['unhealthy_saturated_fat']['processed'])}",
-            f"- Sugar & alcohol (alcohol): {_fmt(u['sugar_and_alcohol']['alcohol'])}",
-            f"- Sugar & alcohol (drinks): {_fmt(u['sugar_and_alcohol']['processed_drinks'])}",
-            f"- Sugar & alcohol (foods): {_fmt(u['sugar_and_alcohol']['processed_foods'])}",
-            f"- Salt/processed (snacks): {_fmt(u['salt_processed']['salty_snacks'])}",
-            f"- Salt/processed (processed): {_fmt(u['salt_processed']['processed'])}",
-        ]
+def nutrition_foods_answer(user_line: str) -> str:
+    """
+    Where a named food sits (80% or 20%), or a focused 80/20 category list, or the
+    general overview. Keeps output compact and scannable, with prompts to ask for more.
+    """
+    book_ = book()
+    found = find_foods(user_line) if asks_placement(user_line) else []
+    if found:
+        lines = ["Here’s where that sits in **eity20**:"]
+        lines += [_placement(food, hits) for food, hits in found[:3]]
+        lines.append("80% foundation foods are everyday choices; 20% ones are for flexibility.")
         lines.append(EITY20_TAGLINE)
         return "\n".join(lines)
-
-    # 80% defaults or specific categories
-    eighty = NUTRITION_80
-    lines = ["**80% Foundation — everyday foods:**"]
-
-    if any(k in t for k in ["protein","meat","fish","dairy","legume","beans","lentil"]):
-        p = eighty["protein"]
-        lines += [
-            f"- Lean meat: {_fmt(p['lean_meat'])}",
-            f"- Oily fish: {_fmt(p['oily_fish'])}",
-            f"- Dairy/alt: {_fmt(p['dairy'])}; {_fmt(p['dairy_alternatives'])}",
-            f"- Legumes: {_fmt(p['legumes'])}",
-            f"- Benefits: {_fmt(p['health_benefits'], max_n=4)}",
-        ]
-    elif any(k in t for k in ["carb","carbs","starch","grain","oats","rice","pasta","bread","cereal","noodles"]):
-        s = eighty["starchy_carbohydrates"]
-        lines += [
-            f"- Whole grains: {_fmt(s['whole_grains'])}",
-            f"- Starchy foods: {_fmt(s['starchy_foods'])}",
-            f"- Fruit: {_fmt(s['fruit'])}",
-            f"- Vegetables: {_fmt(s['vegetables'])}",
-            f"- Benefits: {_fmt(s['health_benefits'], max_n=4)}",
-        ]
-    elif any(k in t for k in ["fat","fats","omega","nuts","seeds","oil","olive","avocado"]):
-        f = eighty["healthy_unsaturated_fat"]
-        lines += [
-            f"- Oily fish: {_fmt(f['oily_fish'])}",
-            f"- Nuts & seeds: {_fmt(f['nuts'])}; {_fmt(f['seeds'])}",
-            f"- Plant oils: {_fmt(f['plant_oils'])}",
-            f"- Fruit/veg fats: {_fmt(f['fruit_veg_fats'])}",
-            f"- Benefits: {_fmt(f['health_benefits'], max_n=4)}",
-        ]
-    elif any(k in t for k in ["gut","microbiome","fermented","fibre","fiber","kefir","yoghurt","yogurt","kimchi"]):
-        g = eighty["gut_brain_support"]
-        lines += [
-            f"- Examples: {_fmt(g['examples'])}",
-            "Tip: add one fermented food 3x/week.",
-        ]
-    elif any(k in t for k in ["fruit","veg","vegetable","5-a-day","5 a day"]):
-        fv = eighty["fruit_veg_target"]
-        lines += [
-            f"- Guidance: {_fmt(fv['guidance'])}",
-            "Tip: add 1 portion at lunch today.",
-        ]
-    elif any(k in t for k in ["drink","water","fluid","hydrate","hydration"]):
-        fl = eighty["fluids"]
-        lines += [
-            f"- Guidance: {_fmt(fl['guidance'])}",
-            "Tip: carry a bottle; aim for 6–8 glasses.",
-        ]
-    else:
-        # General overview
-        s = eighty["starchy_carbohydrates"]; p = eighty["protein"]; f = eighty["healthy_unsaturated_fat"]
-        lines += [
-            f"- Carbs (grains/veg/fruit): {_fmt(s['whole_grains'])}",
-            f"- Protein (meat/fish/dairy/legumes): {_fmt(p['legumes'])}",
-            f"- Healthy fats (oils/nuts/seeds/fish): {_fmt(f['plant_oils'])}",
-            "Ask for details: try 'protein ideas', 'healthy fats', 'gut-friendly foods', or 'show 20%'.",
-        ]
-
-    lines.append(EITY20_TAGLINE)
-    return "\n".join(lines)
+    ranked = [book_.food_topics[t] for t in _tokens(user_line) if t in book_.food_topics]
+    return book_.food_answers[min(ranked)[1] if ranked else "overview"]
 
 # --------------------------------------------------
 # Nutrition rules (SMARTS + eity20 + plate + routine)
@@ -234,48 +255,21 @@ NUTRITION_RULES_TRIGGERS = {
     "regular meals","meal routine","meal timings","timeline","how often should i eat",
 }
 
-NUTRITION_RULES_SMARTS = [
-    "S – **Sustainable**: small, ongoing shifts (e.g., swap sugary snacks for berries, add oily fish once a week).",
-    "M – **Mindful mindset**: notice how foods make you feel; reset without judgment.",
-    "A – **Aligned**: eat in a way that fits your values/culture/needs (e.g., plant-forward, anti-inflammatory).",
-    "R – **Realistic**: simple swaps (wholegrain bread for white, water for energy drinks, +1 portion of greens).",
-    "T – **Train your brain**: 80% consistency beats perfection; build reliable habits.",
-    "S – **Speak up**: tell people you’re focusing on eating for your health.",
-]
-
-NUTRITION_RULES_PROGRAM = [
-    "Follow the **eity20 nutrition programme**:",
-    "• **80%**: mostly **starchy carbohydrates**, **protein**, and **healthy unsaturated fat**.",
-    "• **20%**: more indulgent/less nutritious foods for flexibility.",
-    "Why: steadier blood sugar, long-lasting energy, better focus & mood, improved cognitive function — without being restrictive.",
-]
-
-NUTRITION_RULES_PLATE = [
-    "Use the **portion plate / lunch box / bottle** method:",
-    "• **½** fruit & vegetables/salad",
-    "• **¼** protein",
-    "• **¼** starchy carbohydrates",
-    "Healthy fats are usually in the protein portion (meat/fish, nuts/seeds, dairy/alternatives).",
-]
-
-NUTRITION_RULES_ROUTINE = [
-    "Eat **regular meals** and keep a simple routine (e.g., 5 times/day):",
-    "• Breakfast • Mid-morning snack • Lunch • Mid-afternoon snack • Supper",
-    "This helps maintain energy and stabilise blood sugars. (Use the eity20 timeline to pick times.)",
-]
-
 def nutrition_rules_answer() -> str:
+    return book().rules_answer
+
+def _rules_answer(rules: Mapping[str, Any]) -> str:
     lines = []
     lines.append("Here are your **eity20 nutrition guidelines**:")
     lines.append("")
     lines.append("**Use SMARTS with food & drink**")
-    lines += [f"- {x}" for x in NUTRITION_RULES_SMARTS]
+    lines += [f"- {x}" for x in rules["smarts"]]
     lines.append("")
-    lines += NUTRITION_RULES_PROGRAM
+    lines += rules["program"]
     lines.append("")
-    lines += NUTRITION_RULES_PLATE
+    lines += rules["plate"]
     lines.append("")
-    lines += NUTRITION_RULES_ROUTINE
+    lines += rules["routine"]
     lines.append("")
     lines.append("Reply **foods** to see example items from the 80/20 lists.")
     lines.append("(Pillar: Nutrition & Gut Health — aim for 80% consistency, 20% flexibility, 100% human.)")
@@ -284,7 +278,7 @@ def nutrition_rules_answer() -> str:
 # Users can ask for concrete examples from the 80/20 lists
 FOODS_TRIGGERS = {"foods", "food list", "food examples", "examples of foods", "what foods"}
 
-def nutrition_foods_answer() -> str:
+def nutrition_foods_overview() -> str:
     """Compact examples; safe even if your NUTRITION_80/20 dicts change."""
     return "\n".join([
         "Here are some **eity20 food examples**:",
@@ -304,102 +298,6 @@ def nutrition_foods_answer() -> str:
         "(Use the plate method: ½ veg/fruit, ¼ protein, ¼ starchy carbs.)"
     ])
 
-# Short “voice” elements Smartie can stitch together
-TONE = {
-    "warm_ack": [
-        "Yes - I'm here to help.",
-        "You’re showing up, and that counts.",
-        "Totally understandable — let’s make the next step easy.",
-        "You’re not alone in this. We’ll keep it simple."
-    ],
-    "normalize": [
-        "Progress beats perfection.",
-        "Small steps, repeated, change everything.",
-        "You don’t need 100% to improve meaningfully."
-    ],
-    "reinforce_8020": [
-        EITY20_TAGLINE,
-        "Consistency most of the time is what sticks.",
-        "Flexible, not rigid — that’s the eity20 way."
-    ],
-}
-
-# Pillar metadata + specific suggestions
-PILLARS = {
-    "environment": {
-        "label": "Environment & Structure",
-        "why": "Designing cues and routines removes friction and makes the healthy choice the easy choice.",
-        "suggestions": [
-            "Lay out gym clothes the night before to lower morning friction.",
-            "Create a 2-minute start ritual (water, clear desk, 25-min timer).",
-            "Put healthy options in sight; put tempting foods out of sight."
-        ],
-    },
-    "nutrition": {
-        "label": "Nutrition & Gut Health",
-        "why": "Regular meals, plants, and fibre support energy, mood, and gut balance.",
-        "suggestions": [
-            "Anchor 3 meal times; add 1 veg/fruit at lunch.",
-            "Carry a protein + fibre snack for the afternoon dip.",
-            "Drink water with each meal; add fermented foods 3x/week."
-        ],
-    },
-    "sleep": {
-        "label": "Sleep",
-        "why": "A regular wind-down and light control improve sleep quality.",
-        "suggestions": [
-            "Screens off and lights dim 30 minutes before bed.",
-            "Keep wake time within ±30 minutes daily.",
-            "Caffeine cut-off ~8 hours before bedtime."
-        ],
-    },
-    "movement": {
-        "label": "Exercise & Movement",
-        "why": "Short, repeatable bouts compound and build confidence.",
-        "suggestions": [
-            "Walk 10 minutes after lunch on Mon/Wed/Fri.",
-            "Do one ‘movement snack’ (stairs or 20 squats) each afternoon.",
-            "Stretch 5 minutes after dinner, 4×/week."
-        ],
-    },
-    "stress": {
-        "label": "Stress Management",
-        "why": "Brief physiological resets reduce arousal and improve decision-making.",
-        "suggestions": [
-            "Do 2 minutes of 4-in/6-out breathing at midday.",
-            "Evening brain-dump: write tomorrow’s top 3.",
-            "Schedule a 10-minute recovery block on busy days."
-        ],
-    },
-    "thoughts": {
-        "label": "Thought Patterns",
-        "why": "Shifting self-talk from all-or-nothing to balanced keeps momentum.",
-        "suggestions": [
-            "Daily reframe one unhelpful thought → balanced alternative.",
-            "Note one thing that went right today.",
-            "Add “…yet” to any “I can’t” thought."
-        ],
-    },
-    "emotions": {
-        "label": "Emotional Regulation",
-        "why": "Pausing before reacting widens choice and reduces autopilot.",
-        "suggestions": [
-            "Before stress-snacking: water + 3 breaths, then choose a planned option.",
-            "Label one emotion when it shows up (“name it to tame it”).",
-            "List two non-food soothers and try one tonight."
-        ],
-    },
-    "social": {
-        "label": "Social Connection",
-        "why": "Brief, regular contact builds resilience and accountability.",
-        "suggestions": [
-            "Send one short check-in message today.",
-            "Book a 10-minute walk/call this week.",
-            "Join or re-join one group activity this month."
-        ],
-    },
-}
-
 # --- Ask-first detector -------------------------------------------------------
 
 ADVICE_TRIGGERS = (
@@ -427,130 +325,171 @@ def needs_clarify(user_line: str) -> bool:
     ))
     return asked_for_help and not has_specifics
 
-# --- Per-pillar focus options (used when asking what to cover) ----------------
-
-FOCUS_OPTIONS = {
-    "environment": ["morning start ritual", "night-before prep", "visible cues"],
-    "nutrition":   ["regular meals", "protein + fibre snacks", "add 1 veg at lunch"],
-    "sleep":       ["wind-down routine", "caffeine window", "consistent wake time"],
-    "exercise":    ["daily walk", "2x strength weekly", "habit-stacking (after coffee)"],
-    "stress":      ["2-min breath break", "worry download", "10-min walk reset"],
-    "thoughts":    ["reframe self-talk", "name the thought", "tiny experiment"],
-    "emotions":    ["urge-surfing", "label the feeling", "self-compassion pause"],
-    "social":      ["message a friend", "ask for a small favour", "plan a 10-min chat"],
+# --- Advice intent + keyword → suggestion index (compiled below) ----------------
+
+ADVICE_MARKERS = [
+    "advice", "tip", "tips", "help", "how do i", "how to", "what should",
+    "ideas", "suggest", "suggestion", "recommend", "recommendation", "plan",
+    "where to start", "what can i do", "can you help"
+]
+
+GENERIC_SUGGESTIONS = [
+    "Pick one 5-minute action you can repeat this week.",
+    "Keep it realistic and time-anchored."
+]
+
+# -------------------------------------------------
+# Compiled playbook (built on every content load)
+# -------------------------------------------------
+# compile_playbook() turns content/playbook.json into tuples and read-only mappings
+# and renders every reply compose_reply can give, so a call is a keyword scan over
+# a short tuple plus a lookup. SPECIFIC_MAP: the first keyword found (in file order)
+# picks the suggestion to lead with.
+
+@dataclass(frozen=True)
+class PillarBook:
+    id: int                                 # pillars.KEYS position
+    key: str
+    label: str
+    suggestions: Tuple[str, ...]
+    keywords: Tuple[Tuple[str, int], ...]   # SPECIFIC_MAP entries, in priority order
+    advice_replies: Tuple[str, ...]         # full advice reply, by leading suggestion
+    nudge_reply: str                        # reply when the user isn't asking for advice
+
+@dataclass(frozen=True)
+class Playbook:
+    pillars: Mapping[str, PillarBook]
+    by_id: Tuple[PillarBook, ...]           # aligned with pillars.KEYS
+    advice_markers: Tuple[str, ...]
+    food_keys: Tuple[str, ...]
+    tone: Mapping[str, Tuple[str, ...]]
+    focus_options: Mapping[str, Tuple[str, ...]]
+    nutrition_80: Mapping[str, Mapping[str, Tuple[str, ...]]]
+    nutrition_20: Mapping[str, Mapping[str, Tuple[str, ...]]]
+    food_index: Mapping[str, Tuple[Tuple[str, str, str], ...]]   # token -> (tier, category, subcategory)
+    food_topics: Mapping[str, Tuple[int, str]]                   # question word -> (rank, topic)
+    food_answers: Mapping[str, str]                              # topic -> rendered list
+    rules_answer: str
+    raw_pillars: Mapping[str, Mapping[str, Any]]                 # label (from pillars.py) + content fields
+
+def _goal_offer(suggestion: str, duration: str = "the next 2 weeks") -> dict:
+    goal = f"I will {suggestion} for {duration}."
+    offer = (
+        "Would you like to set this as a goal?\n"
+        f"• {goal}\n"
+        "Reply **yes** to set it, or tell me what you’d like to change (e.g., duration, days, or wording)."
+    )
+    return {"offer": offer, "goal": goal}
+
+def _advice_reply(label: str, s1: str, s2: str, offer: dict) -> str:
+    goal_line = f"\n{offer['offer']}" if offer.get("offer") else ""
+    return "\n".join([
+        "Yes — of course. Here are two tiny actions you can try:",
+        f"• {s1}",
+        f"• {s2}",
+        EITY20_TAGLINE,
+        f"(Pillar: {label})",
+    ]) + goal_line
+
+def compile_playbook(content: Mapping[str, Any]) -> Playbook:
+    """Build the Playbook from the parsed content/playbook.json. Pillars are keyed as in pillars.py."""
+    tone, n80, n20 = content["tone"], content["nutrition_80"], content["nutrition_20"]
+    specific_map = {registry.key_of(registry.pillar_id(k)): v for k, v in content["specific_map"].items()}
+    given = {registry.pillar_id(k): p for k, p in content["pillars"].items()}
+    books, raw = {}, {}
+    for pid in sorted(given):
+        key, label, p = registry.KEYS[pid], registry.LABELS[pid], given[pid]
+        suggestions = tuple(p.get("suggestions") or GENERIC_SUGGESTIONS)
+        n = len(suggestions)
+        offer = _goal_offer(suggestions[0])
+        raw[key] = {"label": label, **p}
+        books[key] = PillarBook(
+            id=pid,
+            key=key,
+            label=label,
+            suggestions=suggestions,
+            keywords=tuple(specific_map.get(key, {}).items()),
+            advice_replies=tuple(
+                _advice_reply(label, suggestions[i], suggestions[(i + 1) % n], offer) for i in range(n)
+            ),
+            nudge_reply="\n".join([
+                tone["warm_ack"][0],
+                "Pick one tiny action you can repeat this week.",
+                tone["reinforce_8020"][0],
+                f"(Pillar: {label})",
+            ]),
+        )
+    return Playbook(
+        pillars=MappingProxyType(books),
+        by_id=tuple(books.get(k) for k in registry.KEYS),
+        advice_markers=tuple(ADVICE_MARKERS),
+        food_keys=tuple(_FOOD_KEYS),
+        tone=freeze(tone),
+        focus_options=freeze(content["focus_options"]),
+        nutrition_80=freeze(n80),
+        nutrition_20=freeze(n20),
+        food_index=MappingProxyType(build_food_index(n80, n20)),
+        food_topics=MappingProxyType(_topic_index(FOOD_TOPICS)),
+        food_answers=MappingProxyType(_food_topic_answers(n80, n20)),
+        rules_answer=_rules_answer(content["nutrition_rules"]),
+        raw_pillars=freeze(raw),
+    )
+
+CONTENT.register("playbook", lambda data: compile_playbook(data["playbook"]))
+
+def book() -> Playbook:
+    """The playbook compiled from the content that is live right now."""
+    return CONTENT.current.index("playbook")
+
+def pillars() -> Mapping[str, Mapping[str, Any]]:
+    """Pillar metadata (label, why, suggestions) by key: labels from pillars.py, the rest from content."""
+    return book().raw_pillars
+
+# Old module-level names, read from the live content on access (smartie_playbook.PILLARS).
+_CONTENT_NAMES = {
+    "TONE": "tone", "FOCUS_OPTIONS": "focus_options",
+    "SPECIFIC_MAP": "specific_map", "NUTRITION_80": "nutrition_80", "NUTRITION_20": "nutrition_20",
 }
 
-def compose_reply(pillar_key: str, user_line: str = "") -> str:
+def __getattr__(name: str):
+    if name == "PILLARS":
+        return pillars()
+    if name in _CONTENT_NAMES:
+        return CONTENT.current.data["playbook"][_CONTENT_NAMES[name]]
+    if name.startswith("NUTRITION_RULES_") and name != "NUTRITION_RULES_TRIGGERS":
+        return CONTENT.current.data["playbook"]["nutrition_rules"][name[len("NUTRITION_RULES_"):].lower()]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def compose_reply(pillar_key: str, user_line: str = "", features=None) -> str:
     """
     Smartie's advice-first composer.
     - If the user explicitly asks for advice/tips, answer with 2 concrete steps
       and (optionally) offer a SMARTS-shaped goal.
     - Otherwise, give a short warm line plus one generic tiny-step nudge.
+    `features` is the router's per-message MessageFeatures; when given, its
+    normalised text is reused instead of lowercasing `user_line` again.
     """
-    pk = pillar_key
-    p = PILLARS.get(pk)
-    if not p:
+    book_ = book()
+    p = book_.pillars.get(pillar_key)
+    if p is None:
         return "Thank you for asking — what exactly would you like to know?"
 
+    text = features.lower if features is not None else _norm(user_line)
+
     # NEW: if nutrition + user asks for foods/examples → return foods answer directly
-    if pk == "nutrition" and wants_food_list(user_line):
+    if pillar_key == "nutrition" and (any(k in text for k in book_.food_keys) or (asks_placement(text) and find_foods(text))):
         return nutrition_foods_answer(user_line)
 
-    label = p["label"]
-    text = (user_line or "").lower()
-
     # --- Detect explicit "ask for advice" intent ---
-    advice_markers = [
-        "advice", "tip", "tips", "help", "how do i", "how to", "what should",
-        "ideas", "suggest", "suggestion", "recommend", "recommendation", "plan",
-        "where to start", "what can i do", "can you help"
-    ]
-    is_advice = any(m in text for m in advice_markers) or text.endswith("?")
-
-    # --- Quick routing to a specific suggestion index (if a keyword appears) ---
-    specific_map = {
-        "nutrition": {
-            "meal": 0, "timing": 0, "breakfast": 0, "regular": 0,
-            "protein": 1, "snack": 1, "veg": 1, "fruit": 1, "plants": 1,
-            "gut": 2, "bloat": 2, "ibs": 2, "fibre": 2, "fiber": 2
-        },
-        "sleep": {
-            "wind": 0, "bed": 0, "screen": 0, "caffeine": 0,
-            "wake": 1, "waking": 1, "night": 1,
-            "morning": 2, "light": 2, "sun": 2
-        },
-        "exercise": {
-            "walk": 0, "steps": 0,
-            "strength": 1, "weights": 1,
-            "stretch": 2, "mobility": 2
-        },
-        "stress": {
-            "breathe": 0, "breathing": 0,
-            "worry": 1, "ruminate": 1, "rumination": 1,
-            "pause": 2, "decompress": 2
-        },
-        "thoughts": {
-            "self-talk": 0, "talk": 0, "kind": 0,
-            "perfection": 1, "perfect": 1,
-            "reframe": 2, "reframing": 2
-        },
-        "emotions": {
-            "soothe": 0, "soothing": 0,
-            "urge": 1, "craving": 1, "binge": 1, "comfort": 1,
-            "journal": 2, "journaling": 2
-        },
-        "social": {
-            "ask": 0, "help": 0, "support": 0,
-            "friend": 1, "connect": 1, "connection": 1,
-            "boundary": 2
-        },
-        "environment": {
-            "morning": 0, "start": 0,
-            "evening": 1, "reset": 1,
-            "cue": 2, "cues": 2, "visual": 2
-        },
-    }
+    if not (text.endswith("?") or any(m in text for m in book_.advice_markers)):
+        return p.nudge_reply
 
-    if is_advice:
-        # 1) Try to detect a specific subtopic to pick a step directly
-        chosen_idx = None
-        for kw, idx in specific_map.get(pk, {}).items():
-            if kw in text:
-                chosen_idx = idx
-                break
+    # --- Lead with the suggestion for the first subtopic keyword, if any ---
+    for kw, idx in p.keywords:
+        if kw in text:
+            return p.advice_replies[idx]
+    return p.advice_replies[0]
 
-        # 2) Build the two concrete steps (rotate or fallback to generic list)
-        suggestions = p.get("suggestions", [])
-        if not suggestions:
-            suggestions = [
-                "Pick one 5-minute action you can repeat this week.",
-                "Keep it realistic and time-anchored."
-            ]
-
-        s1 = suggestions[chosen_idx or 0]
-        s2 = suggestions[((chosen_idx or 0) + 1) % len(suggestions)]
-
-        # 3) Offer a goal (optional)
-        offer = propose_smarts_goal(pk, user_line=user_line)
-        goal_line = f"\n{offer['offer']}" if offer.get("offer") else ""
-
-        return "\n".join([
-            "Yes — of course. Here are two tiny actions you can try:",
-            f"• {s1}",
-            f"• {s2}",
-            EITY20_TAGLINE,
-            f"(Pillar: {label})",
-        ]) + goal_line
-
-    else:
-        # Default: not explicitly asking for advice → warm nudge + tiny step
-        ack = TONE["warm_ack"][0]
-        return "\n".join([
-            ack,
-            "Pick one tiny action you can repeat this week.",
-            TONE["reinforce_8020"][0],
-            f"(Pillar: {label})",
-        ])
 def propose_smarts_goal(
     pillar_key: str,
     user_line: str = "",         
@@ -561,20 +500,12 @@ def propose_smarts_goal(
     Build a SMARTS-shaped goal suggestion from the pillar library.
     Returns a dict with both the goal text and a friendly offer line.
     """
-    p = PILLARS.get(pillar_key)
+    p = book().pillars.get(pillar_key)
     if not p:
         return {"offer": None, "goal": None}
 
     # rotate through suggestions if idx grows
-    s = p["suggestions"][idx % len(p["suggestions"])]
-
-    goal = f"I will {s} for {duration}."
-    offer = (
-        "Would you like to set this as a goal?\n"
-        f"• {goal}\n"
-        "Reply **yes** to set it, or tell me what you’d like to change (e.g., duration, days, or wording)."
-    )
-    return {"offer": offer, "goal": goal}
+    return _goal_offer(p.suggestions[idx % len(p.suggestions)], duration)
 
 def confirm_smarts_goal(user_text: str, default_goal: str) -> str | None:
     """
@@ -595,3 +526,4 @@ def confirm_smarts_goal(user_text: str, default_goal: str) -> str | None:
         return g
 
     return None
+
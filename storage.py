@@ -0,0 +1,589 @@
+# storage.py
+"""
+Per-user state storage.
+
+Every module keeps its per-user maps (STATE, LAST_SEEN, SESSIONS, GOALS, LOGS, ...)
+as `UserMap` views. All namespaces for one user live in a single record, so a turn
+reads one row and writes one row. Pick the backend with SMARTIE_STORE:
+
+    SMARTIE_STORE=memory                      (default; lost on restart)
+    SMARTIE_STORE=sqlite:///var/data/smartie.db
+"""
+import atexit
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, MutableMapping, Optional, Tuple
+
+from expiring import ExpiringDict
+
+
+class StateStore(ABC):
+    """One record per user: a dict of {namespace: value}."""
+
+    @abstractmethod
+    def load(self, user_id: str) -> Dict[str, Any]:
+        """Return the live record for user_id, creating an empty one if needed."""
+
+    @abstractmethod
+    def peek(self, user_id: str, touch: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Return the live record, or None if the user has no state (never creates).
+        touch=False reads without counting as a visit (see scan()).
+        """
+
+    def mark_dirty(self, user_id: str) -> None:
+        """The record was changed in place; persist it."""
+
+    def begin_turn(self, user_id: str) -> Dict[str, Any]:
+        """Start a turn: load the record once and keep it stable until end_turn."""
+        return self.load(user_id)
+
+    def end_turn(self, user_id: str) -> None:
+        """Finish a turn: persist whatever the turn changed."""
+        self.mark_dirty(user_id)
+
+    @abstractmethod
+    def delete(self, user_id: str) -> None:
+        """Forget the user's record."""
+
+    @abstractmethod
+    def user_ids(self) -> Iterator[str]:
+        """Every stored user id."""
+
+    def scan(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Every (user_id, record), for reports and schedulers. Unlike peek() this is not
+        a visit: it doesn't refresh idle/LRU state or fill a cache. Treat records as
+        read-only.
+        """
+        for uid in self.user_ids():
+            rec = self.peek(uid)
+            if rec is not None:
+                yield uid, rec
+
+    def flush(self) -> None:
+        """Write any pending changes now."""
+
+    def close(self) -> None:
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """Live size and eviction counters."""
+        return {}
+
+
+class MemoryStore(StateStore):
+    """
+    Plain in-process records, bounded by idle TTL and LRU size. An evicted user simply
+    has no record any more, so they come back to a clean first-time experience.
+    """
+
+    def __init__(self, max_users: Optional[int] = None, idle_ttl: Optional[float] = None):
+        self._records = ExpiringDict(max_entries=max_users, ttl=idle_ttl)
+
+    def load(self, user_id):
+        return self._records.setdefault(user_id, {})
+
+    def peek(self, user_id, touch=True):
+        return self._records.get(user_id, touch=touch)
+
+    def delete(self, user_id):
+        self._records.pop(user_id, None)
+
+    def user_ids(self):
+        return self._records.keys()
+
+    def scan(self):
+        return self._records.items()
+
+    def stats(self) -> Dict[str, int]:
+        return {"users": len(self._records), **self._records.stats()}
+
+
+class SQLiteStore(StateStore):
+    """
+    SQLite in WAL mode with a hot read cache and batched write-behind. Safe to share
+    between worker processes.
+
+    - Reads: a record is fetched by primary key once, then served from the cache
+      for `cache_ttl` seconds. A turn (begin_turn) always reads the row afresh, so
+      it starts from whatever another worker wrote last. The cache holds at most
+      `cache_size` users (LRU).
+    - Writes: changed records are marked dirty and written by a background thread
+      every `flush_interval` seconds (or once `batch_size` users are dirty) in one
+      transaction, so repeated changes within a turn coalesce into one row write.
+    - Every row has a version, and a write only lands if the row is still at the
+      version the record was read at (compare-and-swap). On a conflict the row is
+      re-read inside the same transaction and the namespaces this process changed
+      are applied on top of it; the other worker's changes to the rest are kept (if
+      both changed the same namespace, the later write wins).
+    - Rows idle for longer than `idle_ttl` seconds are purged every `purge_interval`.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.25, batch_size: int = 256,
+                 cache_ttl: float = 2.0, cache_size: int = 10_000,
+                 idle_ttl: Optional[float] = None, purge_interval: float = 600.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.cache_ttl = cache_ttl
+        self.idle_ttl = idle_ttl
+        self.purge_interval = purge_interval
+        # user_id -> (record, loaded_at)
+        self._cache = ExpiringDict(max_entries=cache_size, on_evict=self._on_cache_evict)
+        self._spill: Dict[str, Dict[str, Any]] = {}   # evicted from the cache but dirty or mid-turn
+        self._base: Dict[str, Tuple[int, bytes]] = {}  # (version, row data) each local record came from
+        self._dirty: set = set()
+        self._deleted: set = set()
+        self._pinned: Dict[str, int] = {}   # users with a turn in progress (never refreshed mid-turn)
+        self._lock = threading.RLock()
+        self._db_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._flusher: Optional[threading.Thread] = None
+        self._last_purge = time.monotonic()
+        self._closed = False
+        self.purged = 0
+        self.conflicts = 0
+        atexit.register(self.close)
+
+    # ---------- connection ----------
+    def _db(self) -> sqlite3.Connection:
+        # (re)open lazily so a store created before a gunicorn fork gets its own connection
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_state ("
+                " user_id TEXT PRIMARY KEY,"
+                " data BLOB NOT NULL,"
+                " updated REAL NOT NULL,"
+                " version INTEGER NOT NULL DEFAULT 0)"
+            )
+            if "version" not in {r[1] for r in conn.execute("PRAGMA table_info(user_state)")}:
+                conn.execute("ALTER TABLE user_state ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS user_state_updated ON user_state (updated)")
+            self._conn, self._pid, self._flusher = conn, os.getpid(), None
+        return self._conn
+
+    def _fetch(self, user_id: str) -> Optional[Tuple[int, bytes]]:
+        with self._db_lock:
+            return self._db().execute(
+                "SELECT version, data FROM user_state WHERE user_id = ?", (user_id,)
+            ).fetchone()
+
+    def _on_cache_evict(self, user_id, item, reason):
+        # never drop unsaved changes or a record a turn is still holding
+        if user_id in self._dirty or user_id in self._pinned:
+            self._spill[user_id] = item[0]
+        else:
+            self._base.pop(user_id, None)
+
+    # ---------- reads ----------
+    def _local(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Cached record that must win over the database (dirty or mid-turn), if any."""
+        if user_id not in self._dirty and user_id not in self._pinned:
+            return None
+        rec = self._spill.pop(user_id, None)
+        if rec is not None:
+            self._cache[user_id] = (rec, time.monotonic())
+            return rec
+        item = self._cache.get(user_id)
+        return item[0] if item is not None else None
+
+    def _cached(self, user_id: str, create: bool, fresh: bool = False) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            rec = self._local(user_id)
+            if rec is not None:
+                return rec
+            item = self._cache.get(user_id)
+            if item is not None and not fresh and time.monotonic() - item[1] < self.cache_ttl:
+                return item[0]
+            deleted = user_id in self._deleted
+        row = None if deleted else self._fetch(user_id)   # indexed read, outside the cache lock
+        with self._lock:
+            rec = self._local(user_id)
+            if rec is not None:
+                return rec   # local changes win over what we just read
+            if row is None:
+                self._base.pop(user_id, None)
+                if not create:
+                    self._cache.pop(user_id)
+                    return None
+                fetched = {}
+            else:
+                self._base[user_id] = row
+                fetched = pickle.loads(row[1])
+            self._cache[user_id] = (fetched, time.monotonic())
+            return fetched
+
+    def load(self, user_id):
+        return self._cached(user_id, create=True)
+
+    def peek(self, user_id, touch=True):
+        # idle time here is the row's last write, so a read never counts as a visit
+        return self._cached(user_id, create=False)
+
+    def begin_turn(self, user_id):
+        rec = self._cached(user_id, create=True, fresh=True)
+        with self._lock:
+            self._pinned[user_id] = self._pinned.get(user_id, 0) + 1
+        return rec
+
+    def end_turn(self, user_id):
+        with self._lock:
+            n = self._pinned.get(user_id, 0) - 1
+            if n > 0:
+                self._pinned[user_id] = n
+            else:
+                self._pinned.pop(user_id, None)
+        self.mark_dirty(user_id)
+
+    def user_ids(self):
+        with self._db_lock:
+            rows = self._db().execute("SELECT user_id FROM user_state").fetchall()
+        with self._lock:
+            ids = {r[0] for r in rows} - self._deleted
+            ids.update(self._dirty)
+        return iter(sorted(ids))
+
+    def scan(self):
+        # one SELECT on its own connection (WAL: doesn't block writers or the flusher);
+        # records changed locally but not flushed yet win over their rows
+        with self._lock:
+            local = {}
+            for uid in self._dirty | set(self._pinned):
+                item = self._cache.get(uid, touch=False)
+                rec = item[0] if item is not None else self._spill.get(uid)
+                if rec is not None:
+                    local[uid] = rec
+            deleted = set(self._deleted)
+        self._db()   # make sure the table exists
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            for uid, data in conn.execute("SELECT user_id, data FROM user_state"):
+                if uid in deleted:
+                    continue
+                rec = local.pop(uid, None)
+                yield uid, rec if rec is not None else pickle.loads(data)
+        finally:
+            conn.close()
+        yield from local.items()
+
+    # ---------- writes ----------
+    def mark_dirty(self, user_id):
+        with self._lock:
+            if user_id not in self._cache and user_id not in self._spill:
+                return
+            self._dirty.add(user_id)
+            self._deleted.discard(user_id)
+            n = len(self._dirty)
+        self._ensure_flusher()
+        if n >= self.batch_size:
+            self._wake.set()
+
+    def delete(self, user_id):
+        with self._lock:
+            self._cache.pop(user_id)
+            self._spill.pop(user_id, None)
+            self._base.pop(user_id, None)
+            self._dirty.discard(user_id)
+            self._deleted.add(user_id)
+        self._ensure_flusher()
+
+    def flush(self):
+        with self._lock:
+            now = time.time()
+            dirty, deleted = self._dirty, self._deleted
+            self._dirty, self._deleted = set(), set()
+            rows = []
+            for uid in dirty:
+                item = self._cache.get(uid, touch=False)
+                rec = item[0] if item is not None else self._spill.get(uid)
+                if rec is not None:
+                    rows.append((uid, pickle.dumps(rec, pickle.HIGHEST_PROTOCOL), self._base.get(uid)))
+        written: Dict[str, Tuple[int, bytes, bool]] = {}   # user_id -> (version, data, merged)
+        if rows or deleted:
+            try:
+                with self._db_lock:
+                    db = self._db()
+                    db.execute("BEGIN IMMEDIATE")   # take the write lock now: a conflict is resolved in here
+                    try:
+                        for uid, data, base in rows:
+                            written[uid] = self._write(db, uid, data, base, now)
+                        if deleted:
+                            db.executemany("DELETE FROM user_state WHERE user_id = ?", [(u,) for u in deleted])
+                        db.execute("COMMIT")
+                    except Exception:
+                        db.execute("ROLLBACK")
+                        raise
+            except Exception:
+                with self._lock:   # keep the changes for the next attempt
+                    self._dirty |= dirty - self._deleted
+                    self._deleted |= deleted - self._dirty
+                raise
+        with self._lock:
+            for uid, (version, data, merged) in written.items():
+                if uid in self._deleted:
+                    continue
+                if not merged:
+                    self._base[uid] = (version, data)
+                elif uid not in self._dirty and uid not in self._pinned:
+                    # the row now holds more than our record: read it again next time
+                    self._cache.pop(uid)
+                    self._spill.pop(uid, None)
+                    self._base.pop(uid, None)
+                # else: changed again since; the old base makes the next write merge again
+            for uid in dirty:
+                if uid not in self._dirty and uid not in self._pinned:
+                    self._spill.pop(uid, None)
+
+    def _write(self, db: sqlite3.Connection, user_id: str, data: bytes,
+               base: Optional[Tuple[int, bytes]], now: float) -> Tuple[int, bytes, bool]:
+        """Compare-and-swap one row against the version it was read at; merge on conflict."""
+        if base is not None:
+            cur = db.execute(
+                "UPDATE user_state SET data = ?, updated = ?, version = version + 1"
+                " WHERE user_id = ? AND version = ?", (data, now, user_id, base[0]))
+        else:
+            cur = db.execute(
+                "INSERT OR IGNORE INTO user_state (user_id, data, updated, version) VALUES (?, ?, ?, 1)",
+                (user_id, data, now))
+        if cur.rowcount == 1:
+            return (base[0] + 1 if base is not None else 1), data, False
+        # another worker wrote (or deleted) the row since we read it
+        row = db.execute("SELECT version, data FROM user_state WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            db.execute("INSERT INTO user_state (user_id, data, updated, version) VALUES (?, ?, ?, 1)",
+                       (user_id, data, now))
+            return 1, data, False
+        self.conflicts += 1
+        merged = _merge(pickle.loads(base[1]) if base is not None else {}, pickle.loads(data),
+                        pickle.loads(row[1]))
+        db.execute("UPDATE user_state SET data = ?, updated = ?, version = ? WHERE user_id = ?",
+                   (pickle.dumps(merged, pickle.HIGHEST_PROTOCOL), now, row[0] + 1, user_id))
+        return row[0] + 1, data, True
+
+    def purge_idle(self) -> int:
+        """Delete rows (and cached records) untouched for longer than idle_ttl."""
+        if self.idle_ttl is None:
+            return 0
+        cutoff = time.time() - self.idle_ttl
+        with self._db_lock:
+            db = self._db()
+            ids = [r[0] for r in db.execute("SELECT user_id FROM user_state WHERE updated < ?", (cutoff,))]
+            db.execute("DELETE FROM user_state WHERE updated < ?", (cutoff,))
+        with self._lock:
+            for uid in ids:
+                if uid not in self._dirty and uid not in self._pinned:
+                    self._cache.pop(uid)
+                    self._base.pop(uid, None)
+        self.purged += len(ids)
+        return len(ids)
+
+    def _ensure_flusher(self):
+        if self._closed or (self._flusher is not None and self._flusher.is_alive()):
+            return
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._flush_loop, name="smartie-store-flush", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.monotonic() - self._last_purge >= self.purge_interval:
+                    self._last_purge = time.monotonic()
+                    self.purge_idle()
+            except Exception:
+                import traceback
+                traceback.print_exc()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "cached_users": len(self._cache),
+            "dirty": len(self._dirty),
+            "purged": self.purged,
+            "conflicts": self.conflicts,
+            **self._cache.stats(),
+        }
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        flusher = self._flusher
+        if flusher is not None and flusher is not threading.current_thread():
+            flusher.join()   # let a flush in progress finish before the final one
+        self.flush()
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+
+def _merge(base: Dict[str, Any], ours: Dict[str, Any], theirs: Dict[str, Any]) -> Dict[str, Any]:
+    """`theirs` with the namespaces `ours` changed since `base` applied on top."""
+    def dumps(value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    merged = dict(theirs)
+    for ns in base.keys() - ours.keys():
+        merged.pop(ns, None)
+    for ns, value in ours.items():
+        if ns not in base or dumps(value) != dumps(base[ns]):
+            merged[ns] = value
+    return merged
+
+
+# ---------- process-wide store ----------
+_STORE: Optional[StateStore] = None
+_STORE_LOCK = threading.Lock()
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    value = float(raw)
+    return value if value > 0 else None   # 0 disables the limit
+
+def user_ttl() -> Optional[float]:
+    """Seconds after which an idle user is forgotten (SMARTIE_USER_TTL_HOURS), or None."""
+    ttl_hours = _env_float("SMARTIE_USER_TTL_HOURS", 720)
+    return ttl_hours * 3600 if ttl_hours else None
+
+def store_from_url(url: str) -> StateStore:
+    """
+    Build a store from SMARTIE_STORE. Idle users are forgotten after
+    SMARTIE_USER_TTL_HOURS (default 720 = 30 days); the in-memory store also keeps at
+    most SMARTIE_MAX_USERS users (default 100000). Set either to 0 to disable.
+    """
+    url = (url or "memory").strip()
+    idle_ttl = user_ttl()
+    if url == "memory":
+        max_users = _env_float("SMARTIE_MAX_USERS", 100_000)
+        return MemoryStore(max_users=int(max_users) if max_users else None, idle_ttl=idle_ttl)
+    if url.startswith("sqlite://"):
+        # sqlite:///abs/path.db or sqlite://relative.db
+        return SQLiteStore(url[len("sqlite://"):], idle_ttl=idle_ttl)
+    if url.endswith(".db") or url.endswith(".sqlite"):
+        return SQLiteStore(url, idle_ttl=idle_ttl)
+    raise ValueError(f"Unknown SMARTIE_STORE: {url!r}")
+
+def get_store() -> StateStore:
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = store_from_url(os.getenv("SMARTIE_STORE", "memory"))
+    return _STORE
+
+def set_store(store: StateStore) -> None:
+    """Swap the process-wide store (e.g. at startup or in a benchmark)."""
+    global _STORE
+    with _STORE_LOCK:
+        old, _STORE = _STORE, store
+    if old is not None and old is not store:
+        old.close()
+
+# Striped per-user locks: turns for one user run one at a time,
+# turns for different users only contend when they hash to the same stripe.
+LOCK_STRIPES = int(os.getenv("SMARTIE_LOCK_STRIPES", "1024"))
+_USER_LOCKS = [threading.RLock() for _ in range(LOCK_STRIPES)]
+
+def user_lock(user_id: str) -> threading.RLock:
+    return _USER_LOCKS[hash(user_id) % LOCK_STRIPES]
+
+@contextmanager
+def user_turn(user_id: str):
+    """
+    Scope one turn for a user: hold the user's lock, load their record once up front
+    and persist it once at the end (this also covers objects mutated in place).
+    """
+    store = get_store()
+    with user_lock(user_id):
+        store.begin_turn(user_id)
+        try:
+            yield
+        finally:
+            store.end_turn(user_id)
+
+
+_MISSING = object()
+
+class UserMap(MutableMapping):
+    """
+    dict-like view of one namespace across all users: `STATE[user_id]` reads
+    `record(user_id)["state"]`. With `default_factory` it behaves like a defaultdict.
+    Iterating reads every stored user (without counting as a visit), so keep it to
+    reports/schedulers.
+    """
+
+    def __init__(self, namespace: str, default_factory: Optional[Callable[[], Any]] = None):
+        self.namespace = namespace
+        self.default_factory = default_factory
+
+    def __getitem__(self, user_id):
+        rec = get_store().peek(user_id)
+        if rec is not None and self.namespace in rec:
+            return rec[self.namespace]
+        if self.default_factory is None:
+            raise KeyError(user_id)
+        value = self.default_factory()
+        self[user_id] = value
+        return value
+
+    def get(self, user_id, default=None):
+        rec = get_store().peek(user_id)
+        if rec is None:
+            return default
+        return rec.get(self.namespace, default)
+
+    def __contains__(self, user_id):
+        rec = get_store().peek(user_id)
+        return rec is not None and self.namespace in rec
+
+    def __setitem__(self, user_id, value):
+        store = get_store()
+        store.load(user_id)[self.namespace] = value
+        store.mark_dirty(user_id)
+
+    def __delitem__(self, user_id):
+        store = get_store()
+        rec = store.peek(user_id)
+        if rec is None or self.namespace not in rec:
+            raise KeyError(user_id)
+        del rec[self.namespace]
+        store.mark_dirty(user_id)
+
+    def pop(self, user_id, default=_MISSING):
+        store = get_store()
+        rec = store.peek(user_id)
+        if rec is None or self.namespace not in rec:
+            if default is _MISSING:
+                raise KeyError(user_id)
+            return default
+        value = rec.pop(self.namespace)
+        store.mark_dirty(user_id)
+        return value
+
+    def __iter__(self):
+        for uid, rec in get_store().scan():
+            if self.namespace in rec:
+                yield uid
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"UserMap({self.namespace!r})"
@@ -1,50 +1,223 @@
 # tracker.py
+from array import array
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 import datetime as dt
+import traceback
 
-# In-memory store (swap to Redis/DB later)
-GOALS: Dict[str, "Goal"] = {}
-LOGS: Dict[str, List["LogEntry"]] = {}
+import pillars
+from storage import UserMap
+
+# Per-user views over the configured store (memory or SQLite, see storage.py)
+GOALS = UserMap("goal")    # { user_id: Goal }
+LOGS = UserMap("logs")     # { user_id: CheckIns }
 
 @dataclass
 class Goal:
     user_id: str
     text: str
-    pillar_key: str
-    cadence: str          # "daily" | "3x/week" | "weekly"
+    pillar: int           # pillars.ID
+    cadence: str          # "daily" | "most days" | "3x/week" | "weekly"
     started: dt.date
 
+    @property
+    def pillar_key(self) -> str:
+        return pillars.KEYS[self.pillar]
+
+    def __setstate__(self, state):
+        # goals saved before pillar IDs hold the key
+        if "pillar_key" in state:
+            state = dict(state)
+            state["pillar"] = pillars.pillar_id(state.pop("pillar_key"))
+        self.__dict__.update(state)
+
 @dataclass
 class LogEntry:
     user_id: str
     date: dt.date
     note: Optional[str] = None
 
-def set_goal(user_id: str, text: str, pillar_key: str, cadence: str, start: Optional[dt.date] = None):
+WINDOW_BITS = 64   # days covered by the rolling bitmap (progress windows up to this are O(1))
+_WINDOW_MASK = (1 << WINDOW_BITS) - 1
+
+class CheckIns:
+    """
+    One user's check-in days: a sorted, de-duplicated array of date ordinals (4 bytes a
+    day), plus notes for the few days that have one. Window counts are two bisects and
+    the most recent N days are a slice, however long the history.
+
+    Kept up to date on every add, so summaries don't touch the array at all:
+    `run` is the length of the consecutive run ending at the latest check-in, and
+    `recent` is a bitmap of the WINDOW_BITS days ending there (bit k = latest - k).
+    Both are anchored at the latest check-in rather than "today", so they stay valid
+    across midnight; queries shift them to the day asked about.
+    """
+    __slots__ = ("days", "notes", "run", "recent")
+
+    def __init__(self):
+        self.days = array("i")
+        self.notes: Dict[int, str] = {}
+        self.run = 0
+        self.recent = 0
+
+    def add(self, day: dt.date, note: Optional[str] = None) -> bool:
+        """Record a check-in; returns False if that day was already logged."""
+        o = day.toordinal()
+        days = self.days
+        if note:
+            self.notes[o] = note
+        if days and days[-1] == o:            # same-day repeat: the common duplicate
+            return False
+        if not days or o > days[-1]:          # the usual case: today, after earlier days
+            gap = o - days[-1] if days else WINDOW_BITS
+            self.run = self.run + 1 if gap == 1 else 1
+            self.recent = ((self.recent << gap) | 1) & _WINDOW_MASK if gap < WINDOW_BITS else 1
+            days.append(o)
+            return True
+        i = bisect_left(days, o)
+        if days[i] == o:
+            return False
+        days.insert(i, o)                     # back-dated check-in
+        back = days[-1] - o
+        if back < WINDOW_BITS:
+            self.recent |= 1 << back
+        if back == self.run:                  # it joins the latest run (maybe to an older one)
+            self.run = self._run_ending_at(len(days) - 1)
+        return True
+
+    def _run_ending_at(self, i: int) -> int:
+        days, n = self.days, 0
+        while i - n >= 0 and days[i - n] == days[i] - n:
+            n += 1
+        return n
+
+    @property
+    def last(self) -> Optional[dt.date]:
+        return dt.date.fromordinal(self.days[-1]) if self.days else None
+
+    def streak(self, today: dt.date) -> int:
+        """Consecutive days with a check-in, counting back from `today`."""
+        o = today.toordinal()
+        if not self.days or self.days[-1] < o:
+            return 0
+        if self.days[-1] == o:
+            return self.run
+        i = bisect_right(self.days, o) - 1    # check-ins logged ahead of `today`
+        return self._run_ending_at(i) if i >= 0 and self.days[i] == o else 0
+
+    def count_recent(self, today: dt.date, n: int) -> int:
+        """Check-in days among the `n` days ending `today`."""
+        if not self.days:
+            return 0
+        shift = today.toordinal() - self.days[-1]
+        if n > WINDOW_BITS or shift < 0:      # outside the bitmap: fall back to bisect
+            return self.count_between(today - dt.timedelta(days=n - 1), today)
+        if shift >= n:
+            return 0
+        return (self.recent & ((1 << (n - shift)) - 1)).bit_count()
+
+    def count_between(self, start: dt.date, end: dt.date) -> int:
+        """Check-in days in [start, end]."""
+        return bisect_right(self.days, end.toordinal()) - bisect_left(self.days, start.toordinal())
+
+    def between(self, start: dt.date, end: dt.date) -> array:
+        return self.days[bisect_left(self.days, start.toordinal()):bisect_right(self.days, end.toordinal())]
+
+    def latest(self, n: int) -> array:
+        """The `n` most recent check-in days, newest first."""
+        return self.days[:-n - 1:-1] if n > 0 else array("i")
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def __setstate__(self, state):
+        # records pickled before run/recent existed: rebuild them from the days
+        _, slots = state
+        self.days, self.notes = slots["days"], slots.get("notes", {})
+        if "run" in slots:
+            self.run, self.recent = slots["run"], slots["recent"]
+            return
+        self.run = self._run_ending_at(len(self.days) - 1) if self.days else 0
+        self.recent = 0
+        for o in self.days[-WINDOW_BITS:]:
+            back = self.days[-1] - o
+            if back < WINDOW_BITS:
+                self.recent |= 1 << back
+
+# Called with the user_id after a goal is set or a new check-in day is logged
+# (the reminder scheduler reschedules from these).
+_LISTENERS: List[Callable[[str], None]] = []
+
+def on_change(fn: Callable[[str], None]) -> Callable[[str], None]:
+    _LISTENERS.append(fn)
+    return fn
+
+def _notify(user_id: str) -> None:
+    for fn in _LISTENERS:
+        try:
+            fn(user_id)
+        except Exception:   # a listener must never fail the check-in itself
+            traceback.print_exc()
+
+def today(now: Optional[dt.datetime] = None) -> dt.date:
+    """The check-in day for `now` (default: the current time). All reads and writes bucket by UTC date."""
+    now = now or dt.datetime.now(dt.timezone.utc)
+    return (now.astimezone(dt.timezone.utc) if now.tzinfo else now).date()
+
+def _checkins(user_id: str) -> CheckIns:
+    logs = LOGS.get(user_id)
+    if isinstance(logs, list):   # records saved before CheckIns: [LogEntry, ...]
+        migrated = CheckIns()
+        for e in logs:
+            migrated.add(e.date, e.note)
+        LOGS[user_id] = logs = migrated
+    return logs if logs is not None else CheckIns()
+
+def _entry(user_id: str, logs: CheckIns, o: int) -> LogEntry:
+    return LogEntry(user_id=user_id, date=dt.date.fromordinal(o), note=logs.notes.get(o))
+
+def set_goal(user_id: str, text: str, pillar_key, cadence: str, start: Optional[dt.date] = None):
+    """`pillar_key` is a pillar key or ID (KeyError if it is neither)."""
     GOALS[user_id] = Goal(
         user_id=user_id,
         text=text,
-        pillar_key=pillar_key,
+        pillar=pillars.pillar_id(pillar_key),
         cadence=cadence,
-        started=start or dt.date.today()
+        started=start or today()
     )
+    _notify(user_id)
 
 def get_goal(user_id: str) -> Optional[Goal]:
     return GOALS.get(user_id)
 
-def log_done(user_id: str, note: Optional[str] = None, date: Optional[dt.date] = None) -> LogEntry:
-    entry = LogEntry(user_id=user_id, date=date or dt.date.today(), note=note)
-    LOGS.setdefault(user_id, []).append(entry)
+def log_done(user_id: str, note: Optional[str] = None, date: Optional[dt.date] = None,
+             now: Optional[dt.datetime] = None) -> LogEntry:
+    """Record a check-in for `date` (default: the day of `now`). A repeat on the same day is not written again."""
+    entry = LogEntry(user_id=user_id, date=date or today(now), note=note)
+    logs = _checkins(user_id)
+    added = logs.add(entry.date, note)
+    if added or note:
+        LOGS[user_id] = logs   # re-assign so the store persists the change
+    if added:
+        _notify(user_id)
     return entry
 
-def get_logs(user_id: str, days: int = 14) -> List[LogEntry]:
-    cutoff = dt.date.today() - dt.timedelta(days=days-1)
-    return [e for e in LOGS.get(user_id, []) if e.date >= cutoff]
+def get_logs(user_id: str, days: int = 14, now: Optional[dt.datetime] = None) -> List[LogEntry]:
+    end = today(now)
+    logs = _checkins(user_id)
+    return [_entry(user_id, logs, o) for o in logs.between(end - dt.timedelta(days=days-1), end)]
+
+def recent_count(user_id: str, days: int = 14, now: Optional[dt.datetime] = None) -> int:
+    """Check-in days among the last `days` days, today included."""
+    return _checkins(user_id).count_recent(today(now), days)
 
 def _expected_count(goal: Goal, days: int) -> int:
     if goal.cadence == "daily":
         return days
+    if goal.cadence == "most days":
+        # approx: 5 per 7 days (goals set from chat; the eity20 80% aim)
+        return round(days * 5 / 7)
     if goal.cadence == "3x/week":
         # approx: 3 per 7 days
         return round(days * 3 / 7)
@@ -52,27 +225,27 @@ def _expected_count(goal: Goal, days: int) -> int:
         return max(1, round(days / 7))
     return 0
 
-def summary(user_id: str, days: int = 14) -> str:
+def summary(user_id: str, days: int = 14, now: Optional[dt.datetime] = None) -> str:
     g = get_goal(user_id)
-    logs = get_logs(user_id, days)
-    done = len(logs)
+    day = today(now)
+    logs = _checkins(user_id)
+    done = logs.count_recent(day, days)
     if not g:
         return "No active goal yet. Type **baseline** to set one, or say **set goal** to define it."
     expected = _expected_count(g, days)
-    adherence = 0 if expected == 0 else round(100 * done / expected)
     # streak (consecutive days with a log, counting today backwards)
-    streak = 0
-    day = dt.date.today()
-    have = {e.date for e in LOGS.get(user_id, [])}
-    while day in have:
-        streak += 1
-        day -= dt.timedelta(days=1)
+    streak = logs.streak(day)
+    if expected:
+        window = f"Last {days} days: {done}/{expected} check-ins → ~{round(100 * done / expected)}% adherence"
+    else:   # a cadence we can't turn into a count
+        window = f"Last {days} days: {done} check-in(s)"
     return (
         f"Goal: “{g.text}” (cadence: {g.cadence})\n"
-        f"Last {days} days: {done}/{expected} check-ins → ~{adherence}% adherence\n"
+        f"{window}\n"
         f"Current streak: {streak} day(s)\n"
         f"Pillar: {g.pillar_key}"
     )
 
 def last_n_logs(user_id: str, n: int = 5) -> List[LogEntry]:
-    return sorted(LOGS.get(user_id, []), key=lambda e: e.date, reverse=True)[:n]
+    logs = _checkins(user_id)
+    return [_entry(user_id, logs, o) for o in logs.latest(n)]
@@ -0,0 +1,126 @@
+# workers.py
+"""
+Sharded background worker pool.
+
+Jobs are routed to a shard by key (the user id). Each shard is one thread with its own
+bounded FIFO queue, so one user's messages are handled in arrival order while different
+users run in parallel. `submit` never blocks: when the shard is full it returns False
+and the caller sheds the request.
+"""
+import os
+import queue
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+
+_STOP = object()
+
+
+class ShardedPool:
+    def __init__(self, name: str, handler: Callable[..., Any], shards: int = 8, queue_size: int = 256):
+        self.name = name
+        self.handler = handler
+        self.shards = max(1, shards)
+        self.queue_size = queue_size
+        self._queues: List[queue.Queue] = []
+        self._threads: List[threading.Thread] = []
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self._started_at = 0.0
+
+    # Threads are started on first use, and again in a forked child (gunicorn --preload).
+    def _ensure_started(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queues = [queue.Queue(maxsize=self.queue_size) for _ in range(self.shards)]
+            self._threads = []
+            for i, q in enumerate(self._queues):
+                t = threading.Thread(target=self._run, args=(q,), name=f"{self.name}-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            self._busy, self._busy_seconds = 0, 0.0
+            self._started_at = time.monotonic()
+            self._pid = os.getpid()
+
+    def submit(self, key: str, *args) -> bool:
+        """Queue `handler(*args)` on the shard for `key`. Returns False if that shard is full."""
+        self._ensure_started()
+        q = self._queues[hash(key) % self.shards]
+        try:
+            q.put_nowait((time.monotonic(), args))
+        except queue.Full:
+            metrics.incr(f"{self.name}.rejected")
+            return False
+        metrics.incr(f"{self.name}.enqueued")
+        return True
+
+    def _run(self, q: queue.Queue) -> None:
+        while True:
+            item = q.get()
+            if item is _STOP:
+                q.task_done()
+                return
+            enqueued_at, args = item
+            t0 = time.monotonic()
+            metrics.observe(f"{self.name}.queue_wait", t0 - enqueued_at)
+            with self._lock:
+                self._busy += 1
+            try:
+                self.handler(*args)
+            except Exception:
+                metrics.incr(f"{self.name}.failed")
+                traceback.print_exc()
+            finally:
+                spent = time.monotonic() - t0
+                with self._lock:
+                    self._busy -= 1
+                    self._busy_seconds += spent
+                metrics.observe(f"{self.name}.run", spent)
+                q.task_done()
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def utilisation(self) -> float:
+        """Fraction of worker time spent running jobs since the pool started."""
+        if not self._started_at:
+            return 0.0
+        elapsed = (time.monotonic() - self._started_at) * self.shards
+        return round(self._busy_seconds / elapsed, 4) if elapsed > 0 else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.shards,
+            "queue_size": self.queue_size,
+            "depth": self.depth(),
+            "max_shard_depth": max((q.qsize() for q in self._queues), default=0),
+            "busy": self._busy,
+            "utilisation": self.utilisation(),
+        }
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued job has finished. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for q in self._queues:
+            while q.unfinished_tasks:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.005)
+        return True
+
+    def close(self, timeout: float = 5.0) -> None:
+        if self._pid != os.getpid():
+            return
+        for q in self._queues:
+            q.put(_STOP)
+        for t in self._threads:
+            t.join(timeout)
+        self._pid = None